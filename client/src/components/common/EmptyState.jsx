@@ -158,7 +158,7 @@ export const EmptyUploads = (props) => (
   <EmptyState
     icon={CloudUploadIcon}
     title="Ready to upload"
-    description="Drag and drop your receipt images or PDFs here to get started with automatic extraction."
+    description="Drag and drop your receipt images here to get started with automatic extraction."
     actionLabel="Choose Files"
     {...props}
   />
@@ -43,11 +43,11 @@ const UploadDropZone = ({ onFilesSelected, isProcessing = false, processingProgr
   const validateAndProcessFiles = (files) => {
     const validFiles = [];
     const maxSize = 10 * 1024 * 1024; // 10MB
-    const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg', 'application/pdf'];
+    const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg'];
 
     for (let file of files) {
       if (!allowedTypes.includes(file.type)) {
-        setError(`${file.name} is not a supported file type. Please upload JPG, PNG, or PDF files.`);
+        setError(`${file.name} is not a supported file type. Please upload JPG or PNG files.`);
         return;
       }
       if (file.size > maxSize) {
@@ -114,7 +114,7 @@ const UploadDropZone = ({ onFilesSelected, isProcessing = false, processingProgr
         </Typography>
         
         <Typography variant="body2" color="text.secondary" sx={{ mb: 3 }}>
-          Drag and drop your receipt images or PDFs here, or click to browse
+          Drag and drop your receipt images here, or click to browse
         </Typography>
         
         <Box sx={{ display: 'flex', gap: 2, justifyContent: 'center', flexWrap: 'wrap' }}>
@@ -130,7 +130,7 @@ const UploadDropZone = ({ onFilesSelected, isProcessing = false, processingProgr
               type="file"
               hidden
               multiple
-              accept="image/*,application/pdf"
+              accept="image/jpeg,image/png"
               onChange={handleFileInput}
             />
           </Button>
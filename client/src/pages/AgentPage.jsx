@@ -49,7 +49,7 @@ import {
 import { useNavigate, useLocation } from 'react-router-dom';
 import { BottomNavigation } from '../components';
 import { useAuth } from '../contexts/AuthContext';
-import { chatWithAgent, getAgentStatus } from '../services/api';
+import { chatWithAgentStream, getAgentStatus } from '../services/api';
 
 // Add custom animations for enhanced UX
 const animationStyles = `
@@ -248,60 +248,70 @@ const AgentPage = () => {
     setIsLoading(true);
     setIsThinking(true);
 
-    // Simulate intelligent thinking process
-    const thinkingSteps = [
-      'Analyzing your financial data...',
-      'Processing spending patterns...',
-      'Generating personalized insights...',
-      'Crafting intelligent recommendations...',
-      'Finalizing response...'
-    ];
-
-    let stepIndex = 0;
-    const thinkingInterval = setInterval(() => {
-      if (stepIndex < thinkingSteps.length) {
-        setThinkingMessage(thinkingSteps[stepIndex]);
-        stepIndex++;
-      }
-    }, 800);
+    const botMessageId = Date.now() + 1;
+    let streamedText = '';
+    let streamError = null;
 
     try {
-      // Call the real agent API
-      console.log('🎯 Sending message to agent:', messageText);
+      // Stream the agent response so the first tokens show up as soon as Gemini produces them
+      console.log('🎯 Streaming message to agent:', messageText);
       console.log('🔑 Using UID:', currentUser?.uid);
-      const response = await chatWithAgent(messageText, currentUser?.uid);
-      
-      clearInterval(thinkingInterval);
-      console.log('📥 Agent response:', response);
-      
-      if (response.success) {
-        const botResponse = {
-          id: Date.now() + 1,
-          type: 'bot',
-          content: response.response,
-          timestamp: response.timestamp,
-          actions: generateActionButtons(messageText),
-          messageType: 'analysis',
-        };
-        
-        // Add slight delay for better UX
-        setTimeout(() => {
-          setMessages(prev => [...prev, botResponse]);
+      setThinkingMessage('Understanding your question...');
+
+      await chatWithAgentStream(messageText, currentUser?.uid, (eventName, data) => {
+        if (eventName === 'progress') {
+          setThinkingMessage(data.message);
+        } else if (eventName === 'token') {
+          const isFirstToken = streamedText === '';
+          streamedText += data.text;
+          const content = streamedText;
+
+          if (isFirstToken) {
+            setIsThinking(false);
+            setMessages(prev => [...prev, {
+              id: botMessageId,
+              type: 'bot',
+              content,
+              timestamp: new Date().toISOString(),
+              actions: [],
+              messageType: 'analysis',
+            }]);
+          } else {
+            setMessages(prev => prev.map(msg => 
+              msg.id === botMessageId ? { ...msg, content } : msg
+            ));
+          }
+        } else if (eventName === 'upgrade') {
+          // The model answered after a quick fallback answer was shown; replace it
+          streamedText = data.text;
+          setMessages(prev => prev.map(msg =>
+            msg.id === botMessageId ? { ...msg, content: data.text } : msg
+          ));
+        } else if (eventName === 'done') {
+          console.log('📥 Agent stream metadata:', data);
+          setMessages(prev => prev.map(msg => 
+            msg.id === botMessageId 
+              ? { ...msg, timestamp: data.timestamp, actions: generateActionButtons(messageText) } 
+              : msg
+          ));
           setConnectionError(false);
-        }, 300);
-      } else {
+        } else if (eventName === 'error') {
+          streamError = data;
+        }
+      });
+
+      if (streamError) {
         // Handle API error with intelligent fallback
         const errorResponse = {
-          id: Date.now() + 1,
+          id: botMessageId,
           type: 'bot',
-          content: response.response || '❌ I encountered an error processing your request. Please try again.',
+          content: streamError.message || '❌ I encountered an error processing your request. Please try again.',
           timestamp: new Date().toISOString(),
           messageType: 'error',
         };
-        setMessages(prev => [...prev, errorResponse]);
+        setMessages(prev => [...prev.filter(msg => msg.id !== botMessageId), errorResponse]);
       }
     } catch (error) {
-      clearInterval(thinkingInterval);
       console.error('Agent chat error:', error);
       setConnectionError(true);
       
@@ -685,7 +695,7 @@ const AgentPage = () => {
           ))}
 
           {/* Enhanced Loading & Thinking Indicator */}
-          {(isLoading || isThinking) && (
+          {isThinking && (
             <ListItem sx={{ px: 0, py: 1 }}>
               <Box sx={{ 
                 display: 'flex', 
@@ -55,6 +55,17 @@ const DashboardPage = () => {
   });
 
   const [recentActivity, setRecentActivity] = useState([]);
+  // Precomputed daily brief (narrative + recommendations)
+  const [brief, setBrief] = useState(null);
+
+  const fetchDailyBrief = async (uid) => {
+    try {
+      const data = await apiService.getDailyBrief(uid);
+      if (data.success) setBrief(data.brief);
+    } catch (err) {
+      console.error('Failed to load daily brief:', err);
+    }
+  };
   // Array of weeks, each week is [Sun, Mon, ..., Sat]
   const [monthlyWeeklySpend, setMonthlyWeeklySpend] = useState([]);
 
@@ -230,6 +241,7 @@ const DashboardPage = () => {
         if (user && !profileChecked) {
           fetchProfile(true);
           fetchRecentActivity();
+          fetchDailyBrief(user.uid);
           setProfileChecked(true);
         }
       });
@@ -282,6 +294,24 @@ const DashboardPage = () => {
               Here's your spending overview
             </Typography>
           </Box>
+          {/* Daily Brief */}
+          {brief && (
+            <Card elevation={2} sx={{ borderRadius: '16px', mb: 3 }}>
+              <CardContent sx={{ p: 3 }}>
+                <Typography variant="body2" color="text.secondary" sx={{ mb: 1 }}>
+                  Today's brief
+                </Typography>
+                <Typography variant="body1" sx={{ mb: brief.recommendations?.length ? 2 : 0 }}>
+                  {brief.narrative}
+                </Typography>
+                {brief.recommendations?.slice(0, 3).map((recommendation, idx) => (
+                  <Typography key={idx} variant="body2" color="text.secondary" sx={{ mb: 0.5 }}>
+                    {recommendation}
+                  </Typography>
+                ))}
+              </CardContent>
+            </Card>
+          )}
           {/* Stats Cards */}
           <Stack spacing={3} sx={{ mb: 4 }}>
             <Card elevation={2} sx={{ borderRadius: '16px' }}>
@@ -26,7 +26,7 @@ import {
 } from '@mui/icons-material';
 import { useLocation, useNavigate } from 'react-router-dom';
 import BottomNavigation from '../components/BottomNavigation';
-import { getProcessingStatus } from '../services/api';
+import { subscribeProcessingStatus } from '../services/api';
 
 const ProcessingStatusPage = () => {
   const location = useLocation();
@@ -131,36 +131,30 @@ const ProcessingStatusPage = () => {
     // Start the processing simulation
     processSteps();
 
-    // Poll for real processing status if we have files
-    let statusInterval;
-    if (files.length > 0) {
-      statusInterval = setInterval(async () => {
-        try {
-          for (const file of files) {
-            if (file.id) {
-              const status = await getProcessingStatus(file.id);
-              console.log(`Processing status for ${file.name}:`, status);
-              
-              // Update file status based on backend response
-              if (status.status === 'completed') {
-                setFileStatuses(prev => 
-                  prev.map((_, index) => 
-                    files[index].id === file.id ? 'completed' : prev[index]
-                  )
-                );
-              }
-            }
-          }
-        } catch (error) {
-          console.warn('Failed to check processing status:', error);
+    // Receive real processing status pushed by the server for all uploads
+    let unsubscribe;
+    if (files.some(file => file.id)) {
+      unsubscribe = subscribeProcessingStatus((status) => {
+        console.log(`Processing status for ${status.fileName || status.receiptId}:`, status);
+        
+        // Update file status based on backend response
+        // (a duplicate upload is linked to the receipt that already exists)
+        if (['saved', 'duplicate', 'failed'].includes(status.status)) {
+          setFileStatuses(prev => 
+            prev.map((fileStatus, index) => 
+              files[index].id === status.receiptId
+                ? (status.status === 'failed' ? 'failed' : 'completed')
+                : fileStatus
+            )
+          );
         }
-      }, 5000); // Check every 5 seconds
+      });
     }
 
-    // Cleanup interval on component unmount
+    // Close the status stream on component unmount
     return () => {
-      if (statusInterval) {
-        clearInterval(statusInterval);
+      if (unsubscribe) {
+        unsubscribe();
       }
     };
   }, [navigate, files]);
@@ -233,9 +227,11 @@ const ProcessingStatusPage = () => {
               >
                 <Typography variant="body2">{file.name || `Receipt ${index + 1}`}</Typography>
                 <Chip
-                  label={fileStatuses[index] === 'completed' ? 'Completed' : 'Processing'}
+                  label={fileStatuses[index] === 'completed' ? 'Completed' :
+                         fileStatuses[index] === 'failed' ? 'Failed' : 'Processing'}
                   size="small"
-                  color={fileStatuses[index] === 'completed' ? 'success' : 'primary'}
+                  color={fileStatuses[index] === 'completed' ? 'success' :
+                         fileStatuses[index] === 'failed' ? 'error' : 'primary'}
                   variant="outlined"
                 />
               </Box>
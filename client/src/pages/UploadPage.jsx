@@ -51,7 +51,7 @@ const UploadPage = () => {
     }],
   });
 
-  const supportedFormats = ['PDF', 'JPG', 'PNG', 'HEIC'];
+  const supportedFormats = ['JPG', 'PNG', 'HEIC'];
 
   const handleFilesAdded = useCallback(async (newFiles) => {
     const processedFiles = newFiles.map((file, index) => ({
@@ -183,6 +183,42 @@ class ApiService {
     }
   }
 
+  /**
+   * Follow processing of all of the user's receipts over Server-Sent Events.
+   * Calls onStatus(status) for each in-flight or just-finished receipt on connect
+   * and on every stage transition. Returns a function that closes the connection.
+   */
+  subscribeProcessingStatus(onStatus, userId = null) {
+    const uid = userId || this.getUserId();
+    const source = new EventSource(
+      `${this.baseURL}/api/process-status/stream?user_id=${encodeURIComponent(uid)}`
+    );
+
+    source.addEventListener('snapshot', (event) => {
+      JSON.parse(event.data).jobs.forEach(onStatus);
+    });
+    source.addEventListener('status', (event) => {
+      onStatus(JSON.parse(event.data));
+    });
+    source.onerror = () => {
+      // EventSource reconnects on its own; the snapshot resyncs receipts that were
+      // in flight, including any that finished while disconnected
+      console.warn('Processing status stream interrupted, reconnecting...');
+    };
+
+    return () => source.close();
+  }
+
+  // === Daily Brief Methods ===
+
+  /**
+   * Get today's precomputed brief (metrics, recommendations and a short narrative)
+   */
+  async getDailyBrief(userId = null) {
+    const uid = userId || this.getUserId();
+    return this.request(`/api/brief?user_id=${uid}`);
+  }
+
   // === Insight API Methods ===
 
   /**
@@ -289,6 +325,57 @@ class ApiService {
     });
   }
 
+  /**
+   * Stream a chat response from the agent over Server-Sent Events.
+   * Calls onEvent(eventName, data) for each progress, token, done or error event.
+   */
+  async chatWithAgentStream(message, userId = null, onEvent = () => {}) {
+    const uid = userId || this.getUserId();
+    const token = this.getAuthToken();
+
+    const response = await fetch(`${this.baseURL}/api/agent/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+        ...(token && { 'Authorization': `Bearer ${token}` }),
+      },
+      body: JSON.stringify({
+        message: message,
+        uid: uid
+      })
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP error! status: ${response.status} - ${response.statusText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+
+      buffer += decoder.decode(value, { stream: true });
+      const frames = buffer.split('\n\n');
+      buffer = frames.pop();
+
+      for (const frame of frames) {
+        let eventName = 'message';
+        let data = '';
+        for (const line of frame.split('\n')) {
+          if (line.startsWith('event: ')) eventName = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        if (data) {
+          onEvent(eventName, JSON.parse(data));
+        }
+      }
+    }
+  }
+
   /**
    * Get agent status
    */
@@ -342,6 +429,7 @@ export default apiService;
 export const checkHealth = (...args) => apiService.checkHealth(...args);
 export const processReceipt = (...args) => apiService.processReceipt(...args);
 export const getProcessingStatus = (...args) => apiService.getProcessingStatus(...args);
+export const subscribeProcessingStatus = (...args) => apiService.subscribeProcessingStatus(...args);
 export const getFinancialHealthScore = (...args) => apiService.getFinancialHealthScore(...args);
 export const getRecurringPatterns = (...args) => apiService.getRecurringPatterns(...args);
 export const getNeedWantAnalysis = (...args) => apiService.getNeedWantAnalysis(...args);
@@ -349,11 +437,13 @@ export const getSpendingOverlaps = (...args) => apiService.getSpendingOverlaps(.
 export const getPantryAnalysis = (...args) => apiService.getPantryAnalysis(...args);
 export const getMicroMomentAnalysis = (...args) => apiService.getMicroMomentAnalysis(...args);
 export const getAllInsights = (...args) => apiService.getAllInsights(...args);
+export const getDailyBrief = (...args) => apiService.getDailyBrief(...args);
 export const getInsight = (...args) => apiService.getInsight(...args);
 export const isServerConnected = (...args) => apiService.isServerConnected(...args);
 
 // Agent API exports
 export const chatWithAgent = (...args) => apiService.chatWithAgent(...args);
+export const chatWithAgentStream = (...args) => apiService.chatWithAgentStream(...args);
 export const getAgentStatus = (...args) => apiService.getAgentStatus(...args);
 
 // Wallet API exports
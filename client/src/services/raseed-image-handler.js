@@ -44,8 +44,8 @@ const validateFile = (file) => {
     throw new Error('No file provided');
   }
   
-  if (!file.type.startsWith('image/') && !file.type.includes('pdf')) {
-    throw new Error('File must be an image or PDF');
+  if (!file.type.startsWith('image/')) {
+    throw new Error('File must be an image');
   }
   
   const maxSize = 10 * 1024 * 1024; // 10MB
@@ -0,0 +1,157 @@
+# server/agent_registry.py
+# Shared, lazily initialized, thread-safe registry of agents and API clients
+#
+# Constructing the chatbot agent (config validation, model setup, Firestore clients)
+# or a WalletTool (service account load + discovery build()) is expensive, so every
+# call site gets the same instance from here instead of building its own.
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class AgentRegistry:
+    """
+    Lazily created, process-wide instances keyed by name
+
+    Each instance is built on first use by its factory; concurrent first calls
+    wait for a single construction (per-name double-checked locking). Failed
+    constructions are not cached, so the next call retries.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.init_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """Register the factory used to build an instance on first use"""
+        with self._lock:
+            self._factories[name] = factory
+
+    def get(self, name: str, factory: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Get the shared instance, building it on first use
+
+        Args:
+            name: Instance name
+            factory: Factory to use if none was registered under this name
+
+        Returns:
+            The shared instance
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            name_lock = self._locks.setdefault(name, threading.Lock())
+            factory = self._factories.get(name, factory)
+        if factory is None:
+            raise KeyError(f"No factory registered for '{name}'")
+
+        with name_lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                started = time.perf_counter()
+                instance = factory()
+                self.init_seconds[name] = time.perf_counter() - started
+                self._instances[name] = instance
+                print(f"🏗️ Initialized shared {name} in {self.init_seconds[name] * 1000:.0f} ms")
+        return instance
+
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: Optional[str] = None) -> None:
+        """Drop one (or every) instance so it is rebuilt on next use"""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def warm_up(self, *names: str) -> None:
+        """Build instances ahead of the first request, logging failures"""
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"❌ Failed to initialize {name}: {str(e)}")
+
+
+def _create_chatbot_agent():
+    from agents.chatbot import RaseedChatbotAgent
+    return RaseedChatbotAgent()
+
+
+def _create_wallet_tool():
+    from wallet_tool import WalletTool
+    return WalletTool()
+
+
+def _create_daily_brief_service():
+    from daily_brief import DailyBriefService
+    return DailyBriefService()
+
+
+def _create_receipt_pipeline():
+    from agents.ReceiptOrchestrator.pipeline import ReceiptPipeline
+    return ReceiptPipeline()
+
+
+def _create_llm_provider():
+    from llm_provider import get_llm_provider
+    return get_llm_provider()
+
+
+# Global instance
+registry = AgentRegistry()
+registry.register("chatbot_agent", _create_chatbot_agent)
+registry.register("wallet_tool", _create_wallet_tool)
+registry.register("llm_provider", _create_llm_provider)
+registry.register("daily_brief", _create_daily_brief_service)
+registry.register("receipt_pipeline", _create_receipt_pipeline)
+
+
+def get_chatbot_agent():
+    """The shared RaseedChatbotAgent"""
+    return registry.get("chatbot_agent")
+
+
+def get_wallet_tool():
+    """The shared server WalletTool"""
+    return registry.get("wallet_tool")
+
+
+def get_daily_brief_service():
+    """The shared DailyBriefService"""
+    return registry.get("daily_brief")
+
+
+if __name__ == "__main__":
+    # Benchmark: per-call construction vs the shared instance
+    #   cd server && python agent_registry.py
+    import sys
+
+    def _bench(label: str, fn: Callable[[], Any], calls: int) -> float:
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        per_call = (time.perf_counter() - started) / calls
+        print(f"   {label:<28} {per_call * 1000:10.3f} ms/call")
+        return per_call
+
+    targets = sys.argv[1:] or ["chatbot_agent", "wallet_tool"]
+    for target in targets:
+        print(f"📊 {target}")
+        factory = registry._factories[target]
+        try:
+            per_call = _bench("construct per call", factory, 5)
+            registry.get(target)
+            shared = _bench("shared registry instance", lambda: registry.get(target), 100000)
+            print(f"   → {per_call / shared:,.0f}x less overhead per call")
+        except Exception as e:
+            print(f"   ⚠️ Could not construct {target}: {str(e)}")
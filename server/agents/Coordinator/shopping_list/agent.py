@@ -1,8 +1,9 @@
 from google.adk.agents import LlmAgent
+from llm_provider import adk_model
 
 root_agent = LlmAgent(
     name="ShoppingListAgent",
-    model="gemini-2.0-flash",
+    model=adk_model("gemini-2.0-flash"),
     description="Understands cooking needs and creates shopping lists.",
     instruction=(
         "User may ask: 'What do I need to cook dal?' or 'Create a list based on my past shopping."
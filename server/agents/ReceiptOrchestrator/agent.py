@@ -1,30 +1,63 @@
+import os
+
 from google.adk.agents import LlmAgent
-from google.adk.tools.agent_tool import AgentTool
+from llm_provider import adk_model
 
 from dotenv import load_dotenv
 from .subagents.receipt_feedback.agent import receipt_feedback_agent
 from .subagents.receipt_ingestion.agent import receipt_ingestion_agent
 from .subagents.google_wallet.agent import google_wallet_agent
+from .pipeline_agent import ReceiptPipelineAgent
 
 
 
 load_dotenv()
 
-root_agent = LlmAgent(
-    name="ReceiptOrchestrator",
-    model="gemini-2.0-flash",
-    description="Main agent responsible for orchestrating receipt processing: ingestion, feedback, and Google Wallet upload.",
-    instruction="""
-        "You are the central orchestrator for Project Raseed.\n"
-        "Your job is to manage the receipt processing workflow:\n\n"
-        "1. receipt_ingenstionUse receipt_ingestion_agent to handle initial receipt uploads and data extraction. Delegate to This agent Only when The image is given otherwise don't move to This agent\n  "
-        "2. Use receipt_feedback_agent to process user feedback and correct any errors in the extracted data.\n"
-        "3. Use google_wallet_agent as a tool to upload the finalized receipt data to Google Wallet.\n"
-        "Do not try to process the receipts yourself. Delegate to the appropriate agent."
-    """,
-    sub_agents=[
-        receipt_ingestion_agent,
-        receipt_feedback_agent,
-        google_wallet_agent
-    ],
-)
\ No newline at end of file
+# RASEED_RECEIPT_AGENT_MODE:
+#   pipeline (default)  uploaded images run ingestion -> validation -> persistence -> wallet in code;
+#                       the LLM router only handles feedback and wallet requests
+#   router              the model routes every message, including image uploads
+RECEIPT_AGENT_MODE = os.getenv("RASEED_RECEIPT_AGENT_MODE", "pipeline").lower()
+
+if RECEIPT_AGENT_MODE == "router":
+    root_agent = LlmAgent(
+        name="ReceiptOrchestrator",
+        model=adk_model("gemini-2.0-flash"),
+        description="Main agent responsible for orchestrating receipt processing: ingestion, feedback, and Google Wallet upload.",
+        instruction="""
+            "You are the central orchestrator for Project Raseed.\n"
+            "Your job is to manage the receipt processing workflow:\n\n"
+            "1. receipt_ingenstionUse receipt_ingestion_agent to handle initial receipt uploads and data extraction. Delegate to This agent Only when The image is given otherwise don't move to This agent\n  "
+            "2. Use receipt_feedback_agent to process user feedback and correct any errors in the extracted data.\n"
+            "3. Use google_wallet_agent as a tool to upload the finalized receipt data to Google Wallet.\n"
+            "Do not try to process the receipts yourself. Delegate to the appropriate agent."
+        """,
+        sub_agents=[
+            receipt_ingestion_agent,
+            receipt_feedback_agent,
+            google_wallet_agent
+        ],
+    )
+else:
+    receipt_router_agent = LlmAgent(
+        name="receipt_router",
+        model=adk_model("gemini-2.0-flash"),
+        description="Routes free-form messages about an already processed receipt.",
+        instruction="""
+            "You help the user with a receipt that has already been processed by Project Raseed.\n"
+            "1. Use receipt_feedback_agent when the user corrects or questions the extracted data.\n"
+            "2. Use google_wallet_agent when the user asks for a Google Wallet pass.\n"
+            "Receipt images are handled before you are called. Do not try to process the receipts yourself."
+        """,
+        sub_agents=[
+            receipt_feedback_agent,
+            google_wallet_agent
+        ],
+    )
+
+    root_agent = ReceiptPipelineAgent(
+        name="ReceiptOrchestrator",
+        description="Processes uploaded receipts in a fixed pipeline and routes feedback to the receipt agents.",
+        ingestion_agent=receipt_ingestion_agent,
+        router_agent=receipt_router_agent,
+    )
@@ -0,0 +1,389 @@
+"""
+Receipt Correction Engine
+=========================
+
+Deterministic handling of the common user corrections to an extracted receipt:
+quantity, unit price, item name, removed items and tax. Feedback is parsed with a
+small set of clause patterns into JSON patches (RFC 6902 replace/remove), the
+patches are applied, and when an amount changed, item totals, subtotal and total
+are recomputed exactly with Decimal arithmetic. Discounts, service charges and
+rounding on the original receipt (total - subtotal - tax) are carried over.
+
+Feedback that does not fully parse, names an item ambiguously, or changes amounts
+on a receipt with an unreadable item price returns None, and the caller falls
+back to receipt_feedback_agent.
+"""
+
+import copy
+import difflib
+import json
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional
+
+CENT = Decimal("0.01")
+
+# Minimum similarity for a phrase in the feedback to name an item on the receipt
+ITEM_MATCH_THRESHOLD = 0.6
+# The best item match must beat the runner-up by this much to be unambiguous
+ITEM_MATCH_MARGIN = 0.15
+# Score of a phrase whose words all appear in the item name (an exact name scores 1.0)
+ITEM_CONTAINED_SCORE = 0.8
+
+_NUMBER = r"\$?\s*(?P<{name}>\d+(?:[.,]\d+)?)"
+_ITEM = r"(?:the\s+)?(?P<item>.+?)"
+
+_WORD_NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "single": 1,
+}
+_ORDINALS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10, "last": -1,
+}
+
+# Words dropped from item phrases before matching ("2 bags of coffee beans" -> "coffee beans")
+_UNIT_WORDS = re.compile(
+    r"^(?:(?:\d+|" + "|".join(_WORD_NUMBERS) + r")\s+)?"
+    r"(?:(?:bags?|packs?|packets?|bottles?|cans?|boxes|box|pieces?|pcs|units?|items?|x)\s+of\s+|(?:x)\s+)?",
+    re.IGNORECASE,
+)
+
+# Clause boundaries: sentence ends (not decimal points), semicolons, ", and", "also"
+_CLAUSE_SPLIT = re.compile(r"\s*(?:(?:(?<!\d)\.|\.(?!\d)|[;\n])+|,?\s+and\s+also\s+|,?\s+also\s+|,\s*and\s+)\s*",
+                           re.IGNORECASE)
+
+
+def _pattern(template: str) -> re.Pattern:
+    return re.compile(
+        "^" + template.format(item=_ITEM, qty=_NUMBER.format(name="value"), price=_NUMBER.format(name="value"),
+                              old=_NUMBER.format(name="old"), number=_NUMBER.format(name="value"))
+        + r"\s*[.!]*$",
+        re.IGNORECASE,
+    )
+
+
+# (kind, pattern); kinds: quantity, price, rename, remove, tax
+_GRAMMAR = [
+    ("tax", _pattern(r"(?:the\s+)?tax\s+(?:is|was|should\s+be|=|to)\s+{number}(?:\s*,?\s*not\s+{old})?")),
+    ("tax", _pattern(r"(?:change|set|update|make)\s+(?:the\s+)?tax\s+(?:to|=)\s+{number}")),
+    ("remove", _pattern(r"(?:please\s+)?(?:remove|delete|drop)\s+{item}(?:\s+from\s+(?:the\s+)?(?:receipt|list))?")),
+    ("remove", _pattern(r"i\s+(?:didn'?t|did\s+not|never)\s+(?:buy|purchase|get|order)\s+{item}")),
+    ("remove", _pattern(r"{item}\s+(?:wasn'?t|was\s+not|isn'?t|is\s+not)\s+(?:mine|bought|purchased|on\s+(?:the|my)\s+receipt)")),
+    ("rename", _pattern(r"(?:rename|change)\s+{item}\s+(?:to|into)\s+(?P<name>[^\d$].*?)")),
+    ("rename", _pattern(r"{item}\s+(?:should\s+be\s+(?:called|named)|is\s+actually(?:\s+called)?|is\s+called)\s+(?P<name>[^\d$].*?)")),
+    ("quantity", _pattern(r"(?:change|set|update|make)\s+(?:the\s+)?(?:quantity|qty|count)\s+(?:of|for)\s+{item}\s+(?:to|=)\s+{qty}")),
+    ("quantity", _pattern(r"(?:the\s+)?(?:quantity|qty|count)\s+(?:of|for)\s+{item}\s+(?:is|was|should\s+be|=)\s+{qty}(?:\s*,?\s*not\s+{old})?")),
+    ("quantity", _pattern(r"i\s+(?:only\s+)?(?:bought|got|purchased|ordered|had)\s+(?:only\s+)?(?P<value>\d+(?:\.\d+)?|"
+                          + "|".join(_WORD_NUMBERS) + r")\s+{item}(?:\s*,?\s*not\s+(?P<old>\d+|"
+                          + "|".join(_WORD_NUMBERS) + r"))?")),
+    ("price", _pattern(r"(?:change|set|update|make)\s+(?:the\s+)?(?:unit\s+)?(?:price|cost)\s+(?:of|for)\s+{item}\s+(?:to|=)\s+{price}")),
+    ("price", _pattern(r"(?:the\s+)?(?:unit\s+)?(?:price|cost)\s+(?:of|for)\s+{item}\s+(?:is|was|should\s+be|=)\s+{price}(?:\s*,?\s*not\s+{old})?")),
+    ("price", _pattern(r"{item}\s+(?:costs?|was|were|is|should\s+be|should\s+cost|priced\s+at)\s+{price}(?:\s+each|\s+per\s+\w+)?(?:\s*,?\s*not\s+{old})?")),
+]
+
+
+class PatchError(Exception):
+    """A JSON patch could not be applied"""
+
+
+@dataclass
+class CorrectionResult:
+    """Outcome of a correction handled without the model"""
+    receipt: Dict[str, Any]
+    patches: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def to_decimal(value: Any) -> Optional[Decimal]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return Decimal(str(value).replace(",", "").replace("$", "").strip())
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _number(text: str) -> Optional[Decimal]:
+    text = text.strip().lower()
+    if text in _WORD_NUMBERS:
+        return Decimal(_WORD_NUMBERS[text])
+    # "4,50" is a decimal comma, "1,250" a thousands separator
+    if re.fullmatch(r"\d+,\d{1,2}", text):
+        text = text.replace(",", ".")
+    return to_decimal(text)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def find_item(receipt: Dict[str, Any], phrase: str) -> Optional[int]:
+    """
+    Index of the receipt item a phrase refers to
+
+    Accepts ordinals ("the second item", "item 3", "the last one") and item names,
+    matched fuzzily. Returns None if nothing matches or the match is ambiguous.
+    """
+    items = receipt.get("items") or []
+    phrase = _UNIT_WORDS.sub("", phrase.strip().strip("\"'"), count=1)
+    normalized = _normalize(phrase)
+    if not items or not normalized:
+        return None
+
+    ordinal = re.fullmatch(r"(?:(\w+)\s+(?:item|one|line)|(?:item|line)\s+(?:no\s+)?(\d+))", normalized)
+    if ordinal:
+        position = _ORDINALS.get(ordinal.group(1) or "") or int(ordinal.group(2) or 0)
+        if position == -1:
+            return len(items) - 1
+        return position - 1 if 1 <= position <= len(items) else None
+
+    scores = []
+    phrase_tokens = set(normalized.split())
+    for index, item in enumerate(items):
+        name = _normalize(str(item.get("item_name") or ""))
+        if not name:
+            scores.append((0.0, index))
+            continue
+        if name == normalized:
+            scores.append((1.0, index))
+            continue
+        name_tokens = set(name.split())
+        # Every word of the phrase appears in the name ("milk" -> "Amul Milk 1L")
+        contained = ITEM_CONTAINED_SCORE if phrase_tokens <= name_tokens else 0.0
+        jaccard = len(phrase_tokens & name_tokens) / len(phrase_tokens | name_tokens)
+        ratio = difflib.SequenceMatcher(None, normalized, name).ratio()
+        scores.append((max(contained, jaccard, ratio), index))
+
+    scores.sort(reverse=True)
+    best_score, best_index = scores[0]
+    runner_up = scores[1][0] if len(scores) > 1 else 0.0
+    if best_score < ITEM_MATCH_THRESHOLD or best_score - runner_up < ITEM_MATCH_MARGIN:
+        return None
+    return best_index
+
+
+def _clause_patches(receipt: Dict[str, Any], clause: str) -> Optional[List[Dict[str, Any]]]:
+    for kind, pattern in _GRAMMAR:
+        match = pattern.match(clause)
+        if not match:
+            continue
+
+        if kind == "tax":
+            value = _number(match.group("value"))
+            if value is None:
+                continue
+            return [{"op": "replace", "path": "/tax", "value": float(value)}]
+
+        index = find_item(receipt, match.group("item"))
+        if index is None:
+            continue
+        if kind == "remove":
+            return [{"op": "remove", "path": f"/items/{index}"}]
+        if kind == "rename":
+            name = match.group("name").strip().strip("\"'")
+            return [{"op": "replace", "path": f"/items/{index}/item_name", "value": name}] if name else None
+
+        value = _number(match.group("value"))
+        if value is None or value < 0:
+            continue
+        field_name = "quantity" if kind == "quantity" else "unit_price"
+        return [{"op": "replace", "path": f"/items/{index}/{field_name}", "value": float(value)}]
+    return None
+
+
+def parse_correction(receipt: Dict[str, Any], feedback: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    JSON patches for a correction, or None if any part of it is not understood
+
+    Args:
+        receipt: Receipt being corrected (used to resolve item references)
+        feedback: The user's correction, possibly several clauses
+    """
+    clauses = [c for c in _CLAUSE_SPLIT.split(feedback.strip()) if c]
+    if not clauses:
+        return None
+
+    patches = []
+    for clause in clauses:
+        clause_patches = _clause_patches(receipt, clause)
+        if clause_patches is None:
+            return None
+        patches.extend(clause_patches)
+
+    # Remove higher indexes first so earlier removals don't shift later ones
+    removals = sorted((p for p in patches if p["op"] == "remove"),
+                      key=lambda p: int(p["path"].rsplit("/", 1)[1]), reverse=True)
+    return [p for p in patches if p["op"] != "remove"] + removals
+
+
+def apply_patch(document: Dict[str, Any], patches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply replace/add/remove JSON patch operations to a copy of document"""
+    document = copy.deepcopy(document)
+    for patch in patches:
+        *parents, key = [part.replace("~1", "/").replace("~0", "~") for part in patch["path"].lstrip("/").split("/")]
+        target = document
+        try:
+            for part in parents:
+                target = target[int(part)] if isinstance(target, list) else target[part]
+            if isinstance(target, list):
+                key = int(key)
+            if patch["op"] == "remove":
+                del target[key]
+            elif patch["op"] in ("replace", "add"):
+                target[key] = patch["value"]
+            else:
+                raise PatchError(f"Unsupported patch operation: {patch['op']}")
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            raise PatchError(f"Cannot apply {patch['op']} at {patch['path']}: {e}")
+    return document
+
+
+# Item fields whose changes affect the totals
+AMOUNT_FIELDS = {"quantity", "unit_price", "tax"}
+
+
+def _line_totals(items: List[Dict[str, Any]]) -> Optional[List[Decimal]]:
+    """quantity x unit_price per item, or None if any item has no readable price"""
+    totals = []
+    for item in items:
+        unit_price = to_decimal(item.get("unit_price"))
+        if unit_price is None:
+            return None
+        quantity = to_decimal(item.get("quantity"))
+        quantity = Decimal("1") if quantity is None else quantity
+        totals.append((quantity * unit_price).quantize(CENT, rounding=ROUND_HALF_UP))
+    return totals
+
+
+def _tax(receipt: Dict[str, Any]) -> Decimal:
+    """Receipt-level tax if present, otherwise the sum of per-item taxes"""
+    tax = to_decimal(receipt.get("tax"))
+    if tax is None:
+        tax = sum((to_decimal(item.get("tax")) or Decimal("0") for item in receipt.get("items") or []),
+                  Decimal("0"))
+    return tax.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def total_adjustment(receipt: Dict[str, Any]) -> Decimal:
+    """
+    Discounts, service charges and rounding on a receipt: total - subtotal - tax
+
+    The printed subtotal is used if present, otherwise the sum of the item totals.
+    Zero when the total or an item price is unknown.
+    """
+    total = to_decimal(receipt.get("total_amount"))
+    if total is None:
+        return Decimal("0")
+    subtotal = to_decimal(receipt.get("subtotal"))
+    if subtotal is None:
+        line_totals = _line_totals(receipt.get("items") or [])
+        if line_totals is None:
+            return Decimal("0")
+        subtotal = sum(line_totals, Decimal("0"))
+    return (total - subtotal - _tax(receipt)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def recompute_totals(receipt: Dict[str, Any], adjustment: Decimal = Decimal("0")) -> Optional[Dict[str, Any]]:
+    """
+    Recompute item totals, subtotal and total exactly
+
+    item_total_price = quantity x unit_price, subtotal = sum of item totals and
+    total_amount = subtotal + tax + adjustment. The receipt-level tax is used if
+    present, otherwise the sum of per-item taxes. Amounts are rounded half-up to cents.
+
+    Returns:
+        The receipt with new totals, or None if an item has no readable price
+    """
+    receipt = dict(receipt)
+    line_totals = _line_totals(receipt.get("items") or [])
+    if line_totals is None:
+        return None
+    items = []
+    for item, line_total in zip(receipt.get("items") or [], line_totals):
+        items.append({**item, "item_total_price": float(line_total)})
+    subtotal = sum(line_totals, Decimal("0"))
+
+    tax = _tax(receipt)
+    receipt["items"] = items
+    receipt["subtotal"] = float(subtotal)
+    if "tax" in receipt:
+        receipt["tax"] = float(tax)
+    receipt["total_amount"] = float(subtotal + tax + adjustment)
+    return receipt
+
+
+def _changes_amounts(patches: List[Dict[str, Any]]) -> bool:
+    for patch in patches:
+        parts = patch["path"].lstrip("/").split("/")
+        if patch["op"] == "remove" or parts[-1] in AMOUNT_FIELDS:
+            return True
+    return False
+
+
+def apply_correction(receipt: Dict[str, Any], feedback: str) -> Optional[CorrectionResult]:
+    """
+    Apply a user's correction to a receipt without the model
+
+    Args:
+        receipt: Extracted receipt JSON
+        feedback: The user's correction
+
+    Returns:
+        The corrected receipt (totals recomputed only if an amount changed) and
+        the patches applied, or None if the feedback needs receipt_feedback_agent
+    """
+    patches = parse_correction(receipt, feedback)
+    if not patches:
+        return None
+    try:
+        corrected = apply_patch(receipt, patches)
+    except PatchError as e:
+        print(f"Warning: Correction patch failed, falling back to the model: {e}")
+        return None
+    if not _changes_amounts(patches):
+        # Renames leave every amount as printed
+        return CorrectionResult(receipt=corrected, patches=patches)
+
+    recomputed = recompute_totals(corrected, total_adjustment(receipt))
+    if recomputed is None:
+        # An unreadable price would count as 0; let the model work out the totals
+        return None
+    return CorrectionResult(receipt=recomputed, patches=patches)
+
+
+def load_receipt_json(value: Any) -> Optional[Dict[str, Any]]:
+    """Receipt dict from session state, which may hold fenced JSON text"""
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str):
+        return None
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", value.strip())
+    try:
+        receipt = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return receipt if isinstance(receipt, dict) else None
+
+
+if __name__ == "__main__":
+    # Demo: python server/agents/ReceiptOrchestrator/corrections.py
+    sample = {
+        "store": "Quick Mart", "subtotal": 25.50, "tax": 2.04, "total_amount": 27.54,
+        "items": [
+            {"item_name": "Premium Coffee Beans", "quantity": 2.0, "unit_price": 10.00, "item_total_price": 20.00},
+            {"item_name": "Almond Croissant", "quantity": 1.0, "unit_price": 5.50, "item_total_price": 5.50},
+        ],
+    }
+    for feedback in [
+        "I only bought 1 bag of coffee beans, not 2.",
+        "The croissant was $4.25",
+        "Remove the second item; tax is 1.10",
+        "Rename croissant to Butter Croissant",
+        "The store name is wrong, it was Quick Stop",
+    ]:
+        result = apply_correction(sample, feedback)
+        if result is None:
+            print(f"🤖 {feedback!r}: needs the model")
+        else:
+            print(f"✅ {feedback!r}: total {result.receipt['total_amount']:.2f}  {result.patches}")
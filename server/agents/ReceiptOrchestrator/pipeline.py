@@ -0,0 +1,238 @@
+"""
+Receipt Processing Pipeline
+===========================
+
+Code-driven ingestion of an uploaded receipt image for the background job
+queue (see server/receipt_jobs.py): download, duplicate detection, image
+preprocessing, extraction with the ingestion agent's prompt (skipped when the
+same image was extracted before), validation with targeted re-reads of failing
+fields, local enrichment, and persistence to Firestore. Each stage is reported through a
+callback so the job's status can be tracked.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .utils import StructuredOutputError, generate_structured, parse_structured
+from .validation import validate_and_repair
+from .subagents.receipt_ingestion.agent import Receipt, instruction_text
+from firestore_service import firestore_service
+from llm_provider import get_llm_provider
+from receipt_images import receipt_image_downloader
+from receipt_preprocessing import preprocess_receipt_image
+from receipt_dedupe import DEDUPE_ENABLED, DuplicateReceiptError, fingerprint_image, receipt_image_index
+from receipt_enrichment import receipt_enricher
+
+# Model used for receipt extraction (same as receipt_ingestion_agent)
+EXTRACTION_MODEL = "models/gemini-1.5-flash"
+
+# Bulk uploads: receipt writes are group-committed in Firestore batches of up to
+# BULK_WRITE_BATCH_SIZE, waiting at most BULK_WRITE_LINGER_SECONDS for a batch to fill
+BULK_WRITE_BATCH_SIZE = 50
+BULK_WRITE_LINGER_SECONDS = 0.25
+
+StageReporter = Callable[[str], Awaitable[None]]
+
+
+class ReceiptExtractionError(Exception):
+    """The model's output could not be turned into a receipt"""
+
+
+class _ReceiptWriteBatcher:
+    """Group-commits receipt writes from concurrent bulk jobs into Firestore batched writes"""
+
+    def __init__(self, max_size: int = BULK_WRITE_BATCH_SIZE, linger: float = BULK_WRITE_LINGER_SECONDS):
+        self.max_size = max_size
+        self.linger = linger
+        self._pending: List[Tuple[str, str, Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def save(self, uid: str, receipt_id: str, receipt: Dict[str, Any]) -> None:
+        """Wait until the receipt has been committed with the next batch"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((uid, receipt_id, receipt, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._flush)
+        await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            asyncio.ensure_future(self._commit(pending))
+
+    @staticmethod
+    async def _commit(pending) -> None:
+        saved = await asyncio.to_thread(
+            firestore_service.save_receipts_batch, [(uid, rid, receipt) for uid, rid, receipt, _ in pending]
+        )
+        for *_, future in pending:
+            if future.done():
+                continue
+            if saved:
+                future.set_result(None)
+            else:
+                future.set_exception(RuntimeError("Failed to save receipt"))
+
+
+class ReceiptPipeline:
+    """Runs one uploaded receipt through download, extraction, enrichment and persistence"""
+
+    def __init__(self, model_name: str = EXTRACTION_MODEL):
+        self.model_name = model_name
+        self.model = get_llm_provider().get_model(model_name)
+        self._bulk_writer: Optional[_ReceiptWriteBatcher] = None
+
+    async def run(self, request: Dict[str, Any], report: StageReporter) -> Dict[str, Any]:
+        """
+        Process an uploaded receipt
+
+        Args:
+            request: ReceiptProcessRequest fields (receiptId, downloadURL, userId, fileName, fileType, storagePath)
+            report: Awaited with each stage name as it starts
+
+        Returns:
+            The saved receipt document
+
+        Raises:
+            DuplicateReceiptError: The user already has a receipt with this image
+        """
+        uid, receipt_id = request["userId"], request["receiptId"]
+
+        await report("downloading")
+        image_bytes, mime_type = await self.download(request)
+
+        await report("preprocessing")
+        fingerprint = None
+        near_match = None
+        receipt = None
+        if DEDUPE_ENABLED:
+            fingerprint = await asyncio.to_thread(fingerprint_image, image_bytes)
+            match = await asyncio.to_thread(receipt_image_index.claim, uid, receipt_id, fingerprint)
+            if match is not None and match.exact and not match.pending:
+                raise DuplicateReceiptError(match.receipt_id)
+            # A pHash-only match may be another receipt from the same store, and a receipt
+            # still processing may yet fail; both are checked after extraction
+            near_match = match
+            receipt = await asyncio.to_thread(
+                receipt_image_index.get_cached_extraction, fingerprint.sha256, self.model_name
+            )
+            if receipt is not None:
+                print(f"🧾 {receipt_id}: extraction cache hit for image {fingerprint.sha256[:12]}")
+                receipt = self.load_cached(receipt)
+
+        try:
+            image = None
+            if receipt is None:
+                image = await asyncio.to_thread(preprocess_receipt_image, image_bytes, mime_type)
+
+                await report("extracting")
+                receipt = await asyncio.to_thread(self.extract, image.data, image.mime_type)
+
+            await report("validating")
+            if image is not None:
+                receipt = await asyncio.to_thread(self.validate, receipt, image.data, image.mime_type)
+                if fingerprint is not None:
+                    # Cached after validation so a re-upload does not re-read the same fields
+                    await asyncio.to_thread(receipt_image_index.cache_extraction, fingerprint, self.model_name, receipt)
+            else:
+                receipt = self.validate(receipt)
+
+            if near_match is not None:
+                if near_match.pending:
+                    # The matching upload is still processing and may fail, so keep both
+                    receipt["possible_duplicate_of"] = near_match.receipt_id
+                elif await asyncio.to_thread(receipt_image_index.is_same_purchase, near_match, receipt):
+                    raise DuplicateReceiptError(near_match.receipt_id)
+
+            await report("enriching")
+            # Local classification; may read/write learned item categories in Firestore
+            receipt = await asyncio.to_thread(self.enrich, receipt)
+
+            await report("saving")
+            if request.get("batchId"):
+                if self._bulk_writer is None:
+                    self._bulk_writer = _ReceiptWriteBatcher()
+                await self._bulk_writer.save(uid, receipt_id, self.to_document(request, receipt))
+            else:
+                await asyncio.to_thread(self.persist, request, receipt)
+            if fingerprint is not None:
+                await asyncio.to_thread(receipt_image_index.record, uid, receipt_id, fingerprint)
+        except BaseException:
+            if fingerprint is not None:
+                receipt_image_index.release(uid, receipt_id)
+            raise
+        return receipt
+
+    async def download(self, request: Dict[str, Any]) -> Tuple[bytes, str]:
+        """Receipt image bytes and MIME type, from Cloud Storage or the download URL"""
+        if request.get("imageData") is not None:
+            # Image uploaded inline (zip batch), already checked when it was submitted
+            return request["imageData"], request["fileType"]
+        return await receipt_image_downloader.fetch(request.get("downloadURL"), request.get("storagePath"),
+                                                    request.get("userId"))
+
+    def extract(self, image_bytes: bytes, mime_type: str) -> Dict[str, Any]:
+        """Structured receipt data read from the image by the model"""
+        # Raw bytes as an inline image part (base64 text would add a third to the upload)
+        contents = [instruction_text, {"mime_type": mime_type, "data": image_bytes}]
+        try:
+            receipt = generate_structured(self.model, contents, Receipt)
+        except StructuredOutputError as e:
+            raise ReceiptExtractionError(f"Model returned invalid receipt JSON: {e}")
+        return receipt.model_dump()
+
+    @staticmethod
+    def load_cached(receipt: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """A cached extraction in the current Receipt schema, or None to extract again"""
+        try:
+            return parse_structured(receipt, Receipt).model_dump()
+        except StructuredOutputError:
+            return None
+
+    def validate(self, receipt: Dict[str, Any], image_bytes: Optional[bytes] = None,
+                 mime_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Check totals, purchase date and currency, re-reading failing fields from the image
+
+        Without image_bytes (cached extractions) the receipt is only checked. Fields that
+        still fail are listed in receipt['validation'] and the receipt is marked for review.
+        """
+        result = validate_and_repair(self.model, receipt, image_bytes, mime_type)
+        if result.issues:
+            print(f"⚠️ Receipt needs review: {'; '.join(i.message for i in result.issues)}")
+        return {**result.receipt, "validation": result.summary()}
+
+    @staticmethod
+    def enrich(receipt: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize extracted fields, classify items and derive category spend and the need/want split"""
+        return receipt_enricher.enrich(receipt)
+
+    @staticmethod
+    def to_document(request: Dict[str, Any], receipt: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the upload's metadata to an enriched receipt"""
+        receipt.update({
+            'receipt_id': request["receiptId"],
+            'image_url': request.get("downloadURL"),
+            'storage_path': request.get("storagePath"),
+            'file_name': request.get("fileName"),
+            'processed_at': datetime.now().isoformat(),
+        })
+        if request.get("batchId"):
+            receipt['batch_id'] = request["batchId"]
+        return receipt
+
+    @classmethod
+    def persist(cls, request: Dict[str, Any], receipt: Dict[str, Any]) -> str:
+        """Save the receipt under the upload's receipt ID"""
+        receipt = cls.to_document(request, receipt)
+        receipt_id = firestore_service.save_receipt(request["userId"], receipt, request["receiptId"])
+        if not receipt_id:
+            raise RuntimeError("Failed to save receipt")
+        return receipt_id
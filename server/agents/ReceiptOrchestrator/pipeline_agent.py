@@ -0,0 +1,192 @@
+"""
+Receipt Pipeline Agent
+======================
+
+Code-driven root agent for the ReceiptOrchestrator. An uploaded receipt image
+goes straight through duplicate detection, ingestion, validation, persistence
+and (when asked for) a Google Wallet pass without a model deciding which agent
+runs next; only messages without an image, i.e. free-form feedback and wallet
+requests about an earlier receipt, are handed to the LLM router.
+"""
+
+import asyncio
+import re
+import uuid
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, Optional, Tuple
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from .utils import StructuredOutputError, parse_structured
+from .pipeline import ReceiptPipeline
+from .subagents.receipt_ingestion.agent import Receipt
+from .subagents.google_wallet.agent import create_wallet_pass
+from agent_registry import registry
+from firestore_service import firestore_service
+from receipt_dedupe import DEDUPE_ENABLED, fingerprint_image, receipt_image_index
+
+_WALLET_REQUEST_PATTERN = re.compile(r"\bwallet\b", re.IGNORECASE)
+
+
+def _has_image(content: Optional[types.Content]) -> bool:
+    for part in (content.parts if content else None) or []:
+        blob = part.inline_data or part.file_data
+        if blob is not None and (blob.mime_type or "").startswith("image/"):
+            return True
+    return False
+
+
+def _image_part(content: Optional[types.Content]) -> Tuple[Optional[bytes], Optional[str]]:
+    """Inline image bytes and MIME type of the upload (None for file references)"""
+    for part in (content.parts if content else None) or []:
+        if part.inline_data is not None and (part.inline_data.mime_type or "").startswith("image/"):
+            return part.inline_data.data, part.inline_data.mime_type
+    return None, None
+
+
+def _user_text(content: Optional[types.Content]) -> str:
+    return "".join(part.text or "" for part in (content.parts if content else None) or [])
+
+
+class ReceiptPipelineAgent(BaseAgent):
+    """Runs ingestion -> validation -> persistence -> optional wallet pass in code"""
+
+    ingestion_agent: LlmAgent
+    router_agent: LlmAgent
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(self, name: str, ingestion_agent: LlmAgent, router_agent: LlmAgent, **kwargs):
+        super().__init__(
+            name=name,
+            ingestion_agent=ingestion_agent,
+            router_agent=router_agent,
+            sub_agents=[ingestion_agent, router_agent],
+            **kwargs,
+        )
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        if not _has_image(ctx.user_content):
+            # Feedback on an earlier receipt needs the model to interpret it
+            async for event in self.router_agent.run_async(ctx):
+                yield event
+            return
+
+        uid = ctx.session.state.get("user_id") or ctx.session.user_id
+        image_bytes, mime_type = _image_part(ctx.user_content)
+
+        # Same duplicate detection as the upload job queue (see pipeline.py)
+        receipt_id = uuid.uuid4().hex
+        fingerprint = None
+        match = None
+        if DEDUPE_ENABLED and image_bytes:
+            fingerprint = await asyncio.to_thread(fingerprint_image, image_bytes)
+            match = await asyncio.to_thread(receipt_image_index.claim, uid, receipt_id, fingerprint)
+            if match is not None and match.exact and not match.pending:
+                yield self._reply(ctx, f"This receipt was already saved (receipt {match.receipt_id}).",
+                                  {"receipt_id": match.receipt_id})
+                return
+
+        try:
+            # 1. Ingestion: a single schema-constrained extraction call
+            parsed_receipt = None
+            async for event in self.ingestion_agent.run_async(ctx):
+                # Only this upload's output; state may still hold an earlier receipt
+                if event.actions and "parsed_receipt" in (event.actions.state_delta or {}):
+                    parsed_receipt = event.actions.state_delta["parsed_receipt"]
+                yield event
+
+            # 2. Validation: schema, then totals, date and currency with targeted re-reads
+            try:
+                receipt = self.check_output(parsed_receipt)
+            except StructuredOutputError as e:
+                self._release(uid, receipt_id, fingerprint)
+                yield self._reply(ctx, f"I couldn't read this receipt: {e}. Please try a clearer photo.")
+                return
+            # Shared across invocations: the pipeline holds the extraction model
+            pipeline = registry.get("adk_receipt_pipeline", ReceiptPipeline)
+            receipt = await asyncio.to_thread(pipeline.validate, receipt, image_bytes, mime_type)
+
+            if match is not None:
+                if match.pending:
+                    # The matching upload is still processing and may fail, so keep both
+                    receipt["possible_duplicate_of"] = match.receipt_id
+                elif await asyncio.to_thread(receipt_image_index.is_same_purchase, match, receipt):
+                    self._release(uid, receipt_id, fingerprint)
+                    yield self._reply(ctx, f"This receipt was already saved (receipt {match.receipt_id}).",
+                                      {"receipt_id": match.receipt_id})
+                    return
+
+            # 3. Persistence
+            saved_id = await asyncio.to_thread(self.persist, uid, receipt, receipt_id)
+            if not saved_id:
+                self._release(uid, receipt_id, fingerprint)
+                yield self._reply(ctx, "I read the receipt but couldn't save it. Please try again.",
+                                  {"parsed_receipt": receipt})
+                return
+            if fingerprint is not None:
+                await asyncio.to_thread(receipt_image_index.record, uid, receipt_id, fingerprint)
+        except BaseException:
+            self._release(uid, receipt_id, fingerprint)
+            raise
+
+        summary = (f"Saved receipt from {receipt.get('store') or 'Unknown'}: "
+                   f"{len(receipt.get('items') or [])} items, total {receipt.get('total_amount')}.")
+        if receipt["validation"]["issues"]:
+            summary += " Please check: " + "; ".join(receipt["validation"]["issues"]) + "."
+        state_delta: Dict[str, Any] = {"parsed_receipt": receipt, "receipt_id": receipt_id}
+
+        # 4. Optional Google Wallet pass, created directly rather than by the wallet agent
+        if ctx.session.state.get("create_wallet_pass") or _WALLET_REQUEST_PATTERN.search(_user_text(ctx.user_content)):
+            wallet = await asyncio.to_thread(create_wallet_pass, receipt)
+            state_delta["wallet_pass"] = wallet
+            if wallet.get("success") is False:
+                summary += f" The Google Wallet pass could not be created: {wallet.get('error')}"
+            else:
+                summary += " Google Wallet pass created."
+
+        yield self._reply(ctx, summary, state_delta)
+
+    @staticmethod
+    def check_output(parsed_receipt: Any) -> Dict[str, Any]:
+        """
+        Check the ingestion agent's output
+
+        Raises:
+            StructuredOutputError: The output is missing, does not match the Receipt
+                schema or has neither items nor a total
+        """
+        if not parsed_receipt:
+            raise StructuredOutputError("No receipt data was extracted")
+        receipt = parse_structured(parsed_receipt, Receipt).model_dump()
+        if not receipt["items"] and receipt["total_amount"] is None:
+            raise StructuredOutputError("No items or total found")
+        return receipt
+
+    @staticmethod
+    def persist(uid: str, receipt: Dict[str, Any], receipt_id: Optional[str] = None) -> Optional[str]:
+        """Save an enriched copy of the receipt for the user and return its ID"""
+        document = ReceiptPipeline.enrich(receipt)
+        document["processed_at"] = datetime.now().isoformat()
+        if receipt_id:
+            document["receipt_id"] = receipt_id
+        return firestore_service.save_receipt(uid, document, receipt_id)
+
+    @staticmethod
+    def _release(uid: str, receipt_id: str, fingerprint) -> None:
+        """Give up this upload's claim on its image fingerprint"""
+        if fingerprint is not None:
+            receipt_image_index.release(uid, receipt_id)
+
+    def _reply(self, ctx: InvocationContext, text: str,
+               state_delta: Optional[Dict[str, Any]] = None) -> Event:
+        return Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            actions=EventActions(state_delta=state_delta or {}),
+        )
@@ -1,27 +1,34 @@
 from google.adk.agents import LlmAgent, SequentialAgent
+from llm_provider import adk_model
+from ...utils import StructuredOutputError, extract_json_object
+from agent_registry import registry
 from google.adk.tools import ToolContext
 from .tools import WalletTool
 from typing import Dict
-import json
 
 def create_google_wallet_tool(tool_context: ToolContext) -> Dict:
-    parsed_result_string = tool_context.state.get('parsed_receipt', None)
-    parsed_result_string = parsed_result_string[7:-3]
-    print(parsed_result_string)
-    if not parsed_result_string:
+    parsed_result = tool_context.state.get('parsed_receipt', None)
+    if not parsed_result:
         return {
             'success': False,
             'error': 'No parsed result found in tool context'
         }
-    
-    try:
-        parsed_result = json.loads(parsed_result_string)
-    except json.JSONDecodeError:
-        return {
-            'success': False,
-            'error': 'Failed to decode parsed receipt JSON'
-        }
 
+    # Schema-constrained agents store a dict; older sessions may hold (fenced) JSON text
+    if not isinstance(parsed_result, dict):
+        try:
+            parsed_result = extract_json_object(str(parsed_result))
+        except StructuredOutputError:
+            return {
+                'success': False,
+                'error': 'Failed to decode parsed receipt JSON'
+            }
+
+    return create_wallet_pass(parsed_result)
+
+
+def create_wallet_pass(parsed_result: Dict) -> Dict:
+    """Create a Google Wallet pass for a parsed receipt (also called directly by the receipt pipeline)"""
     print(parsed_result)
     title = parsed_result.get('title', 'Receipt')
     header = parsed_result.get('header', 'Receipt Header')
@@ -33,7 +40,8 @@ def create_google_wallet_tool(tool_context: ToolContext) -> Dict:
     app_link_url = parsed_result.get('app_link_url', None)
     
 
-    wallet_tool = WalletTool()
+    # Shared across calls: WalletTool() loads credentials and runs the discovery build()
+    wallet_tool = registry.get("adk_wallet_tool", WalletTool)
 
     try:
         response = wallet_tool.create_pass(title, header, description,
@@ -48,7 +56,7 @@ def create_google_wallet_tool(tool_context: ToolContext) -> Dict:
 
 google_wallet_agent = LlmAgent(
     name= 'google_wallet',
-    model='gemini-2.0-flash',
+    model=adk_model("gemini-2.0-flash"),
     description='Generates a Google Wallet pass for a receipt',
     instruction="""You are a Google Wallet pass generator. 
     You can use the 'create_google_wallet_tool' to generate a Google Wallet pass. 
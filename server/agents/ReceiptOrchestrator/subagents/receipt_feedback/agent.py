@@ -1,9 +1,42 @@
+import json
+from typing import Optional
+
 from google.adk.agents import LlmAgent, SequentialAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+from llm_provider import adk_model
+from ..receipt_ingestion.agent import Receipt
+from ...corrections import apply_correction, load_receipt_json
+
+
+def apply_correction_locally(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """
+    Answer common corrections (quantity, price, name, removed item, tax) without the model
+
+    The correction is applied to the receipt in state as JSON patches and the totals
+    are recomputed exactly; anything the correction engine can't parse goes to Gemini.
+    """
+    receipt = load_receipt_json(callback_context.state.get("parsed_receipt"))
+    user_content = callback_context.user_content
+    feedback = "".join(part.text or "" for part in (user_content.parts if user_content else []))
+    if receipt is None or not feedback.strip():
+        return None
+
+    result = apply_correction(receipt, feedback)
+    if result is None:
+        return None
+
+    print(f"🧮 Applied receipt correction locally: {result.patches}")
+    return LlmResponse(content=types.Content(
+        role="model",
+        parts=[types.Part(text=json.dumps(result.receipt, indent=2))]
+    ))
 
 
 receipt_feedback_agent = LlmAgent(
     name="receipt_feedback",
-    model="gemini-2.0-flash",
+    model=adk_model("gemini-2.0-flash"),
     instruction="""You are a meticulous and precise financial assistant for a receipt management application. Your primary function is to process user-provided corrections on structured receipt data.
 You will be given two inputs: the initial_receipt_data as a JSON object, and the user_feedback as a line of text. Your task is to understand the user's intent, apply their change, perform all necessary recalculations to ensure the entire receipt is financially consistent, and return the final, fully corrected JSON object.
 CRITICAL RULE: The Recalculation Mandate
@@ -77,6 +110,10 @@ As a direct result, its item_total_price was recomputed (1.0 * 10.00 = 10.00).
 The receipt's subtotal was then recomputed from the new item totals (10.00 + 5.50 = 15.50).
 Finally, the total_amount was recomputed using the new subtotal (15.50 + 2.04 = 17.54).
 ***Only add  to the state if you change The schema***""",
+    before_model_callback=apply_correction_locally,
+    output_schema=Receipt,
+    disallow_transfer_to_parent=True,
+    disallow_transfer_to_peers=True,
     output_key="parsed_receipt"
 )
 
@@ -1,32 +1,58 @@
 from google.adk.agents import LlmAgent, SequentialAgent
+from llm_provider import adk_model
+from ...utils import amount_value, readable_value
+from ...validation import detect_currency
 from typing import List, Dict, Optional
-from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 from google.adk.tools import google_search
 from google.adk.tools.agent_tool import AgentTool
 
 class Item(BaseModel):
-    item_name: str = Field(..., description="Name of the item")
-    category: str = Field(..., description="Category of the item")
-    brand: str = Field(..., description="Brand name")
-    quantity: float = Field(..., description="Units purchased")
-    unit_price: float = Field(..., description="Price per unit")
-    tax: float = Field(..., description="Tax applied")
+    item_name: Optional[str] = Field(None, description="Name of the item")
+    category: Optional[str] = Field(None, description="Category of the item")
+    brand: Optional[str] = Field(None, description="Brand name, null if not visible")
+    quantity: Optional[float] = Field(1.0, description="Units purchased")
+    unit_price: Optional[float] = Field(None, description="Price per unit")
+    tax: Optional[float] = Field(None, description="Tax applied, null if not visible")
+    item_total_price: Optional[float] = Field(None, description="quantity * unit_price")
     description: Optional[str] = Field(None, description="Optional description of the item")
 
+    # Unreadable markers ("cant_read") become null and "$1,299.00" becomes 1299.0
+    clean_values = field_validator("*", mode="before")(readable_value)
+    clean_amounts = field_validator("quantity", "unit_price", "tax", "item_total_price", mode="before")(amount_value)
+
+    @field_validator("quantity", mode="after")
+    @classmethod
+    def default_quantity(cls, value):
+        return 1.0 if value is None else value
+
 class Receipt(BaseModel):
-    timestamp: datetime = Field(
-        ..., description="ISO 8601 format timestamp of purchase"
-    ),
-    store: str = Field(..., description="Name of the store")
-    items: List[Item] = Field(..., description="Detailed list of purchased items")
-    location: str = Field(..., description="Location of the store")
-    total_amount: float = Field(..., description="Total bill amount")
+    timestamp: Optional[str] = Field(
+        None, description="ISO 8601 format timestamp of purchase (YYYY-MM-DDTHH:MM:SS)"
+    )
+    store: Optional[str] = Field(None, description="Name of the store")
+    items: List[Item] = Field(default_factory=list, description="Detailed list of purchased items")
+    location: Optional[str] = Field(None, description="Location of the store")
+    subtotal: Optional[float] = Field(None, description="Sum of item totals")
+    tax: Optional[float] = Field(None, description="Total tax on the receipt")
+    total_amount: Optional[float] = Field(None, description="Total bill amount")
+    currency: Optional[str] = Field(None, description="ISO 4217 code of the currency, e.g. USD, EUR, INR")
+
+    clean_values = field_validator("*", mode="before")(readable_value)
+    clean_amounts = field_validator("subtotal", "tax", "total_amount", mode="before")(amount_value)
+
+    @model_validator(mode="before")
+    @classmethod
+    def consistent_currency(cls, data):
+        # Read before amount_value strips the symbols; mixed currencies leave it null
+        if isinstance(data, dict):
+            data = {**data, "currency": detect_currency(data)}
+        return data
     
 
 
 
-import requests
+from receipt_images import receipt_image_downloader
 import base64
 from google.adk.tools import FunctionTool
 
@@ -34,10 +60,11 @@ def download_and_encode_image(image_url: str) -> Dict:
     """
     Downloads an image from URL and returns Base64 encoded string.
     This will be called before invoking the agent.
+    Uses the shared connection pool with size and content-type limits (server/receipt_images.py).
     """
     try:
-        resp = requests.get(image_url, timeout=15)
-        b64 = base64.b64encode(resp.content).decode('utf-8')
+        image_bytes, _ = receipt_image_downloader.fetch_sync(image_url)
+        b64 = base64.b64encode(image_bytes).decode('utf-8')
         return {"status" : True, "input_data" : b64}
     except Exception as e:
         raise Exception(f"Failed to download image: {str(e)}")
@@ -63,6 +90,7 @@ Your task:
   "store": "string - ONLY the actual store name visible on the receipt", 
   "location": "string - ONLY if address is clearly visible on receipt",
   "total_amount": "float - ONLY the actual total amount visible on receipt",
+  "currency": "string - ISO 4217 code of the currency the prices are in (e.g. USD, EUR, INR)",
   "items": [
     {
       "item_name": "string - EXACT item name as it appears on receipt",
@@ -87,10 +115,14 @@ Your task:
 
 receipt_ingestion_agent = LlmAgent(
     name="receipt_ingestion",
-    model="gemini-1.5-flash",
+    model=adk_model("gemini-1.5-flash"),
     description="Receipt parser OCR agent that processes Base64 image data directly",
     instruction=instruction_text,
     tools=[],  # No tools needed
+    # Constrains the model to the Receipt JSON schema; the parsed receipt is stored as a dict
+    output_schema=Receipt,
+    disallow_transfer_to_parent=True,
+    disallow_transfer_to_peers=True,
     output_key="parsed_receipt"
 )
 
@@ -0,0 +1,143 @@
+import json
+import re
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+# Values the extraction prompt uses for unreadable fields
+UNREADABLE_VALUES = {"cant_read", "can't_read", "cannot_read", "null", "none", "n/a", ""}
+
+_AMOUNT_PATTERN = re.compile(r"^(?:[A-Za-z]{1,3}\.|[^\d\-.]{1,3})?\s*(-?[\d,]*\.?\d+)\s*[^\d]{0,3}$")
+_CODE_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)\s*```", re.DOTALL)
+_TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+
+# Model calls per structured output before giving up
+STRUCTURED_OUTPUT_ATTEMPTS = 3
+
+
+class StructuredOutputError(Exception):
+    """A model response could not be parsed into the expected schema"""
+
+
+def readable_value(value: Any) -> Any:
+    """None for values the model marked as unreadable"""
+    if isinstance(value, str) and value.strip().lower() in UNREADABLE_VALUES:
+        return None
+    return value
+
+
+def amount_value(value: Any) -> Any:
+    """Numbers from amount strings like "$1,299.00", "Rs. 45" or "12.50 USD"; other values unchanged"""
+    if isinstance(value, str):
+        match = _AMOUNT_PATTERN.match(value.strip())
+        if match:
+            return float(match.group(1).replace(",", ""))
+    return value
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """
+    The JSON object in a model response
+
+    Tolerates Markdown code fences, text around the object and trailing commas.
+
+    Raises:
+        StructuredOutputError: No JSON object could be read
+    """
+    if not text or not text.strip():
+        raise StructuredOutputError("Empty model response")
+    fenced = _CODE_FENCE_PATTERN.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise StructuredOutputError("No JSON object in model response")
+    candidate = text[start:end + 1]
+    for attempt in (candidate, _TRAILING_COMMA_PATTERN.sub(r"\1", candidate)):
+        try:
+            value = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    raise StructuredOutputError("Model response is not valid JSON")
+
+
+def parse_structured(value: Any, schema: Type[BaseModel]) -> BaseModel:
+    """
+    Validate a model response (text, dict or instance) against a pydantic schema
+
+    Raises:
+        StructuredOutputError: The response is missing, malformed or fails validation
+    """
+    if isinstance(value, schema):
+        return value
+    if value is None:
+        raise StructuredOutputError("No model output")
+    data = value if isinstance(value, dict) else extract_json_object(str(value))
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        raise StructuredOutputError(f"Model output does not match {schema.__name__}: {e.error_count()} errors")
+
+
+def gemini_response_schema(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAPI-subset response_schema for Gemini structured output, derived from a pydantic model"""
+    return _gemini_schema(schema.model_json_schema())
+
+
+def _gemini_schema(node: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    defs = node.get("$defs", defs or {})
+    if "$ref" in node:
+        return _gemini_schema(defs[node["$ref"].split("/")[-1]], defs)
+
+    nullable = False
+    if "anyOf" in node:
+        options = [option for option in node["anyOf"] if option.get("type") != "null"]
+        nullable = len(options) < len(node["anyOf"])
+        node = {**options[0], "description": node.get("description", options[0].get("description"))}
+        if "$ref" in node:
+            node = {**_gemini_schema(node, defs), "description": node.get("description")}
+
+    schema: Dict[str, Any] = {"type": node["type"].upper()} if "type" in node else dict(node)
+    if node.get("description"):
+        schema["description"] = node["description"]
+    if nullable:
+        schema["nullable"] = True
+    if node.get("type") == "object":
+        schema["properties"] = {name: _gemini_schema(prop, defs) for name, prop in node.get("properties", {}).items()}
+        if node.get("required"):
+            schema["required"] = node["required"]
+    elif node.get("type") == "array":
+        schema["items"] = _gemini_schema(node["items"], defs)
+    return schema
+
+
+def generate_structured(model, contents, schema: Type[BaseModel],
+                        attempts: int = STRUCTURED_OUTPUT_ATTEMPTS) -> BaseModel:
+    """
+    Generate a response constrained to a pydantic schema, retrying malformed output
+
+    Args:
+        model: Model from the LLM provider
+        contents: generate_content contents
+        schema: Pydantic model the response must satisfy
+        attempts: Model calls before giving up
+
+    Raises:
+        StructuredOutputError: No attempt produced valid output
+    """
+    generation_config = {
+        "response_mime_type": "application/json",
+        "response_schema": gemini_response_schema(schema),
+    }
+    error = None
+    for attempt in range(1, attempts + 1):
+        response = model.generate_content(contents, generation_config=generation_config)
+        try:
+            return parse_structured(response.text, schema)
+        except (StructuredOutputError, ValueError) as e:
+            # ValueError: response.text raises when the response has no text parts
+            error = e
+            print(f"⚠️ Structured output attempt {attempt}/{attempts} failed: {e}")
+    raise StructuredOutputError(str(error))
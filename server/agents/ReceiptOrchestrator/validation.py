@@ -0,0 +1,341 @@
+"""
+Receipt Validation
+==================
+
+Local checks on extracted receipts, so a misread total or date does not end up
+in every spending insight:
+
+- items (quantity * unit_price) plus tax reconcile with total_amount
+  (or the printed subtotal plus tax does, for receipts with discounts)
+- every item has a price
+- the purchase date parses and is neither in the future nor years old
+- the currency is a known ISO 4217 code and agrees with the symbols on the amounts
+
+Failing fields are read again from the image with a short, focused prompt and
+a schema holding only those fields, instead of re-running full extraction.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field, create_model, field_validator
+
+from .utils import StructuredOutputError, amount_value, generate_structured, readable_value
+
+# Totals within this much of each other reconcile (rounding, per-line tax rounding)
+RECONCILE_ABSOLUTE_TOLERANCE = 0.05
+RECONCILE_RELATIVE_TOLERANCE = 0.01
+
+# Focused re-reads per receipt; a second round covers checks that only become
+# possible after the first (e.g. totals once every item has a price)
+REEXTRACTION_ROUNDS = 2
+
+# Purchase dates further in the past than this are treated as misreads
+MAX_RECEIPT_AGE_DAYS = 5 * 365
+FUTURE_DATE_GRACE = timedelta(days=1)
+
+CURRENCY_CODES = {
+    "USD", "EUR", "GBP", "INR", "JPY", "CNY", "CAD", "AUD", "NZD", "SGD", "HKD", "CHF",
+    "SEK", "NOK", "DKK", "PLN", "CZK", "HUF", "RUB", "TRY", "BRL", "MXN", "ZAR", "AED",
+    "SAR", "QAR", "KWD", "ILS", "KRW", "THB", "MYR", "IDR", "PHP", "VND", "PKR", "BDT",
+    "LKR", "NPR", "EGP", "NGN", "KES",
+}
+
+# Symbol -> currencies it can stand for
+CURRENCY_SYMBOLS = {
+    "$": {"USD", "CAD", "AUD", "NZD", "SGD", "HKD", "MXN"},
+    "€": {"EUR"},
+    "£": {"GBP", "EGP"},
+    "₹": {"INR"},
+    "RS": {"INR", "PKR", "LKR", "NPR"},
+    "¥": {"JPY", "CNY"},
+    "₩": {"KRW"},
+    "₱": {"PHP"},
+    "฿": {"THB"},
+    "₺": {"TRY"},
+    "₪": {"ILS"},
+    "₦": {"NGN"},
+    "₫": {"VND"},
+    "R$": {"BRL"},
+    "RM": {"MYR"},
+}
+
+_CURRENCY_TOKEN_PATTERN = re.compile(r"R\$|Rs\.?|RM|[A-Z]{3}|[$€£₹¥₩₱฿₺₪₦₫]", re.IGNORECASE)
+
+AMOUNT_FIELDS = ("total_amount", "subtotal", "tax")
+
+
+@dataclass
+class ValidationIssue:
+    """A field that failed a check, and why"""
+    field: str
+    message: str
+
+
+@dataclass
+class ValidationResult:
+    receipt: Dict[str, Any]
+    issues: List[ValidationIssue]
+    reextracted: List[str] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        """Stored on the receipt document as receipt['validation']"""
+        return {
+            "status": "needs_review" if self.issues else "ok",
+            "issues": [f"{issue.field}: {issue.message}" for issue in self.issues],
+            "reextracted": self.reextracted,
+        }
+
+
+def normalize_currency(value: Any) -> Optional[str]:
+    """ISO 4217 code for a code or an unambiguous symbol, None otherwise"""
+    value = readable_value(value)
+    if not isinstance(value, str):
+        return None
+    token = value.strip().upper().rstrip(".")
+    if token in CURRENCY_CODES:
+        return token
+    candidates = CURRENCY_SYMBOLS.get(token)
+    if candidates and len(candidates) == 1:
+        return next(iter(candidates))
+    return None
+
+
+def _currency_candidates(token: str) -> Optional[Set[str]]:
+    token = token.upper().rstrip(".")
+    if token in CURRENCY_CODES:
+        return {token}
+    return CURRENCY_SYMBOLS.get(token)
+
+
+def _amount_strings(data: Dict[str, Any]):
+    for name in AMOUNT_FIELDS:
+        if isinstance(data.get(name), str):
+            yield data[name]
+    for item in data.get("items") or []:
+        if isinstance(item, dict):
+            for name in ("unit_price", "item_total_price", "tax"):
+                if isinstance(item.get(name), str):
+                    yield item[name]
+
+
+def detect_currency(data: Dict[str, Any]) -> Optional[str]:
+    """
+    Currency of raw (pre-validation) receipt data
+
+    Uses the declared currency when the symbols printed on the amounts agree with it,
+    infers it from the symbols when none was declared, and returns None when the
+    amounts use currencies that cannot be the same.
+    """
+    declared = normalize_currency(data.get("currency"))
+    possible = {declared} if declared else None
+    for text in _amount_strings(data):
+        for token in _CURRENCY_TOKEN_PATTERN.findall(text):
+            candidates = _currency_candidates(token)
+            if not candidates:
+                continue
+            possible = candidates if possible is None else possible & candidates
+            if not possible:
+                return None
+    if declared:
+        return declared
+    return next(iter(possible)) if possible and len(possible) == 1 else None
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    value = readable_value(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+def _reconciles(expected: float, total: float) -> bool:
+    tolerance = max(RECONCILE_ABSOLUTE_TOLERANCE, abs(total) * RECONCILE_RELATIVE_TOLERANCE)
+    return abs(expected - total) <= tolerance
+
+
+def _tax(receipt: Dict[str, Any]) -> float:
+    if receipt.get("tax") is not None:
+        return receipt["tax"]
+    return sum(item.get("tax") or 0.0 for item in receipt.get("items") or [])
+
+
+def validate_receipt(receipt: Dict[str, Any], now: Optional[datetime] = None) -> List[ValidationIssue]:
+    """
+    Check an extracted receipt (Receipt.model_dump() output)
+
+    Returns:
+        Issues found, empty if the receipt looks right
+    """
+    now = now or datetime.now()
+    issues = []
+    items = receipt.get("items") or []
+
+    unpriced = [index for index, item in enumerate(items) if item.get("unit_price") is None]
+    if unpriced:
+        names = ", ".join(str(items[i].get("item_name") or f"item {i + 1}") for i in unpriced)
+        issues.append(ValidationIssue("items", f"no price read for {names}"))
+
+    total = receipt.get("total_amount")
+    if total is None:
+        issues.append(ValidationIssue("total_amount", "total not read"))
+    elif items and not unpriced:
+        item_sum = sum((item.get("quantity") or 1.0) * item["unit_price"] for item in items)
+        tax = _tax(receipt)
+        subtotal = receipt.get("subtotal")
+        if not (_reconciles(item_sum + tax, total)
+                or (subtotal is not None and _reconciles(subtotal + tax, total))):
+            issues.append(ValidationIssue(
+                "total_amount",
+                f"items {item_sum:.2f} + tax {tax:.2f} = {item_sum + tax:.2f} does not match total {total:.2f}"
+            ))
+
+    timestamp = parse_timestamp(receipt.get("timestamp"))
+    if timestamp is None:
+        issues.append(ValidationIssue("timestamp", "purchase date missing or not ISO 8601"))
+    elif timestamp > now + FUTURE_DATE_GRACE:
+        issues.append(ValidationIssue("timestamp", f"purchase date {timestamp.date()} is in the future"))
+    elif timestamp < now - timedelta(days=MAX_RECEIPT_AGE_DAYS):
+        issues.append(ValidationIssue("timestamp", f"purchase date {timestamp.date()} is implausibly old"))
+
+    if normalize_currency(receipt.get("currency")) is None:
+        issues.append(ValidationIssue("currency", "currency missing, unknown or inconsistent across amounts"))
+
+    return issues
+
+
+class _ItemPrice(BaseModel):
+    index: int = Field(description="Item number from the list in the prompt")
+    quantity: Optional[float] = Field(None, description="Units purchased")
+    unit_price: Optional[float] = Field(None, description="Price per unit")
+
+    clean_amounts = field_validator("quantity", "unit_price", mode="before")(amount_value)
+
+
+# Failing field -> answer fields (type, description) asked for again
+_REEXTRACTION_FIELDS: Dict[str, List[Tuple[str, Any, str]]] = {
+    "total_amount": [
+        ("total_amount", Optional[float], "Final total the customer paid"),
+        ("subtotal", Optional[float], "Subtotal before tax, if printed"),
+        ("tax", Optional[float], "Total tax, if printed"),
+    ],
+    "items": [
+        ("item_prices", Optional[List[_ItemPrice]], "Quantity and unit price of each listed item"),
+    ],
+    "timestamp": [
+        ("timestamp", Optional[str], "Purchase date and time printed on the receipt, ISO 8601 (YYYY-MM-DDTHH:MM:SS)"),
+    ],
+    "currency": [
+        ("currency", Optional[str], "ISO 4217 code of the currency the prices are in, e.g. USD, EUR, INR"),
+    ],
+}
+
+
+def reextraction_request(receipt: Dict[str, Any], issues: List[ValidationIssue]) -> Tuple[str, type]:
+    """Focused prompt and answer schema covering only the failing fields"""
+    fields: Dict[str, Any] = {}
+    lines = [
+        "Look at this receipt image again. An earlier reading failed these checks:",
+        *[f"- {issue.field}: {issue.message}" for issue in issues],
+        "",
+        "Read ONLY the fields below directly from the image. Use null for anything that is not printed.",
+    ]
+    for issue in issues:
+        for name, annotation, description in _REEXTRACTION_FIELDS[issue.field]:
+            if name not in fields:
+                fields[name] = (annotation, Field(None, description=description))
+                lines.append(f"- {name}: {description}")
+
+    if "item_prices" in fields:
+        lines.append("Items, numbered:")
+        for index, item in enumerate(receipt.get("items") or []):
+            lines.append(f"  {index}. {item.get('item_name') or 'unnamed item'}")
+
+    schema = create_model(
+        "ReceiptFieldCorrection",
+        __validators__={
+            "clean_values": field_validator("*", mode="before")(readable_value),
+            "clean_amounts": field_validator(
+                "total_amount", "subtotal", "tax", mode="before", check_fields=False
+            )(amount_value),
+        },
+        **fields,
+    )
+    return "\n".join(lines), schema
+
+
+def merge_fields(receipt: Dict[str, Any], answer: Dict[str, Any]) -> List[str]:
+    """
+    Copy re-read values into the receipt
+
+    Returns:
+        Names of the fields that changed
+    """
+    changed = []
+    for name, value in answer.items():
+        if value is None:
+            continue
+        if name == "item_prices":
+            items = receipt.get("items") or []
+            for price in value:
+                if 0 <= price["index"] < len(items):
+                    item = items[price["index"]]
+                    for key in ("quantity", "unit_price"):
+                        if price.get(key) is not None and item.get(key) != price[key]:
+                            item[key] = price[key]
+                            item["item_total_price"] = None
+                            changed.append(f"items[{price['index']}].{key}")
+        elif name == "currency":
+            code = normalize_currency(value)
+            if code and receipt.get("currency") != code:
+                receipt["currency"] = code
+                changed.append(name)
+        elif receipt.get(name) != value:
+            receipt[name] = value
+            changed.append(name)
+    return changed
+
+
+def validate_and_repair(model, receipt: Dict[str, Any], image_bytes: Optional[bytes] = None,
+                        mime_type: Optional[str] = None) -> ValidationResult:
+    """
+    Validate a receipt and re-read failing fields from the image
+
+    Args:
+        model: Model from the LLM provider, used only when there are issues
+        receipt: Receipt.model_dump() output; updated in place
+        image_bytes: The receipt image; without it issues are only reported
+        mime_type: MIME type of image_bytes
+
+    Returns:
+        ValidationResult with the issues left after re-extraction
+    """
+    issues = validate_receipt(receipt)
+    changed: List[str] = []
+    asked: Set[str] = set()
+    for _ in range(REEXTRACTION_ROUNDS):
+        # Never ask twice for the same field; the model gave its best reading
+        pending = [issue for issue in issues if issue.field not in asked]
+        if not pending or image_bytes is None or model is None:
+            break
+        asked.update(issue.field for issue in pending)
+
+        prompt, schema = reextraction_request(receipt, pending)
+        try:
+            answer = generate_structured(model, [prompt, {"mime_type": mime_type, "data": image_bytes}], schema)
+        except StructuredOutputError as e:
+            print(f"⚠️ Field re-extraction failed: {e}")
+            break
+
+        round_changed = merge_fields(receipt, answer.model_dump())
+        changed.extend(round_changed)
+        issues = validate_receipt(receipt)
+        print(f"🔎 Re-read {', '.join(i.field for i in pending)}: changed {round_changed or 'nothing'}, "
+              f"{len(issues)} issue(s) left")
+    return ValidationResult(receipt, issues, changed)
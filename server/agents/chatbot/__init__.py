@@ -5,6 +5,11 @@ from .tools import (
     InsightCalculatorTool,
     RecommendationTool
 )
+from .context import ContextBuilderTool
+from .query_engine import SpendingQueryEngine
+from .sessions import ChatSessionStore
+from .functions import build_data_functions
+from .cache import AnswerCache
 from .config import ChatbotConfig
 
 __version__ = "1.0.0"
@@ -13,5 +18,10 @@ __all__ = [
     "FinancialDataTool", 
     "InsightCalculatorTool",
     "RecommendationTool",
+    "ContextBuilderTool",
+    "SpendingQueryEngine",
+    "ChatSessionStore",
+    "build_data_functions",
+    "AnswerCache",
     "ChatbotConfig"
 ]
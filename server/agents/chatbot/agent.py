@@ -7,10 +7,22 @@ Main agent controller for the Raseed Chatbot system
 
 import google.generativeai as genai
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Generator, Iterator, List, Optional, Tuple
 import json
+import time
 
+from agent_registry import get_daily_brief_service
+from llm_hedging import DEADLINE_REACHED, LLMDeadlineExceeded, hedged_call, hedged_stream
+from llm_provider import get_llm_provider
+from llm_usage import set_usage_user, usage_tracker
+from receipt_index import receipt_index
+
+from .cache import AnswerCache
 from .config import ChatbotConfig
+from .context import ContextBuilderTool
+from .functions import build_data_functions
+from .query_engine import SpendingQueryEngine
+from .sessions import ChatSession, ChatSessionStore
 from .tools import (
     FinancialDataTool,
     InsightCalculatorTool,
@@ -19,6 +31,17 @@ from .tools import (
 )
 
 
+class _FallbackAnswer(str):
+    """Deterministic reply sent when the model missed its deadline; never cached"""
+
+
+class _RoundHistory:
+    """Last item of a function-calling round: the conversation including the model's reply"""
+
+    def __init__(self, contents: List):
+        self.contents = contents
+
+
 class RaseedChatbotAgent:
     """
     Main Raseed Chatbot Agent
@@ -32,18 +55,25 @@ class RaseedChatbotAgent:
         self.config = ChatbotConfig()
         self.config.validate_config()
         
-        # Initialize Gemini AI
-        genai.configure(api_key=self.config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(self.config.GEMINI_MODEL)
+        # Initialize the LLM (live Gemini or the offline stub)
+        self.llm = get_llm_provider()
+        self.model = self.llm.get_model(self.config.GEMINI_MODEL)
         
         # Initialize tools
         self.financial_data_tool = FinancialDataTool()
         self.insight_calculator = InsightCalculatorTool()
         self.recommendation_tool = RecommendationTool()
         self.query_classifier = QueryClassifierTool()
+        self.context_builder = ContextBuilderTool()
+        self.query_engine = SpendingQueryEngine()
+        
+        # Per-user sessions cache data until the user's receipts change; the index itself
+        # is only built when a data question needs it
+        self.sessions = ChatSessionStore(version_provider=receipt_index.data_version)
+        self.answer_cache = AnswerCache()
         
         print(f"🤖 Raseed Chatbot Agent initialized")
-        print(f"   └─ Model: {self.config.GEMINI_MODEL}")
+        print(f"   └─ Model: {self.config.GEMINI_MODEL} ({self.llm.name})")
         print(f"   └─ Tools: Financial Data, Insights, Recommendations, Query Classifier")
     
     def process_query(self, user_message: str, uid: str) -> str:
@@ -59,43 +89,465 @@ class RaseedChatbotAgent:
         """
         try:
             print(f"\n🎯 Processing query from user {uid}: '{user_message}'")
+            set_usage_user(uid)
+            
+            session = self.sessions.get_session(uid)
+            
+            brief_reply = self._daily_brief_reply(user_message, uid)
+            if brief_reply is not None:
+                self.sessions.record_turn(session, user_message, brief_reply)
+                return brief_reply
             
             # Step 1: Classify the query using our local classifier
             needs_data = self.query_classifier.needs_financial_data(user_message)
             
-            if needs_data:
-                return self._handle_data_query(user_message, uid)
+            cache_key = self._answer_cache_key(user_message, uid, session, needs_data)
+            ttl = self.config.ANSWER_CACHE_DATA_TTL_SECONDS if needs_data else self.config.ANSWER_CACHE_GENERAL_TTL_SECONDS
+            on_late_answer = self._late_answer_handler(cache_key, ttl)
+            response_text = self.answer_cache.get(cache_key)
+            if response_text is not None:
+                print("⚡ Answer cache hit")
+                usage_tracker.record(self.config.GEMINI_MODEL, cache_hit=True)
             else:
-                return self._handle_general_query(user_message)
+                if needs_data:
+                    response_text = self._handle_data_query(user_message, uid, session, on_late_answer)
+                else:
+                    response_text = self._handle_general_query(user_message, session, on_late_answer)
+                if not isinstance(response_text, _FallbackAnswer):
+                    self.answer_cache.put(cache_key, response_text, ttl)
+            
+            self.sessions.record_turn(session, user_message, response_text)
+            return response_text
                 
         except Exception as e:
             error_msg = f"❌ I encountered an error processing your request: {str(e)}. Please try again or rephrase your question."
             print(f"💥 Error in process_query: {str(e)}")
             return error_msg
     
-    def _handle_data_query(self, user_message: str, uid: str) -> str:
-        """Handle queries that require financial data access"""
+    def stream_query(self, user_message: str, uid: str) -> Iterator[Dict]:
+        """
+        Process a user query and yield streaming events as they become available
+
+        Events are dictionaries of the form ``{"event": name, "data": payload}``:
+        ``progress`` events while data is fetched and analyzed, ``token`` events
+        carrying text chunks as Gemini generates them, and a final ``done`` event
+        with response metadata (or ``error`` if processing failed).
+
+        If the model produces nothing before the LLM deadline, the deterministic
+        fallback answer is streamed as ``token`` events instead; should the model
+        answer within the upgrade wait, an ``upgrade`` event then carries the full
+        model answer to replace it.
+
+        Args:
+            user_message: The user's input message
+            uid: User ID for data access
+
+        Yields:
+            Event dictionaries in the order they should be sent to the client
+        """
+        started = time.time()
+        metadata = {"uid": uid, "query_type": "general"}
+        first_token_at = None
+        response_parts = []
+
+        try:
+            print(f"\n🎯 Streaming query from user {uid}: '{user_message}'")
+            set_usage_user(uid)
+            yield self._progress_event("classifying", "Understanding your question...")
+            session = self.sessions.get_session(uid)
+
+            functions = None
+            needs_data = self.query_classifier.needs_financial_data(user_message)
+            cache_key = self._answer_cache_key(user_message, uid, session, needs_data)
+            ttl = self.config.ANSWER_CACHE_DATA_TTL_SECONDS if needs_data else self.config.ANSWER_CACHE_GENERAL_TTL_SECONDS
+            brief_reply = self._daily_brief_reply(user_message, uid)
+            cached_reply = self.answer_cache.get(cache_key) if brief_reply is None else None
+            metadata["cache_hit"] = cached_reply is not None
+
+            if brief_reply is not None:
+                metadata["query_type"] = "brief"
+                prompt, direct_reply = None, brief_reply
+            elif cached_reply is not None:
+                print("⚡ Answer cache hit")
+                usage_tracker.record(self.config.GEMINI_MODEL, cache_hit=True)
+                metadata["query_type"] = "data" if needs_data else "general"
+                prompt, direct_reply = None, cached_reply
+            elif needs_data:
+                metadata["query_type"] = "data"
+                prompt, direct_reply, stats, functions = yield from self._prepare_data_query(user_message, uid, session)
+                metadata.update(stats)
+            else:
+                prompt, direct_reply = self._build_general_prompt(user_message, session), None
+
+            if direct_reply is not None:
+                chunks = [direct_reply]
+            else:
+                if functions:
+                    yield self._progress_event("generating", "Looking into your data...")
+                    start_stream = lambda: self._stream_with_functions(prompt, functions, metadata)
+                else:
+                    yield self._progress_event("generating", "Crafting your answer...")
+                    start_stream = lambda: self._stream_model_text(prompt)
+                on_late_answer = self._late_answer_handler(cache_key, ttl)
+                chunks = hedged_stream(
+                    start_stream,
+                    # The function-calling loop hedges each model call itself, never the data reads
+                    hedge_after=0 if functions else None,
+                    deadline=None if self.config.DEADLINE_FALLBACK_ENABLED else 0,
+                    on_late_result=lambda items: on_late_answer("".join(i for i in items if isinstance(i, str)))
+                )
+
+            fallback_text = None
+            for text in chunks:
+                if text is DEADLINE_REACHED:
+                    print("⏱️ Model missed the deadline, streaming the fallback answer")
+                    fallback_text = self._fallback_answer(uid, session, needs_data)
+                    metadata["fallback"] = True
+                    first_token_at = time.time()
+                    yield {"event": "token", "data": {"text": fallback_text}}
+                    continue
+                if isinstance(text, dict):
+                    # Progress events from function calls
+                    if fallback_text is None:
+                        yield text
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                response_parts.append(text)
+                if fallback_text is None:
+                    yield {"event": "token", "data": {"text": text}}
+
+            response_text = "".join(response_parts)
+            if fallback_text is not None and response_text:
+                # The model answered after the fallback was sent
+                metadata["upgraded"] = True
+                yield {"event": "upgrade", "data": {"text": response_text}}
+            elif fallback_text is not None:
+                response_text = fallback_text
+            self.sessions.record_turn(session, user_message, response_text)
+            if cached_reply is None and brief_reply is None and not (fallback_text is not None and response_text == fallback_text):
+                self.answer_cache.put(cache_key, response_text, ttl)
+
+            metadata.update({
+                "timestamp": str(datetime.now()),
+                "response_chars": len(response_text),
+                "time_to_first_token_ms": round((first_token_at - started) * 1000) if first_token_at else None,
+                "elapsed_ms": round((time.time() - started) * 1000)
+            })
+            print(f"✅ Streamed response ({len(response_text)} characters, {metadata['elapsed_ms']} ms)")
+            yield {"event": "done", "data": metadata}
+
+        except Exception as e:
+            print(f"💥 Error in stream_query: {str(e)}")
+            yield {
+                "event": "error",
+                "data": {
+                    "message": f"❌ I encountered an error processing your request: {str(e)}. Please try again or rephrase your question.",
+                    "error": str(e)
+                }
+            }
+
+    @staticmethod
+    def _progress_event(stage: str, message: str) -> Dict:
+        """Build a progress event for the streaming API"""
+        return {"event": "progress", "data": {"stage": stage, "message": message}}
+
+    def _stream_model_text(self, prompt: str) -> Iterator[str]:
+        """Yield text chunks from Gemini as they are generated"""
+        for chunk in self.model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety metadata) carry nothing to show
+                continue
+            if text:
+                yield text
+
+    def _stream_with_functions(self, prompt: str, functions: List, stats: Dict) -> Iterator:
+        """
+        Run a manual function-calling loop, yielding text chunks and progress events
+
+        Text is streamed as soon as the model produces it. Function calls requested
+        by the model are executed locally and their results sent back, for at most
+        FUNCTION_CALLING_MAX_ROUNDS rounds; the final round disables function calling
+        so the model has to answer with what it has. Each round's model call is
+        hedged on its own, so a slow model never repeats the function calls.
+
+        Args:
+            prompt: Prompt for the first turn
+            functions: Data functions from build_data_functions()
+            stats: Metadata dictionary; called function names are recorded in it
+        """
+        functions_by_name = {function.__name__: function for function in functions}
+        model = self.llm.get_model(self.config.GEMINI_MODEL, tools=functions)
+        history: List = []
+        called = stats.setdefault("function_calls", [])
+        message = prompt
+
+        for round_number in range(1, self.config.FUNCTION_CALLING_MAX_ROUNDS + 1):
+            request_options = {}
+            if round_number == self.config.FUNCTION_CALLING_MAX_ROUNDS:
+                request_options["tool_config"] = {"function_calling_config": {"mode": "NONE"}}
+
+            function_calls = []
+            for item in hedged_stream(
+                lambda history=history, message=message, request_options=request_options:
+                    self._function_round(model, history, message, request_options),
+                deadline=0
+            ):
+                if isinstance(item, _RoundHistory):
+                    history = item.contents
+                elif isinstance(item, str):
+                    yield item
+                else:
+                    function_calls.append(item)
+
+            if not function_calls:
+                return
+
+            response_parts = []
+            for function_call in function_calls:
+                name = function_call.name
+                args = dict(function_call.args or {})
+                yield self._progress_event("fetching_data", f"Looking up {name.replace('_', ' ')}...")
+                print(f"   └─ Function call: {name}({json.dumps(args, default=str)})")
+                called.append(name)
+
+                function = functions_by_name.get(name)
+                try:
+                    result = function(**args) if function else {"error": f"Unknown function {name}"}
+                except Exception as e:
+                    print(f"   └─ Function {name} failed: {str(e)}")
+                    result = {"error": str(e)}
+
+                response_parts.append(genai.protos.Part(
+                    function_response=genai.protos.FunctionResponse(name=name, response={"result": result})
+                ))
+            message = response_parts
+
+    @staticmethod
+    def _function_round(model, history: List, message, request_options: Dict) -> Iterator:
+        """
+        One model call of the function-calling loop, on its own chat so it can be hedged
+
+        Yields text chunks and function calls as they arrive, then the updated
+        conversation as a _RoundHistory.
+        """
+        chat = model.start_chat(history=list(history))
+        for chunk in chat.send_message(message, stream=True, **request_options):
+            for part in chunk.parts:
+                if part.function_call and part.function_call.name:
+                    yield part.function_call
+                elif part.text:
+                    yield part.text
+        yield _RoundHistory(list(chat.history))
+
+    def _daily_brief_reply(self, user_message: str, uid: str) -> Optional[str]:
+        """Today's precomputed brief for openers like "how am I doing?", or None for other messages"""
+        if not self.config.DAILY_BRIEF_CHAT_ENABLED or not self.query_classifier.is_brief_request(user_message):
+            return None
+        try:
+            service = get_daily_brief_service()
+            print("📰 Answering from the daily brief")
+            return service.format_brief(service.get_brief(uid))
+        except Exception as e:
+            print(f"Warning: Could not load daily brief: {str(e)}")
+            return None
+
+    def _generate_within_deadline(self, generate: Callable[[], str], fallback: Callable[[], str],
+                                  on_late_answer: Optional[Callable[[str], None]] = None,
+                                  hedge: bool = True) -> str:
+        """
+        Run a blocking model call under the LLM latency SLO
+
+        The call is hedged after the hedge delay (unless hedge is False, for calls
+        that hedge their own model requests); past the deadline the deterministic
+        fallback is returned and the model's answer, once it arrives, is handed to
+        on_late_answer.
+        """
+        try:
+            return hedged_call(
+                generate,
+                hedge_after=None if hedge else 0,
+                deadline=None if self.config.DEADLINE_FALLBACK_ENABLED else 0,
+                on_late_result=on_late_answer
+            )
+        except LLMDeadlineExceeded:
+            print("⏱️ Model missed the deadline, answering with the fallback")
+            return _FallbackAnswer(fallback())
+
+    def _late_answer_handler(self, cache_key, ttl: int) -> Callable[[str], None]:
+        """Callback that upgrades the answer cache with a model answer that arrived after the deadline"""
+        def on_late_answer(text: str) -> None:
+            if text:
+                print(f"⬆️ Late model answer arrived ({len(text)} characters), upgrading cached answer")
+                self.answer_cache.put(cache_key, text, ttl)
+        return on_late_answer
+
+    def _fallback_answer(self, uid: str, session: Optional[ChatSession], needs_data: bool) -> str:
+        """Deterministic answer from computed insights and RecommendationTool output"""
+        if not needs_data:
+            return self.config.DEADLINE_GENERAL_REPLY
+
+        # Same session cache keys as an unfiltered comprehensive data query
+        financial_data = self._session_cached(
+            session, "financial_data:comprehensive:None",
+            lambda: self.financial_data_tool.get_financial_data(uid, "comprehensive")
+        )
+        if not financial_data["receipts"]:
+            return "📭 I don't see any receipt data for your account yet. Start by adding some receipts and I'll help you analyze your spending patterns!"
+        insights = self._session_cached(
+            session, "insights:comprehensive:None",
+            lambda: self.insight_calculator.calculate_comprehensive_insights(
+                financial_data["receipts"], financial_data["user_profile"]
+            )
+        )
+
+        summary = insights.get("spending_summary", {})
+        lines = [
+            "⏳ I'm still working on a detailed answer. Here's what your receipts show so far:",
+            "",
+            f"💰 You've spent ${summary.get('total_spent', 0):.2f} across {summary.get('transaction_count', 0)} receipts "
+            f"(${summary.get('average_transaction', 0):.2f} on average)."
+        ]
+        top_stores = insights.get("top_stores", {})
+        if top_stores:
+            store, amount = next(iter(top_stores.items()))
+            lines.append(f"🏪 Your top store is {store} (${amount:.2f}).")
+
+        recommendations = self.recommendation_tool.generate_savings_recommendations(insights)
+        recommendations += self.recommendation_tool.generate_budget_recommendations(insights, financial_data["user_profile"])
+        if recommendations:
+            lines += ["", "Recommendations:"] + [f"- {recommendation}" for recommendation in recommendations]
+        return "\n".join(lines)
+
+    def _answer_cache_key(self, user_message: str, uid: str, session: ChatSession, needs_data: bool):
+        """Answer cache key for a question, or None if its answer should not be cached"""
+        if not self.config.ANSWER_CACHE_ENABLED:
+            return None
+        # Follow-ups depend on earlier turns, so the same words can ask different things
+        if (session.turns or session.summary_lines) and AnswerCache.is_follow_up(user_message):
+            return None
+        if needs_data:
+            return AnswerCache.data_key(user_message, uid, session.data_version)
+        # General answers are shared across users, so only answers to a prompt without
+        # anyone's conversation history in it (see _build_general_prompt) are cached
+        if session.turns or session.summary_lines:
+            return None
+        return AnswerCache.general_key(user_message)
+
+    @staticmethod
+    def _session_cached(session: Optional[ChatSession], key: str, loader):
+        """Load data through the session cache when a session is available"""
+        return session.cached(key, loader) if session else loader()
+
+    def _load_receipts_in_range(self, uid: str, session: Optional[ChatSession], time_range: Optional[Dict]) -> List[Dict]:
+        """Receipts covering a time range, reusing the session's full receipt list when loaded"""
+        if (session and session.has_cached("receipts:all")) or not time_range:
+            return self._session_cached(
+                session, "receipts:all", lambda: self.financial_data_tool.get_receipts(uid, "all")
+            )
+        return self._session_cached(
+            session, f"receipts:{time_range['start'].isoformat()}:{time_range['end'].isoformat()}",
+            lambda: self.financial_data_tool.get_receipts(uid, "all", time_range["start"], time_range["end"])
+        )
+
+    @staticmethod
+    def _history_block(session: Optional[ChatSession]) -> str:
+        """Conversation history to include in prompts, if any"""
+        history = session.history_text() if session else ""
+        return f"\nConversation so far:\n{history}\n" if history else ""
+
+    def _prepare_data_query(self, user_message: str, uid: str,
+                            session: Optional[ChatSession] = None) -> Generator[Dict, None, Tuple[Optional[str], Optional[str], Dict, Optional[List]]]:
+        """
+        Fetch and analyze the data needed to answer a data query
+
+        This is a generator so the streaming endpoint can forward progress events
+        while data is loading; the blocking path simply drains it.
+
+        Returns:
+            Tuple of (prompt, direct_reply, stats, functions). When direct_reply is
+            set the query can be answered without calling the model and prompt is
+            None. When functions is set the prompt should be run with them so the
+            model fetches the data it needs itself.
+        """
         print(f"📊 Handling data query...")
-        
+        entities = self.query_classifier.extract_entities(user_message)
+
+        # Simple numeric questions are answered locally from receipt aggregates
+        local_query = self.query_engine.parse(user_message) if self.config.LOCAL_QUERY_ENGINE_ENABLED else None
+        if local_query:
+            yield self._progress_event("fetching_data", "Fetching your receipts...")
+            receipts = self._load_receipts_in_range(uid, session, entities["time_range"])
+            result = self.query_engine.answer(local_query, receipts)
+            if result:
+                print(f"   └─ Answered locally: {result['intent']} by {result['dimension']} ({result['count']} matches)")
+                stats = {
+                    "data_type": "local",
+                    "receipts": len(receipts),
+                    "answered_locally": True,
+                    "local_intent": result["intent"],
+                    "local_dimension": result["dimension"]
+                }
+                if self.config.LOCAL_ANSWER_LLM_PHRASING:
+                    return self._build_phrasing_prompt(user_message, result["answer"]), None, stats, None
+                return None, result["answer"], stats, None
+            print(f"   └─ Local query engine could not resolve '{local_query['target']}', using the model")
+
+        # Let the model request only the data slices it needs
+        if self.config.FUNCTION_CALLING_ENABLED:
+            functions = build_data_functions(
+                uid,
+                load_receipts=lambda start, end: self._load_receipts_in_range(
+                    uid, session, {"start": start, "end": end}
+                ),
+                load_profile=lambda: self._session_cached(
+                    session, "profile", lambda: self.financial_data_tool.get_user_profile(uid)
+                ),
+                financial_data_tool=self.financial_data_tool,
+                entities=entities
+            )
+            filters = None if entities.get("comparison") else self.query_classifier.describe_filters(entities)
+            print(f"   └─ Using function calling with {len(functions)} data functions")
+            if filters:
+                print(f"   └─ Filters: {filters}")
+            stats = {"data_type": "functions", "filters": filters}
+            return self._build_function_calling_prompt(user_message, session, filters), None, stats, functions
+
         # Determine data type needed
         data_type = self.query_classifier.classify_data_type(user_message)
         print(f"   └─ Data type required: {data_type}")
-        
-        # Get financial data using our tool
-        financial_data = self.financial_data_tool.get_financial_data(uid, data_type)
-        
+
+        # Get financial data using our tool, reading only the receipts the question is about
+        yield self._progress_event("fetching_data", "Fetching your receipts...")
+        filters = self.query_classifier.describe_filters(entities)
+        if filters:
+            print(f"   └─ Filters: {filters}")
+        financial_data = self._session_cached(
+            session, f"financial_data:{data_type}:{filters}",
+            lambda: self.financial_data_tool.get_financial_data(uid, data_type, entities)
+        )
+        stats = {"data_type": data_type, "receipts": len(financial_data["receipts"]), "filters": filters}
+
         if not financial_data["receipts"] and data_type != "profile":
-            return "📭 I don't see any receipt data for your account yet. Start by adding some receipts and I'll help you analyze your spending patterns!"
-        
+            if filters:
+                return None, f"📭 None of your receipts match {filters}. Try a different store, category or time period.", stats, None
+            return None, "📭 I don't see any receipt data for your account yet. Start by adding some receipts and I'll help you analyze your spending patterns!", stats, None
+
         # Calculate insights using our tool
+        yield self._progress_event("analyzing", "Analyzing your spending patterns...")
         insights = {}
         if financial_data["receipts"]:
-            insights = self.insight_calculator.calculate_comprehensive_insights(
-                financial_data["receipts"], 
-                financial_data["user_profile"]
+            insights = self._session_cached(
+                session, f"insights:{data_type}:{filters}",
+                lambda: self.insight_calculator.calculate_comprehensive_insights(
+                    financial_data["receipts"], 
+                    financial_data["user_profile"]
+                )
             )
             financial_data["insights"] = insights
-        
+
         # Generate recommendations using our tool
         recommendations = []
         if insights:
@@ -107,20 +559,28 @@ class RaseedChatbotAgent:
                     insights, financial_data["user_profile"]
                 )
             )
-        
-        print(f"🧠 Generating AI response with comprehensive data...")
-        print(f"   └─ Receipts: {len(financial_data['receipts'])}")
+        stats["recommendations"] = len(recommendations)
+
+        # Summaries plus only the receipts relevant to the question, within the token budget
+        context = self.context_builder.build_context(user_message, financial_data, insights)
+        stats["context_tokens"] = context["token_count"]
+        stats["context_receipts"] = context["receipts_included"]
+
+        print(f"🧠 Generating AI response with compact data context...")
+        print(f"   └─ Receipts: {len(financial_data['receipts'])} ({context['receipts_included']} in context)")
         print(f"   └─ Insights: {len(insights)} categories")
         print(f"   └─ Recommendations: {len(recommendations)}")
-        
-        # Create the analysis prompt with all the data
-        analysis_prompt = f"""{self.config.SYSTEM_PROMPT}
+        print(f"   └─ Context tokens: ~{context['token_count']} / {context['token_budget']}")
 
+        # Create the analysis prompt with the summarized data
+        analysis_prompt = f"""{self.config.SYSTEM_PROMPT}
+{self._history_block(session)}
 User asked: "{user_message}"
 
-Here's the user's financial data and analysis:
+Here's a summary of the user's financial data (amounts aggregated across {f"the receipts matching: {filters}" if filters else "all receipts"}),
+followed by the receipts most relevant to the question:
 ```json
-{json.dumps(financial_data, indent=2, default=str)}
+{context["context"]}
 ```
 
 Generated Recommendations:
@@ -137,18 +597,90 @@ As Raseed, provide a comprehensive, conversational response that:
 Focus on being practical and actionable rather than just descriptive.
 If recommendations were provided, incorporate them naturally into your response.
 """
+        return analysis_prompt, None, stats, None
+
+    def _build_function_calling_prompt(self, user_message: str, session: Optional[ChatSession] = None,
+                                       filters: Optional[str] = None) -> str:
+        """Build the prompt for answering a data query through function calls"""
+        scope = f"\nThe receipt functions only return receipts matching: {filters}.\n" if filters else ""
+        return f"""{self.config.SYSTEM_PROMPT}
+{self._history_block(session)}
+User asked: "{user_message}"
+
+Today is {datetime.now().strftime('%A, %Y-%m-%d')}.
+
+You have functions that read this user's receipts and spending analyses. Call only
+the functions (and date ranges) needed to answer this question, then answer as Raseed:
+directly, conversationally, using the specific numbers returned, with practical
+recommendations where they help. If the data is empty, say so and suggest adding receipts.
+Do not reply with "NEED_DATA"; fetch the data with the functions instead.
+{scope}"""
+
+    def _build_phrasing_prompt(self, user_message: str, computed_answer: str) -> str:
+        """Build a prompt that only rephrases a locally computed answer"""
+        return f"""{self.config.SYSTEM_PROMPT}
+
+User asked: "{user_message}"
+
+The answer has already been computed exactly from the user's receipts:
+{computed_answer}
+
+Rephrase this answer in one or two friendly sentences as Raseed.
+Do not change, round or recompute any numbers, and do not add new figures.
+"""
+
+    def _handle_data_query(self, user_message: str, uid: str, session: Optional[ChatSession] = None,
+                           on_late_answer: Optional[Callable[[str], None]] = None) -> str:
+        """Handle queries that require financial data access"""
+        preparation = self._prepare_data_query(user_message, uid, session)
+        while True:
+            try:
+                next(preparation)
+            except StopIteration as finished:
+                analysis_prompt, direct_reply, _, functions = finished.value
+                break
+
+        if direct_reply is not None:
+            return direct_reply
+
+        fallback = lambda: self._fallback_answer(uid, session, needs_data=True)
+        if functions:
+            response_text = self._generate_within_deadline(
+                lambda: "".join(
+                    chunk for chunk in self._stream_with_functions(analysis_prompt, functions, {})
+                    if isinstance(chunk, str)
+                ),
+                fallback, on_late_answer, hedge=False
+            )
+            print(f"✅ AI response generated with function calls ({len(response_text)} characters)")
+            return response_text
+
+        response_text = self._generate_within_deadline(
+            lambda: self.model.generate_content(analysis_prompt).text, fallback, on_late_answer
+        )
+        print(f"✅ AI response generated ({len(response_text)} characters)")
         
-        response = self.model.generate_content(analysis_prompt)
-        print(f"✅ AI response generated ({len(response.text)} characters)")
-        
-        return response.text
+        return response_text
     
-    def _handle_general_query(self, user_message: str) -> str:
+    def _handle_general_query(self, user_message: str, session: Optional[ChatSession] = None,
+                              on_late_answer: Optional[Callable[[str], None]] = None) -> str:
         """Handle general finance queries that don't need personal data"""
         print(f"💬 Handling general query...")
         
-        general_prompt = f"""{self.config.SYSTEM_PROMPT}
+        prompt = self._build_general_prompt(user_message, session)
+        response_text = self._generate_within_deadline(
+            lambda: self.model.generate_content(prompt).text,
+            lambda: self._fallback_answer(None, session, needs_data=False),
+            on_late_answer
+        )
+        print(f"✅ General response generated ({len(response_text)} characters)")
+        
+        return response_text
 
+    def _build_general_prompt(self, user_message: str, session: Optional[ChatSession] = None) -> str:
+        """Build the prompt for general finance queries"""
+        return f"""{self.config.SYSTEM_PROMPT}
+{self._history_block(session)}
 User asked: "{user_message}"
 
 This is a general finance question that doesn't require personal data access.
@@ -164,11 +696,6 @@ Keep your response:
 
 Provide your response directly without any prefixes.
 """
-        
-        response = self.model.generate_content(general_prompt)
-        print(f"✅ General response generated ({len(response.text)} characters)")
-        
-        return response.text
     
     def get_user_financial_summary(self, uid: str) -> Dict:
         """
@@ -247,5 +774,5 @@ def get_raseed_response(uid: str, message: str) -> str:
     Returns:
         String response from Raseed
     """
-    agent = RaseedChatbotAgent()
-    return agent.process_query(message, uid)
+    from agent_registry import get_chatbot_agent
+    return get_chatbot_agent().process_query(message, uid)
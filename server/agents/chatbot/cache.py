@@ -0,0 +1,120 @@
+"""
+Chat Answer Cache
+=================
+
+In-memory TTL + LRU cache of chat answers. General questions are keyed by
+their normalized text; data questions also by user, receipt data version and
+day, so any receipt change (or a new day for relative dates) misses the cache
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+from .config import ChatbotConfig
+
+
+# Words that do not change what is being asked
+FILLER_WORDS = {
+    'a', 'an', 'the', 'please', 'pls', 'plz', 'hey', 'hi', 'hello', 'raseed',
+    'can', 'could', 'would', 'you', 'kindly', 'just', 'me', 'tell', 'show',
+    'give', 'quick', 'quickly', 'some', 'thanks', 'thank', 'um', 'so'
+}
+
+WORD_FORMS = {
+    'spent': 'spend', 'spending': 'spend', 'spends': 'spend',
+    'tip': 'tips', 'advice': 'tips', 'suggestions': 'tips', 'recommendations': 'tips',
+    'whats': 'what', "what's": 'what', 'im': 'i', "i'm": 'i',
+    'ive': 'i', "i've": 'i', 'my': 'i', 'mine': 'i',
+    'saving': 'save', 'savings': 'save',
+}
+
+# Questions that only make sense in the context of earlier turns
+FOLLOW_UP_PATTERN = re.compile(
+    r"^(?:and|but|also|what about|how about|then)\b|\b(?:that|those|it|them|this one|the same|instead|again)\b"
+)
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question for cache lookups"""
+    words = re.findall(r"[a-z0-9$']+", question.lower())
+    words = [WORD_FORMS.get(word, word) for word in words if word not in FILLER_WORDS]
+    return ' '.join(words)
+
+
+class AnswerCache:
+    """Thread-safe TTL + LRU cache for chat answers"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or ChatbotConfig.ANSWER_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def general_key(question: str) -> Optional[Tuple]:
+        normalized = normalize_question(question)
+        return ("general", normalized) if normalized else None
+
+    @staticmethod
+    def data_key(question: str, uid: str, data_version: Any) -> Optional[Tuple]:
+        normalized = normalize_question(question)
+        if not normalized or data_version is None:
+            return None
+        return ("data", uid, data_version, date.today().isoformat(), normalized)
+
+    @staticmethod
+    def is_follow_up(question: str) -> bool:
+        """Whether the question depends on the conversation so far"""
+        return bool(FOLLOW_UP_PATTERN.search(question.lower()))
+
+    def get(self, key: Optional[Tuple]) -> Optional[Any]:
+        """Return the cached answer for key, or None if missing or expired"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Optional[Tuple], value: Any, ttl_seconds: float) -> None:
+        """Store an answer, evicting the least recently used entries beyond max_entries"""
+        if key is None or ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, uid: str) -> int:
+        """Drop all cached data answers for a user"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == "data" and key[1] == uid]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,242 @@
+"""
+Prompt Context Builder
+======================
+
+Builds compact, token-budgeted financial context for data queries
+"""
+
+import json
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .config import ChatbotConfig
+
+
+def parse_receipt_timestamp(value) -> Optional[datetime]:
+    """Parse Firestore timestamps, datetimes and ISO strings into naive datetimes"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        try:
+            return datetime.strptime(str(value)[:10], '%Y-%m-%d')
+        except ValueError:
+            return None
+
+
+def receipt_store(receipt: Dict) -> str:
+    """Get the store name of a receipt regardless of which field it was saved under"""
+    return receipt.get('store') or receipt.get('store_name') or 'Unknown'
+
+
+class ContextBuilderTool:
+    """Tool for building compact prompt context within a token budget"""
+
+    # Rough heuristic for Gemini tokenization of English text and JSON
+    CHARS_PER_TOKEN = 4
+
+    STOPWORDS = {
+        'the', 'and', 'for', 'how', 'much', 'did', 'what', 'was', 'were', 'have',
+        'has', 'had', 'spend', 'spent', 'spending', 'money', 'show', 'give', 'tell',
+        'about', 'this', 'that', 'last', 'month', 'week', 'year', 'from', 'with',
+        'many', 'times', 'buy', 'bought', 'purchase', 'purchases', 'receipts',
+        'receipt', 'total', 'you', 'your', 'are', 'can', 'all', 'any', 'often'
+    }
+
+    def __init__(self, token_budget: Optional[int] = None):
+        self.token_budget = token_budget or ChatbotConfig.PROMPT_CONTEXT_TOKEN_BUDGET
+
+    @classmethod
+    def estimate_tokens(cls, text: str) -> int:
+        """Estimate the number of model tokens in a piece of text"""
+        return -(-len(text) // cls.CHARS_PER_TOKEN)
+
+    @staticmethod
+    def serialize(data) -> str:
+        """Serialize data as compact JSON (no indentation or padding)"""
+        return json.dumps(data, separators=(',', ':'), default=str, ensure_ascii=False)
+
+    def build_context(self, user_message: str, financial_data: Dict,
+                      insights: Optional[Dict] = None,
+                      token_budget: Optional[int] = None) -> Dict:
+        """
+        Build the financial context for a data query
+
+        Args:
+            user_message: The user's question, used to select relevant receipts
+            financial_data: Output of FinancialDataTool.get_financial_data
+            insights: Output of InsightCalculatorTool.calculate_comprehensive_insights
+            token_budget: Override for the configured token budget
+
+        Returns:
+            Dictionary with the serialized context, its estimated token count and
+            how many receipts made it into the budget
+        """
+        budget = token_budget or self.token_budget
+        receipts = financial_data.get("receipts", [])
+        summary = self.build_summary(financial_data.get("user_profile"), receipts, insights or {})
+
+        # Drop the lowest-priority summary sections until the summary itself fits
+        for section in ("monthly_trend", "spending_behavior", "top_stores", "category_totals"):
+            if self.estimate_tokens(self.serialize(summary)) <= budget:
+                break
+            summary.pop(section, None)
+
+        context = {"summary": summary, "relevant_receipts": []}
+        used_tokens = self.estimate_tokens(self.serialize(context))
+
+        relevant = self.select_relevant_receipts(user_message, receipts)
+        for receipt in relevant:
+            compact_receipt = self.compact_receipt(receipt)
+            # Account for the separating comma between list entries
+            receipt_tokens = self.estimate_tokens(self.serialize(compact_receipt)) + 1
+            if used_tokens + receipt_tokens > budget:
+                break
+            context["relevant_receipts"].append(compact_receipt)
+            used_tokens += receipt_tokens
+
+        serialized = self.serialize(context)
+        return {
+            "context": serialized,
+            "token_count": self.estimate_tokens(serialized),
+            "token_budget": budget,
+            "receipts_included": len(context["relevant_receipts"]),
+            "receipts_total": len(receipts),
+            "truncated": len(context["relevant_receipts"]) < len(relevant)
+        }
+
+    def build_summary(self, user_profile: Optional[Dict], receipts: List[Dict], insights: Dict) -> Dict:
+        """Build pre-aggregated summaries from the profile, receipts and insights"""
+        top_n = ChatbotConfig.CONTEXT_TOP_N
+        summary = {}
+
+        if user_profile:
+            summary["profile"] = {
+                key: user_profile.get(key)
+                for key in ("name", "preferred_currency", "budget_monthly", "fhs_score", "savings_pct")
+                if user_profile.get(key) not in (None, "")
+            }
+
+        spending_summary = insights.get("spending_summary", {})
+        if spending_summary:
+            date_range = spending_summary.get("date_range") or {}
+            summary["totals"] = {
+                "total_spent": round(spending_summary.get("total_spent", 0), 2),
+                "transactions": spending_summary.get("transaction_count", 0),
+                "average_transaction": round(spending_summary.get("average_transaction", 0), 2),
+                "from": self._format_date(date_range.get("oldest")),
+                "to": self._format_date(date_range.get("newest"))
+            }
+
+        category_breakdown = insights.get("category_breakdown", {})
+        if category_breakdown:
+            top_categories = sorted(category_breakdown.items(), key=lambda x: x[1], reverse=True)[:top_n]
+            summary["category_totals"] = {category: round(amount, 2) for category, amount in top_categories}
+
+        top_stores = insights.get("top_stores", {})
+        if top_stores:
+            summary["top_stores"] = {store: round(amount, 2) for store, amount in list(top_stores.items())[:top_n]}
+
+        monthly_trend = self.calculate_monthly_trend(receipts)
+        if monthly_trend:
+            summary["monthly_trend"] = monthly_trend
+
+        budget_analysis = insights.get("budget_analysis", {})
+        if budget_analysis:
+            summary["budget_status"] = {
+                key: round(value, 2) if isinstance(value, float) else value
+                for key, value in budget_analysis.items()
+            }
+
+        behavior = insights.get("spending_behavior", {})
+        if behavior:
+            summary["spending_behavior"] = {
+                key: round(value, 1) if isinstance(value, float) else value
+                for key, value in behavior.items()
+            }
+
+        return summary
+
+    @staticmethod
+    def calculate_monthly_trend(receipts: List[Dict]) -> Dict:
+        """Total spend per month (YYYY-MM), most recent months only"""
+        monthly_totals = defaultdict(float)
+        for receipt in receipts:
+            timestamp = parse_receipt_timestamp(receipt.get('timestamp'))
+            if timestamp:
+                monthly_totals[timestamp.strftime('%Y-%m')] += receipt.get('total_amount', 0) or 0
+
+        recent_months = sorted(monthly_totals)[-ChatbotConfig.CONTEXT_TREND_MONTHS:]
+        return {month: round(monthly_totals[month], 2) for month in recent_months}
+
+    def select_relevant_receipts(self, user_message: str, receipts: List[Dict]) -> List[Dict]:
+        """
+        Order receipts by relevance to the question
+
+        Receipts whose store, items, brands or categories mention a term from the
+        question come first (most matches, then most recent). If nothing matches,
+        the most recent receipts are used.
+        """
+        terms = {
+            word for word in re.findall(r"[a-z0-9']+", user_message.lower())
+            if len(word) >= 3 and word not in self.STOPWORDS
+        }
+
+        def recency(receipt: Dict) -> datetime:
+            return parse_receipt_timestamp(receipt.get('timestamp')) or datetime.min
+
+        scored = []
+        if terms:
+            for receipt in receipts:
+                searchable = self._searchable_text(receipt)
+                score = sum(1 for term in terms if term in searchable)
+                if score:
+                    scored.append((score, recency(receipt), receipt))
+
+        if scored:
+            scored.sort(key=lambda x: (x[0], x[1]), reverse=True)
+            return [receipt for _, _, receipt in scored]
+
+        return sorted(receipts, key=recency, reverse=True)
+
+    def compact_receipt(self, receipt: Dict) -> Dict:
+        """Reduce a receipt to the fields the model needs, dropping inference blobs"""
+        items = []
+        for item in receipt.get('items', []) or []:
+            if not isinstance(item, dict) or not item.get('item_name'):
+                continue
+            quantity = item.get('quantity') or 1
+            unit_price = item.get('unit_price')
+            entry = f"{item['item_name']} x{quantity:g}" if isinstance(quantity, (int, float)) else item['item_name']
+            if isinstance(unit_price, (int, float)):
+                entry += f" @{unit_price:.2f}"
+            if item.get('category'):
+                entry += f" [{item['category']}]"
+            items.append(entry)
+
+        compact = {
+            "date": self._format_date(receipt.get('timestamp')),
+            "store": receipt_store(receipt),
+            "total": round(receipt.get('total_amount', 0) or 0, 2)
+        }
+        if items:
+            compact["items"] = items
+        return compact
+
+    @staticmethod
+    def _searchable_text(receipt: Dict) -> str:
+        parts = [receipt_store(receipt)]
+        for item in receipt.get('items', []) or []:
+            if isinstance(item, dict):
+                parts.extend(str(item.get(field) or '') for field in ('item_name', 'brand', 'category'))
+        return ' '.join(parts).lower()
+
+    @staticmethod
+    def _format_date(value) -> Optional[str]:
+        timestamp = parse_receipt_timestamp(value)
+        return timestamp.strftime('%Y-%m-%d') if timestamp else None
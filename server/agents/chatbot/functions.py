@@ -0,0 +1,198 @@
+"""
+Chatbot Data Functions
+======================
+
+Narrow, parameterized data-access functions exposed to Gemini through function
+calling, so the model fetches only the slices of data a question needs
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from .context import ContextBuilderTool, parse_receipt_timestamp, receipt_store
+from .tools import FinancialDataTool, InsightCalculatorTool, QueryClassifierTool
+
+
+def _insight_analyzers() -> Dict[str, Callable]:
+    """Import the insight_tools analyzers (they expect their own directory on sys.path)"""
+    insight_tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'insight_tools'))
+    if insight_tools_dir not in sys.path:
+        sys.path.append(insight_tools_dir)
+
+    from recurrent_ import analyze_purchase_patterns
+    from need_want import analyze_spending_classification
+    from micro_momen_analysist import analyze_micro_moments
+
+    return {
+        "recurring": analyze_purchase_patterns,
+        "need_want": analyze_spending_classification,
+        "micro_moment": analyze_micro_moments,
+    }
+
+
+def _json_safe(data):
+    """Function responses must be plain JSON values"""
+    return json.loads(json.dumps(data, default=str))
+
+
+def _parse_date(value: str, default: datetime) -> datetime:
+    parsed = parse_receipt_timestamp(value) if value else None
+    return parsed or default
+
+
+def build_data_functions(uid: str,
+                         load_receipts: Callable[[datetime, datetime], List[Dict]],
+                         load_profile: Callable[[], Dict],
+                         financial_data_tool: FinancialDataTool,
+                         entities: Optional[Dict] = None) -> List[Callable]:
+    """
+    Build the data functions for one user's conversation
+
+    The functions close over the user ID, so the model can only ever read the
+    current user's data.
+
+    Args:
+        uid: User ID
+        load_receipts: Returns the user's receipts from start (inclusive) to end
+            (exclusive), read with a Firestore range query (typically session cached)
+        load_profile: Returns the user's profile or None
+        financial_data_tool: Tool used for indexed purchase search
+        entities: Entities from QueryClassifierTool.extract_entities; unless the
+            question is a comparison, the receipt functions only read the question's
+            time range and only return receipts matching its store, category and amount
+
+    Returns:
+        List of plain Python functions suitable for ``GenerativeModel(tools=...)``
+    """
+    compactor = ContextBuilderTool()
+    # Comparisons need every store, category and period they mention
+    pushdown = entities if entities and not entities.get("comparison") else None
+    time_range = (pushdown or {}).get("time_range")
+
+    def receipts_between(start_date: str, end_date: str) -> List[Dict]:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        # Whole days, so repeated calls for the same dates share one cached query
+        start = _parse_date(start_date, today - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
+        # End dates are inclusive of the whole day
+        end = _parse_date(end_date, today).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        if time_range:
+            start, end = max(start, time_range["start"]), min(end, time_range["end"])
+            if start >= end:
+                return []
+        # A session that already loaded every receipt may hand back more than the range
+        return [
+            receipt for receipt in load_receipts(start, end)
+            if (timestamp := parse_receipt_timestamp(receipt.get('timestamp'))) and start <= timestamp < end
+            and (pushdown is None or QueryClassifierTool.matches_entities(receipt, pushdown))
+        ]
+
+    def spending_summary(start_date: str, end_date: str) -> dict:
+        """Total spent, number of transactions, average transaction and essential vs non-essential share between two dates.
+
+        Args:
+            start_date: First day to include, in YYYY-MM-DD format.
+            end_date: Last day to include, in YYYY-MM-DD format.
+        """
+        receipts = receipts_between(start_date, end_date)
+        return _json_safe({
+            "summary": InsightCalculatorTool.calculate_spending_summary(receipts),
+            "behavior": InsightCalculatorTool.calculate_spending_behavior(receipts),
+        })
+
+    def spend_by_category(start_date: str, end_date: str) -> dict:
+        """Total spending per category between two dates, largest first.
+
+        Args:
+            start_date: First day to include, in YYYY-MM-DD format.
+            end_date: Last day to include, in YYYY-MM-DD format.
+        """
+        breakdown = InsightCalculatorTool.calculate_category_breakdown(receipts_between(start_date, end_date))
+        return _json_safe(dict(sorted(breakdown.items(), key=lambda x: x[1], reverse=True)))
+
+    def spend_by_store(start_date: str, end_date: str, limit: int = 10) -> dict:
+        """Total spending per store between two dates, largest first.
+
+        Args:
+            start_date: First day to include, in YYYY-MM-DD format.
+            end_date: Last day to include, in YYYY-MM-DD format.
+            limit: Maximum number of stores to return.
+        """
+        stores = InsightCalculatorTool.calculate_top_stores(receipts_between(start_date, end_date))
+        return _json_safe(dict(list(stores.items())[:int(limit)]))
+
+    def list_receipts(start_date: str, end_date: str, store: str = "", limit: int = 10) -> dict:
+        """Most recent receipts between two dates with their items, optionally for one store.
+
+        Args:
+            start_date: First day to include, in YYYY-MM-DD format.
+            end_date: Last day to include, in YYYY-MM-DD format.
+            store: Only include receipts from stores whose name contains this text. Empty for all stores.
+            limit: Maximum number of receipts to return.
+        """
+        receipts = receipts_between(start_date, end_date)
+        if store:
+            receipts = [r for r in receipts if store.lower() in receipt_store(r).lower()]
+        receipts.sort(key=lambda r: parse_receipt_timestamp(r.get('timestamp')) or datetime.min, reverse=True)
+        return _json_safe({
+            "count": len(receipts),
+            "receipts": [compactor.compact_receipt(r) for r in receipts[:int(limit)]]
+        })
+
+    def search_purchases(query: str, limit: int = 10) -> dict:
+        """Find past purchases by item name, brand, category or store. Tolerates partial words and typos.
+
+        Args:
+            query: What to search for, e.g. "almond milk" or "starbucks".
+            limit: Maximum number of receipts to return.
+        """
+        return _json_safe({"results": financial_data_tool.search_purchases(uid, query, limit=int(limit))})
+
+    def budget_status() -> dict:
+        """Monthly budget, amount spent so far this calendar month and remaining budget."""
+        now = datetime.now()
+        month_start = now.strftime('%Y-%m-01')
+        receipts = receipts_between(month_start, now.strftime('%Y-%m-%d'))
+        analysis = InsightCalculatorTool.calculate_budget_analysis(receipts, load_profile())
+        return _json_safe(analysis or {"monthly_budget": None, "note": "No monthly budget set"})
+
+    def recurring_purchases() -> dict:
+        """Recurring vendors, frequently bought items and likely subscriptions over the last 6 months."""
+        result = _insight_analyzers()["recurring"](uid, include_ai=False)
+        return _json_safe({
+            key: result.get(key) for key in
+            ("subscription_candidates", "recurring_vendors", "recurring_items", "insights")
+        })
+
+    def need_vs_want() -> dict:
+        """Essential versus discretionary spending split per month over the last 6 months."""
+        result = _insight_analyzers()["need_want"](uid, include_ai=False)
+        return _json_safe({
+            key: result.get(key) for key in
+            ("essential_spending", "discretionary_spending", "breakdown", "monthly_breakdown", "insights")
+        })
+
+    def impulse_spending() -> dict:
+        """Potential impulse purchases, peak spending times and trigger stores over the last 2 months."""
+        result = _insight_analyzers()["micro_moment"](uid, include_ai=False)
+        return _json_safe({
+            "total_impulse_spending": result.get("total_impulse_spending"),
+            "impulse_indicators": result.get("impulse_indicators", [])[-10:],
+            "peak_spending_times": result.get("peak_spending_times", [])[:5],
+            "frequent_trigger_vendors": result.get("frequent_trigger_vendors"),
+            "insights": result.get("insights"),
+        })
+
+    return [
+        spending_summary,
+        spend_by_category,
+        spend_by_store,
+        list_receipts,
+        search_purchases,
+        budget_status,
+        recurring_purchases,
+        need_vs_want,
+        impulse_spending,
+    ]
@@ -0,0 +1,352 @@
+"""
+Local Spending Query Engine
+===========================
+
+Answers common numeric spending questions ("how much did I spend at Walmart
+last month") directly from receipt data, without a model call
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .context import parse_receipt_timestamp, receipt_store
+
+
+MONTH_NAMES = [
+    'january', 'february', 'march', 'april', 'may', 'june', 'july',
+    'august', 'september', 'october', 'november', 'december'
+]
+
+_MONTH_PATTERN = '|'.join(MONTH_NAMES + [name[:3] for name in MONTH_NAMES if name != 'may'])
+
+TIME_WINDOW_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?P<day>today|yesterday)"
+    r"|(?P<rel>this|last|previous|past)\s+(?P<unit>week|month|year)"
+    r"|(?:in\s+)?the\s+(?:last|past)\s+(?P<count>\d+)\s+(?P<count_unit>days?|weeks?|months?)"
+    r"|(?:last|past)\s+(?P<count2>\d+)\s+(?P<count_unit2>days?|weeks?|months?)"
+    r"|(?:in|during)\s+(?P<month>" + _MONTH_PATTERN + r")\b(?:\s+(?P<year>\d{4}))?"
+    r")\b"
+)
+
+
+def _month_start(year: int, month: int) -> datetime:
+    """First day of a month, normalizing month overflow/underflow"""
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+
+def parse_time_window(text: str, now: Optional[datetime] = None) -> Optional[Dict]:
+    """
+    Parse a relative or named time window from a question
+
+    Args:
+        text: Question text (any case)
+        now: Reference time, defaults to the current time
+
+    Returns:
+        Dictionary with ``start`` (inclusive), ``end`` (exclusive), ``label`` and
+        the matched ``span`` of the text, or None if no window is mentioned
+    """
+    now = now or datetime.now()
+    match = TIME_WINDOW_PATTERN.search(text.lower())
+    if not match:
+        return None
+
+    today = datetime(now.year, now.month, now.day)
+    groups = match.groupdict()
+
+    if groups['day'] == 'today':
+        start, end = today, today + timedelta(days=1)
+    elif groups['day'] == 'yesterday':
+        start, end = today - timedelta(days=1), today
+    elif groups['rel']:
+        unit = groups['unit']
+        is_current = groups['rel'] == 'this'
+        if unit == 'week':
+            week_start = today - timedelta(days=today.weekday())
+            start = week_start if is_current else week_start - timedelta(days=7)
+            end = start + timedelta(days=7)
+        elif unit == 'month':
+            start = _month_start(now.year, now.month if is_current else now.month - 1)
+            end = _month_start(start.year, start.month + 1)
+        else:
+            start = datetime(now.year if is_current else now.year - 1, 1, 1)
+            end = datetime(start.year + 1, 1, 1)
+    elif groups['count'] or groups['count2']:
+        count = int(groups['count'] or groups['count2'])
+        unit = (groups['count_unit'] or groups['count_unit2']).rstrip('s')
+        days = {'day': 1, 'week': 7, 'month': 30}[unit] * count
+        start, end = today - timedelta(days=days - 1), today + timedelta(days=1)
+    else:
+        month_name = groups['month']
+        month = next(i for i, name in enumerate(MONTH_NAMES, 1) if name.startswith(month_name))
+        year = int(groups['year']) if groups['year'] else now.year
+        # "in December" asked in January means last December
+        if not groups['year'] and _month_start(year, month) > now:
+            year -= 1
+        start = _month_start(year, month)
+        end = _month_start(year, month + 1)
+
+    return {
+        "start": start,
+        "end": end,
+        "label": match.group(0).strip(),
+        "span": match.span()
+    }
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(re.findall(r"[a-z0-9&']+", text.lower()))
+
+
+def _singular(word: str) -> str:
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _same_name(target: str, name: str) -> bool:
+    """Loose name match: singular forms equal or one phrase contains the other"""
+    target_norm = ' '.join(_singular(w) for w in _normalize(target).split())
+    name_norm = ' '.join(_singular(w) for w in _normalize(name).split())
+    if not target_norm or not name_norm:
+        return False
+    return target_norm == name_norm or f' {target_norm} ' in f' {name_norm} ' or f' {name_norm} ' in f' {target_norm} '
+
+
+def _number(value) -> Optional[float]:
+    """Numeric value of an amount field, or None if it is missing or unreadable"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(',', '').replace('$', '').strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _item_amount(item: Dict) -> Optional[float]:
+    """Spend on one receipt line: item_total_price, else quantity * unit_price; None if unreadable"""
+    total = _number(item.get('item_total_price'))
+    if total is not None:
+        return total
+    unit_price = _number(item.get('unit_price'))
+    if unit_price is None:
+        return None
+    return (_number(item.get('quantity')) or 1) * unit_price
+
+
+class SpendingQueryEngine:
+    """Parses numeric spending intents and answers them from receipt aggregates"""
+
+    INTENT_PATTERNS = [
+        ("average", re.compile(r"\b(?:on\s+)?average\b|\bavg\b|\btypical(?:ly)?\b|\bper\s+(?:trip|visit|receipt|purchase)\b")),
+        ("count", re.compile(r"\bhow\s+(?:many\s+(?:times|receipts|purchases|trips|visits|transactions)|often)\b|\bnumber\s+of\s+(?:times|receipts|purchases|trips|visits|transactions)\b")),
+        ("sum", re.compile(r"\bhow\s+much\b|\btotal\b|\b(?:did|have)\s+i\s+spen[dt]\b")),
+    ]
+
+    # Questions asking for reasoning or advice are left to the model
+    OPEN_ENDED_PATTERN = re.compile(
+        r"\b(?:why|should|could|would|recommend\w*|advice|tips?|suggest\w*|improve|compare|compared|"
+        r"versus|vs|trend|analy[sz]e|analysis|breakdown|budget|save|saving|savings|how\s+can|how\s+do)\b"
+    )
+
+    TARGET_PATTERN = re.compile(
+        r"\b(?P<prep>at|from|to|visit|on|for|buy|bought|purchased?|get|got)\s+(?:the\s+|my\s+|some\s+)?(?P<target>[a-z0-9&' ]+?)"
+        r"\s*(?:\b(?:in\s+total|altogether|so\s+far|overall)\b|[?.!,]|$)"
+    )
+
+    # Without a store/category/item target, a question is only about total spending if it
+    # says so ("how much did I spend", "total paid") or names a time window
+    SPEND_PATTERN = re.compile(r"\b(?:spen[dt]|spending|paid|pay|expenses?|purchases?|bought|shopping)\b")
+
+    FILLER_TARGETS = {'', 'it', 'things', 'stuff', 'everything', 'anything', 'shopping', 'purchases', 'receipts', 'me'}
+
+    def parse(self, question: str, now: Optional[datetime] = None) -> Optional[Dict]:
+        """
+        Parse a question into a numeric spending query
+
+        Args:
+            question: The user's question
+            now: Reference time for relative windows
+
+        Returns:
+            Dictionary with ``intent`` (sum/count/average), ``target`` phrase
+            (or None for all spending), ``target_hint`` and ``window``, or None
+            if the question is not a simple numeric spending question
+        """
+        text = question.lower().strip()
+        if self.OPEN_ENDED_PATTERN.search(text):
+            return None
+
+        intent = next((name for name, pattern in self.INTENT_PATTERNS if pattern.search(text)), None)
+        if not intent:
+            return None
+
+        window = parse_time_window(text, now)
+        remainder = text
+        if window:
+            start, end = window["span"]
+            remainder = f"{text[:start]} {text[end:]}"
+        for _, pattern in self.INTENT_PATTERNS:
+            remainder = pattern.sub(' ', remainder)
+        remainder = re.sub(r"\s+", ' ', remainder).strip()
+
+        target, target_hint = None, None
+        target_match = self.TARGET_PATTERN.search(remainder)
+        if target_match:
+            candidate = target_match.group('target').strip()
+            if candidate not in self.FILLER_TARGETS:
+                target = candidate
+                prep = target_match.group('prep')
+                target_hint = "store" if prep in ('at', 'from', 'to', 'visit') else "item" if prep in ('buy', 'bought', 'purchase', 'purchased', 'get', 'got') else None
+
+        # "how much money do I have left" / "how much is a latte usually" are not spend totals
+        if target is None and window is None and not self.SPEND_PATTERN.search(text):
+            return None
+
+        return {
+            "intent": intent,
+            "target": target,
+            "target_hint": target_hint,
+            "window": window
+        }
+
+    def answer(self, query: Dict, receipts: List[Dict]) -> Optional[Dict]:
+        """
+        Answer a parsed query from receipts
+
+        Args:
+            query: Output of parse()
+            receipts: The user's receipts (any superset of the window)
+
+        Returns:
+            Dictionary with the computed ``value``, ``count``, resolved
+            ``dimension``/``target`` and a ready-to-send ``answer`` string, or
+            None if the target could not be matched to the user's data or a
+            matched item has no readable price
+        """
+        window = query.get("window")
+        if window:
+            receipts = [
+                r for r in receipts
+                if (ts := parse_receipt_timestamp(r.get('timestamp'))) and window["start"] <= ts < window["end"]
+            ]
+
+        target = query.get("target")
+        if not target:
+            amounts = [r.get('total_amount', 0) or 0 for r in receipts]
+            return self._build_result(query, "all", None, amounts, len(receipts))
+
+        resolvers = {
+            "store": self._match_store,
+            "category": self._match_category,
+            "item": self._match_item,
+        }
+        order = ["store", "category", "item"]
+        if query.get("target_hint") == "item":
+            order = ["item", "category", "store"]
+
+        for dimension in order:
+            matched = resolvers[dimension](target, receipts)
+            if matched:
+                name, amounts, count = matched
+                if any(amount is None for amount in amounts):
+                    # Some matched items have no readable price; a partial sum would be wrong
+                    return None
+                return self._build_result(query, dimension, name, amounts, count)
+
+        return None
+
+    @staticmethod
+    def _match_store(target: str, receipts: List[Dict]) -> Optional[Tuple[str, List[float], int]]:
+        matches = [r for r in receipts if _same_name(target, receipt_store(r))]
+        if not matches:
+            return None
+        name = receipt_store(matches[0])
+        return name, [r.get('total_amount', 0) or 0 for r in matches], len(matches)
+
+    @staticmethod
+    def _match_category(target: str, receipts: List[Dict]) -> Optional[Tuple[str, List[Optional[float]], int]]:
+        name, amounts = None, []
+        for receipt in receipts:
+            receipt_amount, found = 0.0, False
+            for item in receipt.get('items', []) or []:
+                if isinstance(item, dict) and item.get('category') and _same_name(target, item['category']):
+                    name = name or item['category']
+                    amount = _item_amount(item)
+                    receipt_amount = None if amount is None or receipt_amount is None else receipt_amount + amount
+                    found = True
+            if not found:
+                # Fall back to the receipt-level category split
+                for category, amount in (receipt.get('gemini_inference') or {}).get('category_spend', {}).items():
+                    if _same_name(target, category):
+                        name = name or category
+                        receipt_amount += amount or 0
+                        found = True
+            if found:
+                amounts.append(receipt_amount)
+        if not amounts:
+            return None
+        return name, amounts, len(amounts)
+
+    @staticmethod
+    def _match_item(target: str, receipts: List[Dict]) -> Optional[Tuple[str, List[Optional[float]], int]]:
+        name, amounts = None, []
+        for receipt in receipts:
+            for item in receipt.get('items', []) or []:
+                if isinstance(item, dict) and item.get('item_name') and _same_name(target, item['item_name']):
+                    name = name or item['item_name']
+                    amounts.append(_item_amount(item))
+        if not amounts:
+            return None
+        return name, amounts, len(amounts)
+
+    @staticmethod
+    def _build_result(query: Dict, dimension: str, name: Optional[str], amounts: List[float], count: int) -> Dict:
+        intent = query["intent"]
+        total = round(sum(amounts), 2)
+        average = round(total / count, 2) if count else 0.0
+        value = {"sum": total, "count": count, "average": average}[intent]
+
+        window = query.get("window")
+        when = f" {window['label']}" if window else ""
+        where = {
+            "all": "",
+            "store": f" at {name}",
+            "category": f" on {name}",
+            "item": f" on {name}",
+        }[dimension]
+        unit = {"store": "visit", "item": "purchase"}.get(dimension, "receipt")
+
+        if count == 0:
+            answer = f"📭 I couldn't find any spending{where}{when}."
+        elif intent == "sum":
+            answer = f"💰 You spent ${total:,.2f}{where}{when} across {count} {unit}{'s' if count != 1 else ''}."
+        elif intent == "count" and dimension == "store":
+            answer = f"🧾 You visited {name} {count} time{'s' if count != 1 else ''}{when}, spending ${total:,.2f} in total."
+        elif intent == "count" and dimension == "item":
+            answer = f"🧾 You bought {name} {count} time{'s' if count != 1 else ''}{when}, for ${total:,.2f} in total."
+        elif intent == "count":
+            answer = f"🧾 You have {count} receipt{'s' if count != 1 else ''}{where}{when}, totalling ${total:,.2f}."
+        else:
+            answer = f"📊 On average you spent ${average:,.2f} per {unit}{where}{when} ({count} {unit}{'s' if count != 1 else ''}, ${total:,.2f} total)."
+
+        return {
+            "intent": intent,
+            "dimension": dimension,
+            "target": name,
+            "window": {"start": window["start"].isoformat(), "end": window["end"].isoformat(), "label": window["label"]} if window else None,
+            "value": value,
+            "total": total,
+            "count": count,
+            "answer": answer
+        }
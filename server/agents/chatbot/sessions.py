@@ -0,0 +1,155 @@
+"""
+Chat Sessions
+=============
+
+Per-user chat sessions that cache fetched financial data for the session and
+keep a bounded, rolling summary of the conversation
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import ChatbotConfig
+from .context import ContextBuilderTool
+
+
+class ChatSession:
+    """Conversation state and data cache for a single user"""
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.data_version: Optional[Any] = None
+        self.data_loaded_at = 0.0
+        self.last_active = time.time()
+        self.summary_lines: List[str] = []
+        self.turns: List[Tuple[str, str]] = []
+        self._cache: Dict[str, Any] = {}
+        self.lock = threading.RLock()
+
+    def cached(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, loading it on first use in this data version"""
+        with self.lock:
+            if key not in self._cache:
+                self._cache[key] = loader()
+                print(f"   └─ Session cache miss: {key}")
+            else:
+                print(f"   └─ Session cache hit: {key}")
+            return self._cache[key]
+
+    def has_cached(self, key: str) -> bool:
+        with self.lock:
+            return key in self._cache
+
+    def invalidate_data(self, version: Optional[Any]) -> None:
+        with self.lock:
+            self._cache.clear()
+            self.data_version = version
+            self.data_loaded_at = time.time()
+
+    def history_text(self) -> str:
+        """Summary of older turns followed by the most recent turns verbatim"""
+        with self.lock:
+            lines = []
+            if self.summary_lines:
+                lines.append("Earlier in this conversation:")
+                lines.extend(self.summary_lines)
+            for user_message, response in self.turns:
+                lines.append(f"User: {user_message}")
+                lines.append(f"Raseed: {response}")
+            return "\n".join(lines)
+
+
+class ChatSessionStore:
+    """
+    Store of per-user chat sessions
+
+    Cached data is dropped whenever the user's data version changes (or after
+    SESSION_DATA_TTL_SECONDS as a safety net). Conversation history is kept within
+    SESSION_HISTORY_TOKEN_BUDGET by folding older turns into one-line summaries,
+    and sessions idle longer than SESSION_IDLE_TIMEOUT_SECONDS are evicted.
+    """
+
+    def __init__(self, version_provider: Optional[Callable[[str], Any]] = None):
+        self.version_provider = version_provider
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_session(self, uid: str) -> ChatSession:
+        """Get (or start) the user's session, refreshing cached data if it is stale"""
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(uid)
+            if session is None:
+                session = ChatSession(uid)
+                self._sessions[uid] = session
+                print(f"🗂️ Started chat session for {uid} ({len(self._sessions)} active)")
+            self._sessions.move_to_end(uid)
+            while len(self._sessions) > ChatbotConfig.SESSION_MAX_ACTIVE:
+                evicted_uid, _ = self._sessions.popitem(last=False)
+                print(f"🗂️ Evicted least recently used chat session for {evicted_uid}")
+            session.last_active = now
+
+        version = self._current_version(uid)
+        data_expired = now - session.data_loaded_at > ChatbotConfig.SESSION_DATA_TTL_SECONDS
+        if version != session.data_version or data_expired:
+            session.invalidate_data(version)
+        return session
+
+    def end_session(self, uid: str) -> bool:
+        """Drop a user's session"""
+        with self._lock:
+            return self._sessions.pop(uid, None) is not None
+
+    def record_turn(self, session: ChatSession, user_message: str, response: str) -> None:
+        """Append a turn and fold the oldest turns into the summary to stay within budget"""
+        budget = ChatbotConfig.SESSION_HISTORY_TOKEN_BUDGET
+        with session.lock:
+            session.turns.append((user_message, self._truncate(response, ChatbotConfig.SESSION_TURN_MAX_CHARS)))
+
+            while session.turns and (
+                len(session.turns) > ChatbotConfig.SESSION_RECENT_TURNS
+                or ContextBuilderTool.estimate_tokens(session.history_text()) > budget
+            ):
+                oldest_message, oldest_response = session.turns.pop(0)
+                session.summary_lines.append(self._summarize_turn(oldest_message, oldest_response))
+
+            while session.summary_lines and ContextBuilderTool.estimate_tokens(session.history_text()) > budget:
+                session.summary_lines.pop(0)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _current_version(self, uid: str) -> Optional[Any]:
+        if not self.version_provider:
+            return None
+        try:
+            return self.version_provider(uid)
+        except Exception as e:
+            print(f"Warning: Could not read data version for {uid}: {e}")
+            return None
+
+    def _evict_idle(self, now: float) -> None:
+        idle_uids = [
+            uid for uid, session in self._sessions.items()
+            if now - session.last_active > ChatbotConfig.SESSION_IDLE_TIMEOUT_SECONDS
+        ]
+        for uid in idle_uids:
+            del self._sessions[uid]
+        if idle_uids:
+            print(f"🗂️ Evicted {len(idle_uids)} idle chat sessions")
+
+    @classmethod
+    def _summarize_turn(cls, user_message: str, response: str) -> str:
+        # First sentence of the answer is usually the direct answer to the question
+        first_sentence = re.split(r"(?<=[.!?])\s", response.strip(), maxsplit=1)[0]
+        return f"- Asked \"{cls._truncate(user_message, 120)}\"; answered: {cls._truncate(first_sentence, 160)}"
+
+    @staticmethod
+    def _truncate(text: str, max_chars: int) -> str:
+        text = " ".join(text.split())
+        return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
@@ -6,8 +6,13 @@ from google.cloud.firestore_v1.base_query import FieldFilter
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import json
+import re
+
+from receipt_index import receipt_index
 
 from .config import ChatbotConfig
+from .context import parse_receipt_timestamp
+from .query_engine import parse_time_window
 
 
 class DatabaseConnectionTool:
@@ -71,32 +76,36 @@ class FinancialDataTool:
             print(f"   ❌ Error fetching profile: {str(e)}")
             return None
     
-    def get_receipts(self, uid: str, data_type: str = "comprehensive") -> List[Dict]:
+    def get_receipts(self, uid: str, data_type: str = "comprehensive",
+                     start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
         """
         Get user receipts based on data type
         
         Args:
             uid: User ID
             data_type: "recent", "comprehensive", or "all"
+            start: Only receipts at or after this time (inclusive)
+            end: Only receipts before this time (exclusive)
             
         Returns:
             List of receipt dictionaries
         """
-        print(f"🧾 Fetching receipts for: {uid} (type: {data_type})")
+        window = f", {start or '…'} → {end or '…'}" if start or end else ""
+        print(f"🧾 Fetching receipts for: {uid} (type: {data_type}{window})")
         
         try:
-            query = self.db.collection(ChatbotConfig.RECEIPTS_COLLECTION).where(
-                filter=FieldFilter('uid', '==', uid)
-            )
-            
-            if data_type == "recent":
-                query = query.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(
-                    ChatbotConfig.MAX_RECEIPTS_RECENT
-                )
-            elif data_type == "comprehensive":
-                query = query.limit(ChatbotConfig.MAX_RECEIPTS_COMPREHENSIVE)
-            
-            docs = query.get()
+            if start or end:
+                try:
+                    docs = self._get_receipt_docs_in_range(uid, data_type, start, end)
+                except Exception as e:
+                    # Range queries need a composite index; filter in memory without one
+                    print(f"   ⚠️ Range query failed, filtering in memory: {str(e)}")
+                    docs = [
+                        doc for doc in self._build_receipts_query(uid, data_type).get()
+                        if self._in_range(doc.to_dict().get('timestamp'), start, end)
+                    ]
+            else:
+                docs = self._build_receipts_query(uid, data_type).get()
             
             receipts = []
             for doc in docs:
@@ -111,13 +120,76 @@ class FinancialDataTool:
             print(f"   ❌ Error fetching receipts: {str(e)}")
             return []
     
-    def get_financial_data(self, uid: str, data_type: str = "comprehensive") -> Dict:
+    def _build_receipts_query(self, uid: str, data_type: str, range_filters: Optional[List] = None):
+        query = self.db.collection(ChatbotConfig.RECEIPTS_COLLECTION).where(
+            filter=FieldFilter('uid', '==', uid)
+        )
+        for range_filter in range_filters or []:
+            query = query.where(filter=range_filter)
+        
+        if data_type == "recent":
+            query = query.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(
+                ChatbotConfig.MAX_RECEIPTS_RECENT
+            )
+        elif data_type == "comprehensive":
+            query = query.limit(ChatbotConfig.MAX_RECEIPTS_COMPREHENSIVE)
+        return query
+    
+    def _get_receipt_docs_in_range(self, uid: str, data_type: str,
+                                   start: Optional[datetime], end: Optional[datetime]) -> List:
+        """Run the receipts query with the time range applied in Firestore"""
+        # Timestamps are stored either as Firestore timestamps or as ISO 8601 strings,
+        # and range filters only match values of the bound's type, so query both forms
+        docs = {}
+        for to_bound in (lambda d: d, lambda d: d.isoformat()):
+            range_filters = []
+            if start:
+                range_filters.append(FieldFilter('timestamp', '>=', to_bound(start)))
+            if end:
+                range_filters.append(FieldFilter('timestamp', '<', to_bound(end)))
+            for doc in self._build_receipts_query(uid, data_type, range_filters).get():
+                docs[doc.id] = doc
+        
+        docs = list(docs.values())
+        if data_type == "recent":
+            docs.sort(key=lambda doc: parse_receipt_timestamp(doc.to_dict().get('timestamp')) or datetime.min, reverse=True)
+            docs = docs[:ChatbotConfig.MAX_RECEIPTS_RECENT]
+        return docs
+    
+    @staticmethod
+    def _in_range(timestamp, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        parsed = parse_receipt_timestamp(timestamp)
+        if parsed is None:
+            return False
+        return (not start or parsed >= start) and (not end or parsed < end)
+    
+    def search_purchases(self, uid: str, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Search the user's purchases by store, item, brand or category
+        
+        Args:
+            uid: User ID
+            query: Search text (prefix and fuzzy matches are allowed)
+            limit: Maximum number of receipts to return
+            
+        Returns:
+            List of matching receipt summaries with the matched items
+        """
+        print(f"🔎 Searching purchases for: {uid} ('{query}')")
+        results = receipt_index.search(uid, query, limit=limit)
+        print(f"   ✅ Found {len(results)} matching receipts")
+        return results
+    
+    def get_financial_data(self, uid: str, data_type: str = "comprehensive", entities: Optional[Dict] = None) -> Dict:
         """
         Get comprehensive financial data for a user
         
         Args:
             uid: User ID
             data_type: Type of data to retrieve
+            entities: Entities from QueryClassifierTool.extract_entities; the time
+                range is applied in the Firestore query and store, category and
+                amount filters are applied to the fetched receipts
             
         Returns:
             Dictionary containing user profile, receipts, and metadata
@@ -132,7 +204,8 @@ class FinancialDataTool:
                 "query_time": datetime.now().isoformat(),
                 "data_type": data_type,
                 "total_receipts": 0,
-                "total_spent": 0.0
+                "total_spent": 0.0,
+                "filters": None
             }
         }
         
@@ -142,7 +215,16 @@ class FinancialDataTool:
         
         # Get receipts
         if data_type in ["receipts", "recent", "comprehensive"]:
-            result["receipts"] = self.get_receipts(uid, data_type)
+            time_range = (entities or {}).get("time_range") or {}
+            receipts = self.get_receipts(uid, data_type, time_range.get("start"), time_range.get("end"))
+            
+            # Comparisons need every store/category they mention, so only the time range applies
+            if entities and not entities.get("comparison"):
+                receipts = [r for r in receipts if QueryClassifierTool.matches_entities(r, entities)]
+            result["receipts"] = receipts
+            
+            if entities:
+                result["metadata"]["filters"] = QueryClassifierTool.describe_filters(entities)
         
         # Update metadata
         result["metadata"]["total_receipts"] = len(result["receipts"])
@@ -267,16 +349,96 @@ class InsightCalculatorTool:
         }
     
     def calculate_comprehensive_insights(self, receipts: List[Dict], user_profile: Optional[Dict] = None) -> Dict:
-        """Calculate all financial insights"""
+        """
+        Calculate all financial insights in a single pass over the receipts
+        
+        Produces exactly the same result as calling calculate_spending_summary,
+        calculate_category_breakdown, calculate_spending_behavior,
+        calculate_top_stores and calculate_budget_analysis separately, without
+        traversing the receipts five times.
+        """
         if not receipts:
             return {}
         
+        total_spent = 0
+        essential_amount = 0
+        overspending_incidents = 0
+        above_market_purchases = 0
+        category_totals = {}
+        store_totals = {}
+        oldest = newest = None
+        date_range_error = None
+        
+        for receipt in receipts:
+            get = receipt.get
+            amount = get('total_amount', 0)
+            total_spent += amount
+            
+            timestamp = get('timestamp')
+            if timestamp and date_range_error is None:
+                try:
+                    if oldest is None:
+                        oldest = newest = timestamp
+                    else:
+                        if timestamp < oldest:
+                            oldest = timestamp
+                        if timestamp > newest:
+                            newest = timestamp
+                except Exception as e:
+                    date_range_error = e
+            
+            if get('overspent', False):
+                overspending_incidents += 1
+            above_market_purchases += get('above_market_items', 0)
+            
+            gemini_data = get('gemini_inference', {})
+            for category, category_amount in gemini_data.get('category_spend', {}).items():
+                category_totals[category] = category_totals.get(category, 0) + category_amount
+            essential_pct = gemini_data.get('need_vs_want_split', {}).get('essential', 50) / 100
+            essential_amount += amount * essential_pct
+            
+            store = get('store', 'Unknown')
+            store_totals[store] = store_totals.get(store, 0) + amount
+        
+        date_range = {}
+        if date_range_error is not None:
+            print(f"Warning: Could not calculate date range: {str(date_range_error)}")
+            date_range = {"oldest": None, "newest": None}
+        elif oldest is not None:
+            date_range = {"oldest": oldest, "newest": newest}
+        
+        spending_behavior = {
+            "overspending_incidents": overspending_incidents,
+            "above_market_purchases": above_market_purchases,
+            "essential_spend_pct": 0,
+            "non_essential_spend_pct": 0
+        }
+        if total_spent > 0:
+            spending_behavior["essential_spend_pct"] = (essential_amount / total_spent) * 100
+            spending_behavior["non_essential_spend_pct"] = 100 - spending_behavior["essential_spend_pct"]
+        
+        budget_analysis = {}
+        if user_profile and user_profile.get('budget_monthly'):
+            budget = user_profile['budget_monthly']
+            budget_analysis = {
+                "monthly_budget": budget,
+                "spent_vs_budget_pct": (total_spent / budget) * 100 if budget > 0 else 0,
+                "remaining_budget": budget - total_spent,
+                "is_over_budget": total_spent > budget,
+                "days_until_budget_reset": 30  # Simplified - could be calculated based on actual dates
+            }
+        
         return {
-            "spending_summary": self.calculate_spending_summary(receipts),
-            "category_breakdown": self.calculate_category_breakdown(receipts),
-            "spending_behavior": self.calculate_spending_behavior(receipts),
-            "top_stores": self.calculate_top_stores(receipts),
-            "budget_analysis": self.calculate_budget_analysis(receipts, user_profile)
+            "spending_summary": {
+                "total_spent": total_spent,
+                "average_transaction": total_spent / len(receipts),
+                "transaction_count": len(receipts),
+                "date_range": date_range
+            },
+            "category_breakdown": category_totals,
+            "spending_behavior": spending_behavior,
+            "top_stores": dict(sorted(store_totals.items(), key=lambda x: x[1], reverse=True)),
+            "budget_analysis": budget_analysis
         }
 
 
@@ -349,8 +511,15 @@ class RecommendationTool:
         return recommendations
 
 
+def _compile_phrases(phrases: List[str]) -> "re.Pattern":
+    """Single word-boundary-aware pattern matching any of the phrases"""
+    # Longest alternatives first so "i spent" wins over "spent"
+    alternatives = sorted(phrases, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(p).replace(r"\ ", r"\s+") for p in alternatives) + r")\b")
+
+
 class QueryClassifierTool:
-    """Tool for classifying user queries"""
+    """Tool for classifying user queries and extracting the entities they mention"""
     
     DATA_KEYWORDS = [
         'spent', 'spending', 'purchases', 'bought', 'receipts', 'transactions',
@@ -364,6 +533,70 @@ class QueryClassifierTool:
         'definition', 'meaning', 'guide', 'tutorial', 'best practices'
     ]
     
+    # Canonical category -> words that refer to it
+    CATEGORY_SYNONYMS = {
+        'groceries': ['grocery', 'groceries', 'supermarket', 'produce'],
+        'dining': ['dining', 'restaurant', 'restaurants', 'eating out', 'takeout', 'take out', 'food delivery'],
+        'coffee': ['coffee', 'cafe', 'cafes'],
+        'fuel': ['fuel', 'gas', 'petrol', 'gasoline'],
+        'transport': ['transport', 'transportation', 'uber', 'taxi', 'parking', 'transit'],
+        'utilities': ['utilities', 'utility', 'electricity', 'water bill', 'internet'],
+        'health': ['health', 'pharmacy', 'medicine', 'medical'],
+        'entertainment': ['entertainment', 'movies', 'games', 'concerts'],
+        'clothing': ['clothing', 'clothes', 'apparel', 'shoes'],
+        'electronics': ['electronics', 'gadgets'],
+        'household': ['household', 'home goods', 'cleaning supplies'],
+        'subscriptions': ['subscription', 'subscriptions', 'streaming'],
+    }
+    
+    # Comparisons need every store/category they mention, so only the time range is applied
+    COMPARISON_PATTERN = re.compile(r"\b(?:compare|compared|comparison|versus|vs|than|or)\b")
+    
+    STORE_PATTERN = re.compile(
+        r"\b(?:at|from)\s+(?:the\s+)?(?P<store>[a-z0-9&'][a-z0-9&' ]*?)"
+        r"(?=\s+(?:in|during|this|last|past|on|for|over|under|since|between|today|yesterday|and|or|vs|versus|compared)\b|\s*[?.!,]|\s*$)"
+    )
+    
+    AMOUNT_PATTERN = re.compile(
+        r"\b(?P<op>over|above|more\s+than|greater\s+than|at\s+least|under|below|less\s+than|at\s+most)\s+"
+        r"\$?(?P<value>\d+(?:\.\d+)?)"
+    )
+    
+    AMOUNT_OPERATORS = {
+        'over': 'gt', 'above': 'gt', 'more than': 'gt', 'greater than': 'gt', 'at least': 'gte',
+        'under': 'lt', 'below': 'lt', 'less than': 'lt', 'at most': 'lte',
+    }
+    
+    STORE_STOPWORDS = {'home', 'work', 'all', 'once', 'least', 'most', 'my', 'me', 'it', 'them'}
+    
+    # Whole-message chat openers answered by the precomputed daily brief
+    BRIEF_PATTERN = re.compile(
+        r"(?:(?:hi|hey|hello)\s+)?(?:raseed\s+)?(?:"
+        r"how\s+am\s+i\s+doing(?:\s+(?:financially|this\s+month|with\s+my\s+(?:budget|money|finances)))?"
+        r"|how(?:'s|\s+is)\s+my\s+(?:budget|spending|money)(?:\s+(?:looking|doing|going))?(?:\s+this\s+month)?"
+        r"|what(?:'s|\s+is)\s+my\s+(?:current\s+)?budget\s+status"
+        r"|(?:show\s+me\s+|check\s+)?my\s+budget\s+status"
+        r"|(?:give\s+me\s+|show\s+me\s+)?(?:a\s+|my\s+)?(?:daily\s+)?(?:financial\s+)?(?:brief|summary|overview)(?:\s+for\s+today)?"
+        r"|give\s+me\s+(?:some\s+)?recommendations\s+to\s+save\s+money(?:\s+based\s+on\s+my\s+spending)?"
+        r")"
+    )
+    
+    DATA_PATTERN = _compile_phrases(DATA_KEYWORDS)
+    GENERAL_PATTERN = _compile_phrases(GENERAL_KEYWORDS)
+    RECENT_PATTERN = _compile_phrases(['recent', 'latest', 'last few'])
+    PROFILE_PATTERN = _compile_phrases(['profile', 'budget', 'settings', 'info'])
+    # One named group per category, so match.lastgroup is the canonical category
+    CATEGORY_PATTERN = re.compile("|".join(
+        f"(?P<{category}>{_compile_phrases(synonyms).pattern})"
+        for category, synonyms in CATEGORY_SYNONYMS.items()
+    ))
+    
+    @classmethod
+    def is_brief_request(cls, query: str) -> bool:
+        """Whether the whole message is a chat opener answered by the daily brief"""
+        text = " ".join(re.sub(r"[?.!,]+", " ", query.lower().replace("’", "'")).split())
+        return bool(cls.BRIEF_PATTERN.fullmatch(text))
+    
     @classmethod
     def needs_financial_data(cls, query: str) -> bool:
         """
@@ -377,9 +610,9 @@ class QueryClassifierTool:
         """
         query_lower = query.lower()
         
-        # Check for data-related keywords
-        data_score = sum(1 for keyword in cls.DATA_KEYWORDS if keyword in query_lower)
-        general_score = sum(1 for keyword in cls.GENERAL_KEYWORDS if keyword in query_lower)
+        # Distinct whole-word/phrase matches, so "my" does not match "economy"
+        data_score = len(set(cls.DATA_PATTERN.findall(query_lower)))
+        general_score = len(set(cls.GENERAL_PATTERN.findall(query_lower)))
         
         # If more data keywords than general keywords, likely needs data
         return data_score > general_score
@@ -397,9 +630,100 @@ class QueryClassifierTool:
         """
         query_lower = query.lower()
         
-        if any(word in query_lower for word in ['recent', 'latest', 'last few']):
+        if cls.RECENT_PATTERN.search(query_lower):
             return "recent"
-        elif any(word in query_lower for word in ['profile', 'budget', 'settings', 'info']):
+        elif cls.PROFILE_PATTERN.search(query_lower):
             return "profile"
         else:
             return "comprehensive"
+    
+    @classmethod
+    def extract_entities(cls, query: str, now: Optional[datetime] = None) -> Dict:
+        """
+        Extract the time range, store, category and amount a query refers to
+        
+        Args:
+            query: User's query string
+            now: Reference time for relative time ranges
+            
+        Returns:
+            Dictionary with ``time_range`` (start/end/label or None), ``store``,
+            ``category``, ``amount`` (op/value or None) and ``comparison``
+        """
+        query_lower = query.lower()
+        time_range = parse_time_window(query_lower, now)
+        remainder = query_lower
+        if time_range:
+            start, end = time_range["span"]
+            remainder = f"{query_lower[:start]} {query_lower[end:]}"
+        
+        store = None
+        store_match = cls.STORE_PATTERN.search(remainder)
+        if store_match and store_match.group('store').strip() not in cls.STORE_STOPWORDS:
+            store = store_match.group('store').strip()
+        
+        category_match = cls.CATEGORY_PATTERN.search(remainder)
+        category = category_match.lastgroup if category_match else None
+        
+        amount = None
+        amount_match = cls.AMOUNT_PATTERN.search(remainder)
+        if amount_match:
+            operator = re.sub(r"\s+", " ", amount_match.group('op'))
+            amount = {"op": cls.AMOUNT_OPERATORS[operator], "value": float(amount_match.group('value'))}
+        
+        return {
+            "time_range": {
+                "start": time_range["start"],
+                "end": time_range["end"],
+                "label": time_range["label"]
+            } if time_range else None,
+            "store": store,
+            "category": category,
+            "amount": amount,
+            "comparison": bool(cls.COMPARISON_PATTERN.search(query_lower))
+        }
+    
+    @staticmethod
+    def describe_filters(entities: Dict) -> Optional[str]:
+        """Human-readable description of the filters applied for a query"""
+        parts = []
+        if entities.get("time_range"):
+            parts.append(entities["time_range"]["label"])
+        if not entities.get("comparison"):
+            if entities.get("store"):
+                parts.append(f"store: {entities['store']}")
+            if entities.get("category"):
+                parts.append(f"category: {entities['category']}")
+            amount = entities.get("amount")
+            if amount and amount["op"] in ("gt", "gte", "lt", "lte"):
+                symbol = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}[amount["op"]]
+                parts.append(f"total {symbol} {amount['value']:g}")
+        return ", ".join(parts) or None
+    
+    @classmethod
+    def matches_entities(cls, receipt: Dict, entities: Dict) -> bool:
+        """Whether a receipt matches the store, category and amount entities of a query"""
+        if entities.get("store"):
+            store = (receipt.get('store') or receipt.get('store_name') or '').lower()
+            # "walmart" matches "Walmart Supercenter"; an unnamed store matches nothing
+            if not store or entities["store"] not in store:
+                return False
+        
+        if entities.get("category"):
+            synonyms = cls.CATEGORY_SYNONYMS[entities["category"]] + [entities["category"]]
+            categories = [
+                str(item.get('category', '')).lower()
+                for item in receipt.get('items', []) or [] if isinstance(item, dict)
+            ]
+            categories.extend(str(c).lower() for c in ((receipt.get('gemini_inference') or {}).get('category_spend') or {}))
+            if not any(s in category for category in categories for s in synonyms):
+                return False
+        
+        amount = entities.get("amount")
+        if amount and amount["op"] in ("gt", "gte", "lt", "lte"):
+            total = receipt.get('total_amount', 0) or 0
+            value = amount["value"]
+            if not {"gt": total > value, "gte": total >= value, "lt": total < value, "lte": total <= value}[amount["op"]]:
+                return False
+        
+        return True
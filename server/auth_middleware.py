@@ -90,3 +90,13 @@ async def get_current_user(user_info: dict = Depends(AuthMiddleware.verify_token
 async def get_current_user_optional(user_info: Optional[dict] = Depends(AuthMiddleware.optional_verify_token)) -> Optional[dict]:
     """Get current authenticated user (optional)"""
     return user_info
+
+async def get_admin_user(user_info: dict = Depends(AuthMiddleware.verify_token)) -> dict:
+    """Get current authenticated user with the Firebase `admin` custom claim (required)"""
+    if user_info['firebase'].get('admin') is not True:
+        logger.warning(f"Admin access denied for user: {user_info['uid']}")
+        raise HTTPException(
+            status_code=403,
+            detail="Admin access required"
+        )
+    return user_info
@@ -0,0 +1,88 @@
+"""
+Equivalence check and benchmark for InsightCalculatorTool.calculate_comprehensive_insights
+
+The single-pass calculation must produce exactly what composing the individual
+calculators did. Run from the server directory:
+
+    python -m bench.insights_single_pass
+"""
+
+import random
+import timeit
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from agents.chatbot.tools import InsightCalculatorTool
+
+
+def insights_multipass(calculator: InsightCalculatorTool, receipts: List[Dict],
+                       user_profile: Optional[Dict] = None) -> Dict:
+    """Reference implementation using the individual calculators, one pass each"""
+    if not receipts:
+        return {}
+
+    return {
+        "spending_summary": calculator.calculate_spending_summary(receipts),
+        "category_breakdown": calculator.calculate_category_breakdown(receipts),
+        "spending_behavior": calculator.calculate_spending_behavior(receipts),
+        "top_stores": calculator.calculate_top_stores(receipts),
+        "budget_analysis": calculator.calculate_budget_analysis(receipts, user_profile)
+    }
+
+
+def synthetic_receipts(count: int, seed: int = 7) -> List[Dict]:
+    rng = random.Random(seed)
+    stores = ["Walmart", "Target", "Costco", "Starbucks", "Shell", "Amazon"]
+    categories = ["Groceries", "Dining", "Fuel", "Household", "Electronics"]
+    start = datetime(2024, 1, 1)
+    receipts = []
+    for _ in range(count):
+        receipt = {
+            "store": rng.choice(stores),
+            "total_amount": round(rng.uniform(1, 300), 2),
+            "timestamp": start + timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+            "overspent": rng.random() < 0.1,
+            "above_market_items": rng.randint(0, 2),
+            "gemini_inference": {
+                "category_spend": {c: round(rng.uniform(1, 50), 2) for c in rng.sample(categories, 2)},
+                "need_vs_want_split": {"essential": rng.randint(0, 100)}
+            }
+        }
+        if rng.random() < 0.05:
+            del receipt["store"]
+        if rng.random() < 0.05:
+            receipt["gemini_inference"] = {}
+        receipts.append(receipt)
+    return receipts
+
+
+def check_equivalence(calculator: InsightCalculatorTool) -> None:
+    profiles = [None, {"budget_monthly": 1500}, {"budget_monthly": 0}]
+    for size in (0, 1, 10, 1000):
+        for profile in profiles:
+            receipts = synthetic_receipts(size, seed=size)
+            fused = calculator.calculate_comprehensive_insights(receipts, profile)
+            reference = insights_multipass(calculator, receipts, profile)
+            assert fused == reference, f"Mismatch for {size} receipts, profile={profile}"
+            assert list(fused.get("top_stores", {})) == list(reference.get("top_stores", {}))
+    # String and datetime timestamps cannot be compared; both paths degrade the same way
+    mixed = synthetic_receipts(5) + [{"total_amount": 5, "timestamp": "2024-01-01T00:00:00"}]
+    assert calculator.calculate_comprehensive_insights(mixed) == insights_multipass(calculator, mixed)
+    print("✅ Single-pass insights match the multi-pass reference")
+
+
+def benchmark(calculator: InsightCalculatorTool) -> None:
+    profile = {"budget_monthly": 1500}
+    for size in (100, 1000, 10000):
+        receipts = synthetic_receipts(size)
+        runs = max(1, 20000 // size)
+        fused_s = timeit.timeit(lambda: calculator.calculate_comprehensive_insights(receipts, profile), number=runs) / runs
+        multi_s = timeit.timeit(lambda: insights_multipass(calculator, receipts, profile), number=runs) / runs
+        print(f"📊 {size:>6} receipts: single-pass {fused_s * 1000:.3f} ms, "
+              f"multi-pass {multi_s * 1000:.3f} ms ({multi_s / fused_s:.2f}x)")
+
+
+if __name__ == "__main__":
+    calculator = InsightCalculatorTool()
+    check_equivalence(calculator)
+    benchmark(calculator)
@@ -0,0 +1,359 @@
+# server/daily_brief.py
+# Precomputed daily financial brief per user: key metrics, recommendations and a short narrative
+#
+# Each user's brief is one Firestore document (daily_briefs/{uid}). A scheduled job rebuilds
+# the briefs of recently active users every morning, and a receipt write marks the user's
+# brief (if they have one) stale and rebuilds it shortly afterwards, so chat openers
+# ("how am I doing?") and the dashboard are answered without fetching receipts or calling
+# the model.
+#
+#   RASEED_DAILY_BRIEF_ENABLED       "false" to disable the scheduled job (default true)
+#   RASEED_DAILY_BRIEF_HOUR          local hour of the daily run (default 5)
+#   RASEED_DAILY_BRIEF_ACTIVE_DAYS   users who requested a brief within this many days are refreshed (default 14)
+#   RASEED_DAILY_BRIEF_NARRATIVE     "false" to use the rule-based narrative instead of the model (default true)
+
+import asyncio
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from agents.chatbot.config import ChatbotConfig
+from agents.chatbot.context import parse_receipt_timestamp
+from agents.chatbot.tools import FinancialDataTool, InsightCalculatorTool, RecommendationTool
+from firestore_service import firestore_service
+from llm_hedging import LLMDeadlineExceeded, hedged_call
+from llm_provider import get_llm_provider
+from llm_usage import usage_scope
+from receipt_index import receipt_index
+
+BRIEF_ENABLED = os.getenv("RASEED_DAILY_BRIEF_ENABLED", "true").lower() == "true"
+BRIEF_HOUR = int(os.getenv("RASEED_DAILY_BRIEF_HOUR", "5"))
+BRIEF_ACTIVE_DAYS = int(os.getenv("RASEED_DAILY_BRIEF_ACTIVE_DAYS", "14"))
+BRIEF_NARRATIVE_LLM = os.getenv("RASEED_DAILY_BRIEF_NARRATIVE", "true").lower() == "true"
+
+# Receipt writes within this window are folded into one rebuild
+BRIEF_REFRESH_DEBOUNCE_SECONDS = 20
+# Briefs rebuilt in parallel by the scheduled job
+BRIEF_JOB_CONCURRENCY = 4
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _sum_amounts(receipts: List[Dict]) -> float:
+    return sum(float(receipt.get('total_amount', 0) or 0) for receipt in receipts)
+
+
+class DailyBriefService:
+    """Builds, stores and serves each user's daily financial brief"""
+
+    def __init__(self):
+        self.financial_data_tool = FinancialDataTool()
+        self.insight_calculator = InsightCalculatorTool()
+        self.recommendation_tool = RecommendationTool()
+        self._briefs: Dict[str, Dict[str, Any]] = {}
+        # Receipt index version each in-memory brief was built from (None if the index was not loaded)
+        self._versions: Dict[str, Optional[int]] = {}
+        self._refresh_timers: Dict[str, threading.Timer] = {}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # Users known to have no stored brief, so their receipt writes are ignored
+        self._without_brief: Set[str] = set()
+        self._lock = threading.Lock()
+        firestore_service.add_receipt_listener(self.on_receipt_write)
+
+    # === Building ===
+
+    def build_brief(self, uid: str, force: bool = False) -> Dict[str, Any]:
+        """
+        Compute a user's brief from their receipts and store it
+
+        Concurrent calls for the same user build once; a fresh brief is returned as is.
+
+        Args:
+            uid: User ID
+            force: Rebuild even if the current brief is fresh
+
+        Returns:
+            The brief document
+        """
+        with self._lock:
+            build_lock = self._build_locks.setdefault(uid, threading.Lock())
+
+        with build_lock, usage_scope(endpoint="daily_brief", uid=uid):
+            with self._lock:
+                current = self._briefs.get(uid)
+            if not force and self._is_fresh(uid, current):
+                return current
+
+            version = receipt_index.peek_version(uid)
+            now = datetime.now()
+            month_start = _month_start(now)
+            previous_month_start = _month_start(month_start - timedelta(days=1))
+
+            receipts = self.financial_data_tool.get_receipts(uid, "all", previous_month_start, now)
+            profile = self.financial_data_tool.get_user_profile(uid)
+
+            month_receipts, previous_receipts, week_receipts = [], [], []
+            for receipt in receipts:
+                moment = parse_receipt_timestamp(receipt.get('timestamp'))
+                if moment is None:
+                    continue
+                if moment >= month_start:
+                    month_receipts.append(receipt)
+                elif moment >= previous_month_start:
+                    previous_receipts.append(receipt)
+                if moment >= now - timedelta(days=7):
+                    week_receipts.append(receipt)
+
+            insights = self.insight_calculator.calculate_comprehensive_insights(month_receipts, profile)
+            metrics = self._compute_metrics(insights, month_receipts, previous_receipts, week_receipts, profile, now)
+            recommendations = []
+            if insights:
+                recommendations.extend(self.recommendation_tool.generate_savings_recommendations(insights))
+                recommendations.extend(self.recommendation_tool.generate_budget_recommendations(insights, profile))
+
+            narrative, narrative_source = self._write_narrative(metrics, recommendations)
+            brief = {
+                "uid": uid,
+                "brief_date": now.date().isoformat(),
+                "generated_at": now,
+                "stale": False,
+                "metrics": metrics,
+                "recommendations": recommendations,
+                "narrative": narrative,
+                "narrative_source": narrative_source,
+            }
+            firestore_service.store_daily_brief(uid, brief)
+
+            with self._lock:
+                self._briefs[uid] = brief
+                self._versions[uid] = version
+                self._without_brief.discard(uid)
+            print(f"📰 Built daily brief for {uid} ({metrics['month_receipts']} receipts this month, {narrative_source} narrative)")
+            return brief
+
+    @staticmethod
+    def _compute_metrics(insights: Dict, month_receipts: List[Dict], previous_receipts: List[Dict],
+                         week_receipts: List[Dict], profile: Optional[Dict], now: datetime) -> Dict[str, Any]:
+        """Key spending metrics for the current month"""
+        month_spent = _sum_amounts(month_receipts)
+        previous_spent = _sum_amounts(previous_receipts)
+        categories = insights.get("category_breakdown", {})
+        stores = insights.get("top_stores", {})
+        behavior = insights.get("spending_behavior", {})
+
+        budget = float((profile or {}).get('budget_monthly', 0) or 0)
+        metrics = {
+            "month": now.strftime('%Y-%m'),
+            "month_spent": round(month_spent, 2),
+            "month_receipts": len(month_receipts),
+            "previous_month_spent": round(previous_spent, 2),
+            "month_change_pct": round((month_spent / previous_spent - 1) * 100, 1) if previous_spent > 0 else None,
+            "week_spent": round(_sum_amounts(week_receipts), 2),
+            "top_category": None,
+            "top_store": None,
+            "non_essential_pct": round(behavior.get("non_essential_spend_pct", 0), 1),
+            "monthly_budget": budget or None,
+            "budget_used_pct": round(month_spent / budget * 100, 1) if budget > 0 else None,
+            "budget_remaining": round(budget - month_spent, 2) if budget > 0 else None,
+            "is_over_budget": month_spent > budget if budget > 0 else False,
+        }
+        if categories:
+            name, amount = max(categories.items(), key=lambda x: x[1])
+            metrics["top_category"] = {"name": name, "amount": round(amount, 2)}
+        if stores:
+            name, amount = next(iter(stores.items()))
+            metrics["top_store"] = {"name": name, "amount": round(amount, 2)}
+        return metrics
+
+    @staticmethod
+    def rule_based_narrative(metrics: Dict[str, Any]) -> str:
+        """Short narrative built from the metrics alone"""
+        if not metrics["month_receipts"]:
+            return "No receipts yet this month. Add your receipts and I'll keep track of how you're doing."
+
+        sentences = [f"You've spent ${metrics['month_spent']:.2f} across {metrics['month_receipts']} receipts this month"]
+        if metrics["month_change_pct"] is not None:
+            direction = "up" if metrics["month_change_pct"] >= 0 else "down"
+            sentences[0] += f", {direction} {abs(metrics['month_change_pct']):.0f}% on last month's ${metrics['previous_month_spent']:.2f}"
+        sentences[0] += "."
+        if metrics["monthly_budget"]:
+            if metrics["is_over_budget"]:
+                sentences.append(f"You're over your ${metrics['monthly_budget']:.0f} budget by ${-metrics['budget_remaining']:.2f}.")
+            else:
+                sentences.append(f"You've used {metrics['budget_used_pct']:.0f}% of your ${metrics['monthly_budget']:.0f} budget, "
+                                 f"with ${metrics['budget_remaining']:.2f} left.")
+        if metrics["top_category"]:
+            sentences.append(f"Most of it went to {metrics['top_category']['name']} (${metrics['top_category']['amount']:.2f}).")
+        return " ".join(sentences)
+
+    def _write_narrative(self, metrics: Dict[str, Any], recommendations: List[str]) -> tuple:
+        """(narrative, source): written by the model when enabled and in time, otherwise rule-based"""
+        fallback = self.rule_based_narrative(metrics)
+        if not BRIEF_NARRATIVE_LLM or not metrics["month_receipts"]:
+            return fallback, "rules"
+
+        prompt = f"""{ChatbotConfig.SYSTEM_PROMPT}
+
+Write the user's daily financial brief in at most three friendly sentences, as Raseed.
+Use only these figures and do not change them:
+{metrics}
+
+Recommendations to mention briefly if relevant:
+{chr(10).join(recommendations) if recommendations else "None"}
+"""
+        try:
+            model = get_llm_provider().get_model(ChatbotConfig.GEMINI_MODEL)
+            text = hedged_call(lambda: model.generate_content(prompt).text)
+            return (text.strip(), "model") if text and text.strip() else (fallback, "rules")
+        except LLMDeadlineExceeded:
+            return fallback, "rules"
+        except Exception as e:
+            print(f"Warning: Could not write brief narrative: {e}")
+            return fallback, "rules"
+
+    # === Serving ===
+
+    def _is_fresh(self, uid: str, brief: Optional[Dict[str, Any]]) -> bool:
+        if not brief or brief.get("stale") or brief.get("brief_date") != datetime.now().date().isoformat():
+            return False
+        # Receipts written directly to Firestore show up as a new receipt index version
+        version = receipt_index.peek_version(uid)
+        return version is None or self._versions.get(uid, version) == version
+
+    def _load_brief(self, uid: str) -> Optional[Dict[str, Any]]:
+        """The user's brief from memory, or from Firestore when the in-memory one is not fresh"""
+        with self._lock:
+            brief = self._briefs.get(uid)
+        if not self._is_fresh(uid, brief):
+            brief = firestore_service.get_daily_brief(uid)
+            with self._lock:
+                if brief:
+                    self._briefs[uid] = brief
+                    self._versions.setdefault(uid, receipt_index.peek_version(uid))
+                    self._without_brief.discard(uid)
+                else:
+                    self._without_brief.add(uid)
+        return brief
+
+    @staticmethod
+    def _mark_requested(uid: str, brief: Dict[str, Any]) -> None:
+        """Mark the user as active for the scheduled job (one write per day)"""
+        today = datetime.now().date().isoformat()
+        if brief.get("last_requested_on") != today:
+            brief["last_requested_on"] = today
+            firestore_service.store_daily_brief(uid, {"last_requested_on": today, "last_requested_at": datetime.now()})
+
+    def get_brief(self, uid: str, build_if_stale: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Get today's brief for a user who asked for it
+
+        Args:
+            uid: User ID
+            build_if_stale: Rebuild a missing or stale brief; otherwise return None for it
+
+        Returns:
+            The brief document, or None
+        """
+        brief = self._load_brief(uid)
+        if brief:
+            self._mark_requested(uid, brief)
+
+        if self._is_fresh(uid, brief):
+            return brief
+        if not build_if_stale:
+            return None
+        brief = self.build_brief(uid)
+        self._mark_requested(uid, brief)
+        return brief
+
+    @staticmethod
+    def format_brief(brief: Dict[str, Any]) -> str:
+        """Chat reply for a brief"""
+        metrics = brief["metrics"]
+        lines = [f"📰 **Your daily brief** ({brief['brief_date']})", "", brief["narrative"]]
+        if metrics["month_receipts"]:
+            lines += ["", f"💰 This month: ${metrics['month_spent']:.2f} ({metrics['month_receipts']} receipts)",
+                      f"📅 Last 7 days: ${metrics['week_spent']:.2f}"]
+            if metrics["monthly_budget"]:
+                lines.append(f"🎯 Budget: {metrics['budget_used_pct']:.0f}% used, ${metrics['budget_remaining']:.2f} left")
+            if metrics["top_store"]:
+                lines.append(f"🏪 Top store: {metrics['top_store']['name']} (${metrics['top_store']['amount']:.2f})")
+        if brief.get("recommendations"):
+            lines += ["", "💡 Recommendations:"] + [f"- {recommendation}" for recommendation in brief["recommendations"]]
+        return "\n".join(lines)
+
+    # === Invalidation ===
+
+    def on_receipt_write(self, uid: str, receipt_id: str, receipt: Optional[Dict[str, Any]]) -> None:
+        """FirestoreService listener: mark the user's brief stale and rebuild it once writes settle"""
+        with self._lock:
+            known = uid in self._briefs
+            without_brief = uid in self._without_brief
+        # Users who never asked for a brief get one built when they first do
+        if without_brief or (not known and self._load_brief(uid) is None):
+            return
+
+        with self._lock:
+            brief = self._briefs.get(uid)
+            if brief is not None:
+                brief["stale"] = True
+            timer = self._refresh_timers.pop(uid, None)
+            if timer:
+                timer.cancel()
+            timer = threading.Timer(BRIEF_REFRESH_DEBOUNCE_SECONDS, self._refresh_after_write, args=(uid,))
+            timer.daemon = True
+            self._refresh_timers[uid] = timer
+        firestore_service.store_daily_brief(uid, {"stale": True})
+        timer.start()
+
+    def _refresh_after_write(self, uid: str) -> None:
+        with self._lock:
+            self._refresh_timers.pop(uid, None)
+        try:
+            self.build_brief(uid)
+        except Exception as e:
+            print(f"❌ Failed to refresh daily brief for {uid}: {e}")
+
+    # === Scheduled job ===
+
+    def active_uids(self) -> List[str]:
+        """Users who requested their brief within the last BRIEF_ACTIVE_DAYS days"""
+        return firestore_service.get_daily_brief_uids(datetime.now() - timedelta(days=BRIEF_ACTIVE_DAYS))
+
+    async def refresh_all(self) -> int:
+        """Rebuild today's brief for every active user whose brief is not fresh"""
+        uids = self.active_uids()
+        semaphore = asyncio.Semaphore(BRIEF_JOB_CONCURRENCY)
+        built = 0
+
+        async def refresh(uid: str):
+            nonlocal built
+            async with semaphore:
+                try:
+                    # Not get_brief(): the job must not count as the user requesting the brief
+                    brief = await asyncio.to_thread(self._load_brief, uid)
+                    if not self._is_fresh(uid, brief):
+                        await asyncio.to_thread(self.build_brief, uid)
+                        built += 1
+                except Exception as e:
+                    print(f"❌ Failed to build daily brief for {uid}: {e}")
+
+        await asyncio.gather(*(refresh(uid) for uid in uids))
+        print(f"📰 Daily brief job: {built} of {len(uids)} active users rebuilt")
+        return built
+
+    async def run_schedule(self) -> None:
+        """Run refresh_all every day at BRIEF_HOUR (local time)"""
+        while True:
+            now = datetime.now()
+            next_run = now.replace(hour=BRIEF_HOUR, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                print(f"❌ Daily brief job failed: {e}")
@@ -5,7 +5,7 @@ import firebase_admin
 from firebase_admin import credentials, firestore, auth
 import os
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from google.cloud import firestore as gcp_firestore
 from google.oauth2 import service_account
 
@@ -48,6 +48,9 @@ class FirestoreService:
         except Exception as e:
             print(f"Warning: Could not initialize GCP Firestore client: {e}")
             self.gcp_db = None
+        
+        # Callbacks notified after receipts are written through this service
+        self._receipt_listeners: List[Callable[[str, str, Optional[Dict[str, Any]]], None]] = []
     
     def verify_firebase_token(self, id_token: str) -> Optional[Dict[str, Any]]:
         """Verify Firebase ID token and return decoded token"""
@@ -115,6 +118,70 @@ class FirestoreService:
             print(f"Error fetching receipts for user {uid}: {e}")
             return []
     
+    def add_receipt_listener(self, listener: Callable[[str, str, Optional[Dict[str, Any]]], None]) -> None:
+        """Register listener(uid, receipt_id, receipt) to run after receipt writes (receipt is None on delete)"""
+        self._receipt_listeners.append(listener)
+    
+    def _notify_receipt_listeners(self, uid: str, receipt_id: str, receipt: Optional[Dict[str, Any]]) -> None:
+        for listener in self._receipt_listeners:
+            try:
+                listener(uid, receipt_id, receipt)
+            except Exception as e:
+                print(f"Error in receipt listener for {receipt_id}: {e}")
+    
+    def save_receipt(self, uid: str, receipt_data: Dict[str, Any], receipt_id: Optional[str] = None) -> Optional[str]:
+        """Create or overwrite a receipt for a user and return its document ID"""
+        try:
+            # Both owner fields are read by different parts of the app
+            receipt_data['uid'] = uid
+            receipt_data['user_id'] = uid
+            receipt_data['updated_at'] = datetime.now()
+            
+            receipts_ref = self.db.collection('receipts')
+            doc_ref = receipts_ref.document(receipt_id) if receipt_id else receipts_ref.document()
+            doc_ref.set(receipt_data)
+            
+            self._notify_receipt_listeners(uid, doc_ref.id, receipt_data)
+            return doc_ref.id
+        except Exception as e:
+            print(f"Error saving receipt for user {uid}: {e}")
+            return None
+    
+    def save_receipts_batch(self, receipts: List[Tuple[str, str, Dict[str, Any]]]) -> bool:
+        """
+        Create or overwrite many receipts with batched writes
+        
+        Args:
+            receipts: (uid, receipt_id, receipt_data) for each receipt
+        """
+        try:
+            # Firestore allows at most 500 writes per batch
+            for start in range(0, len(receipts), 500):
+                batch = self.db.batch()
+                for uid, receipt_id, receipt_data in receipts[start:start + 500]:
+                    receipt_data['uid'] = uid
+                    receipt_data['user_id'] = uid
+                    receipt_data['updated_at'] = datetime.now()
+                    batch.set(self.db.collection('receipts').document(receipt_id), receipt_data)
+                batch.commit()
+            
+            for uid, receipt_id, receipt_data in receipts:
+                self._notify_receipt_listeners(uid, receipt_id, receipt_data)
+            return True
+        except Exception as e:
+            print(f"Error saving batch of {len(receipts)} receipts: {e}")
+            return False
+    
+    def delete_receipt(self, uid: str, receipt_id: str) -> bool:
+        """Delete a receipt"""
+        try:
+            self.db.collection('receipts').document(receipt_id).delete()
+            self._notify_receipt_listeners(uid, receipt_id, None)
+            return True
+        except Exception as e:
+            print(f"Error deleting receipt {receipt_id} for user {uid}: {e}")
+            return False
+    
     def get_user_receipts_by_date_range(self, uid: str, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
         """Get receipts within a date range - simplified to avoid index requirements"""
         try:
@@ -217,6 +284,179 @@ class FirestoreService:
         except Exception as e:
             print(f"Error fetching insight {insight_type} for user {uid}: {e}")
             return None
+    
+    def save_processing_status(self, receipt_id: str, status_data: Dict[str, Any]) -> bool:
+        """Create or update (merge) the processing status of an uploaded receipt"""
+        try:
+            status_data['updatedAt'] = datetime.now()
+            self.db.collection('processing_status').document(receipt_id).set(status_data, merge=True)
+            return True
+        except Exception as e:
+            print(f"Error saving processing status for {receipt_id}: {e}")
+            return False
+    
+    def save_processing_statuses(self, statuses: Dict[str, Dict[str, Any]]) -> bool:
+        """Create or update (merge) the processing status of many uploaded receipts in batched writes"""
+        try:
+            receipt_ids = list(statuses)
+            # Firestore allows at most 500 writes per batch
+            for start in range(0, len(receipt_ids), 500):
+                batch = self.db.batch()
+                for receipt_id in receipt_ids[start:start + 500]:
+                    status_data = statuses[receipt_id]
+                    status_data['updatedAt'] = datetime.now()
+                    batch.set(self.db.collection('processing_status').document(receipt_id), status_data, merge=True)
+                batch.commit()
+            return True
+        except Exception as e:
+            print(f"Error saving processing status for {len(statuses)} receipts: {e}")
+            return False
+    
+    def get_processing_status(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        """Get the processing status of an uploaded receipt"""
+        try:
+            doc = self.db.collection('processing_status').document(receipt_id).get()
+            if doc.exists:
+                return doc.to_dict()
+            return None
+        except Exception as e:
+            print(f"Error fetching processing status for {receipt_id}: {e}")
+            return None
+    
+    def get_receipt(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single receipt by document ID"""
+        try:
+            doc = self.db.collection('receipts').document(receipt_id).get()
+            if doc.exists:
+                receipt = doc.to_dict()
+                receipt['id'] = doc.id
+                return receipt
+            return None
+        except Exception as e:
+            print(f"Error fetching receipt {receipt_id}: {e}")
+            return None
+    
+    def get_receipt_image_hashes(self, uid: str) -> List[Dict[str, Any]]:
+        """Image fingerprints of a user's saved receipts"""
+        try:
+            docs = self.db.collection('receipt_image_hashes').where('uid', '==', uid).stream()
+            return [doc.to_dict() for doc in docs]
+        except Exception as e:
+            print(f"Error fetching receipt image hashes for user {uid}: {e}")
+            return []
+    
+    def get_receipt_image_hash(self, uid: str, sha256: str) -> Optional[Dict[str, Any]]:
+        """Image fingerprint of a user's saved receipt with this exact image, if any"""
+        try:
+            doc = self.db.collection('receipt_image_hashes').document(f"{uid}_{sha256}").get()
+            if doc.exists:
+                return doc.to_dict()
+            return None
+        except Exception as e:
+            print(f"Error fetching receipt image hash for user {uid}: {e}")
+            return None
+    
+    def save_receipt_image_hash(self, uid: str, sha256: str, hash_data: Dict[str, Any]) -> bool:
+        """Record the image fingerprint of a saved receipt"""
+        try:
+            self.db.collection('receipt_image_hashes').document(f"{uid}_{sha256}").set(hash_data)
+            return True
+        except Exception as e:
+            print(f"Error saving receipt image hash for user {uid}: {e}")
+            return False
+    
+    def delete_receipt_image_hashes(self, uid: str, receipt_id: str) -> bool:
+        """Remove the image fingerprints of a deleted receipt"""
+        try:
+            docs = (self.db.collection('receipt_image_hashes')
+                    .where('uid', '==', uid)
+                    .where('receipt_id', '==', receipt_id)
+                    .stream())
+            for doc in docs:
+                doc.reference.delete()
+            return True
+        except Exception as e:
+            print(f"Error deleting receipt image hashes for {receipt_id}: {e}")
+            return False
+    
+    def get_ocr_cache(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Get cached extraction output for an image by content hash"""
+        try:
+            doc = self.db.collection('ocr_cache').document(sha256).get()
+            if doc.exists:
+                return doc.to_dict()
+            return None
+        except Exception as e:
+            print(f"Error fetching OCR cache entry {sha256}: {e}")
+            return None
+    
+    def store_ocr_cache(self, sha256: str, cache_data: Dict[str, Any]) -> bool:
+        """Cache extraction output for an image by content hash"""
+        try:
+            self.db.collection('ocr_cache').document(sha256).set(cache_data)
+            return True
+        except Exception as e:
+            print(f"Error storing OCR cache entry {sha256}: {e}")
+            return False
+    
+    def get_item_categories(self, item_keys: List[str]) -> Dict[str, str]:
+        """Get learned categories for normalized item names, in one batched read"""
+        try:
+            refs = [self.db.collection('item_categories').document(key) for key in item_keys]
+            return {
+                doc.id: doc.to_dict().get('category')
+                for doc in self.db.get_all(refs) if doc.exists
+            }
+        except Exception as e:
+            print(f"Error fetching item categories: {e}")
+            return {}
+
+    def save_item_categories(self, categories: Dict[str, str]) -> bool:
+        """Store learned categories for normalized item names with batched writes"""
+        try:
+            keys = list(categories)
+            # Firestore allows at most 500 writes per batch
+            for start in range(0, len(keys), 500):
+                batch = self.db.batch()
+                for key in keys[start:start + 500]:
+                    batch.set(self.db.collection('item_categories').document(key), {
+                        'category': categories[key],
+                        'updated_at': datetime.now(),
+                    })
+                batch.commit()
+            return True
+        except Exception as e:
+            print(f"Error saving {len(categories)} item categories: {e}")
+            return False
+
+    def get_daily_brief(self, uid: str) -> Optional[Dict[str, Any]]:
+        """Get a user's precomputed daily brief"""
+        try:
+            doc = self.db.collection('daily_briefs').document(uid).get()
+            if doc.exists:
+                return doc.to_dict()
+            return None
+        except Exception as e:
+            print(f"Error fetching daily brief for user {uid}: {e}")
+            return None
+    
+    def store_daily_brief(self, uid: str, brief_data: Dict[str, Any]) -> bool:
+        """Create or update (merge) a user's daily brief document"""
+        try:
+            self.db.collection('daily_briefs').document(uid).set(brief_data, merge=True)
+            return True
+        except Exception as e:
+            print(f"Error storing daily brief for user {uid}: {e}")
+            return False
+    
+    def get_daily_brief_uids(self, requested_since: datetime) -> List[str]:
+        """UIDs of users who requested their daily brief since a given time"""
+        try:
+            docs = self.db.collection('daily_briefs').where('last_requested_at', '>=', requested_since).stream()
+            return [doc.id for doc in docs]
+        except Exception as e:
+            print(f"Error listing daily brief users: {e}")
+            return []
 
 # Global instance
 firestore_service = FirestoreService()
@@ -5,6 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from utils import get_db, get_ai_model, fetch_user_receipts, parse_timestamp, safe_float, generate_ai_insight
 from collections import defaultdict, Counter
+from receipt_enrichment import is_essential
 import statistics
 
 # Score weights
@@ -42,8 +43,7 @@ def analyze_spending_patterns(receipts):
                 patterns["categories"][category] += amount
                 
                 # Essential vs non-essential based on category
-                essential_categories = {"grocery", "utilities", "health", "gas", "transport"}
-                if category in essential_categories:
+                if is_essential(category):
                     patterns["essential_vs_nonessential"]["essential"] += amount
                 else:
                     patterns["essential_vs_nonessential"]["non_essential"] += amount
@@ -6,7 +6,7 @@ from utils import get_db, fetch_user_receipts, parse_timestamp, safe_float, gene
 from collections import defaultdict
 from datetime import datetime, timedelta
 
-def analyze_micro_moments(user_id):
+def analyze_micro_moments(user_id, include_ai=True):
     """Analyze spending patterns to detect impulsive purchases and triggers"""
     receipts = list(fetch_user_receipts(user_id, 60))  # 2 months
     
@@ -130,18 +130,19 @@ def analyze_micro_moments(user_id):
         total_quick = sum(p["total"] for p in quick_succession_purchases)
         insights.append(f"🔄 {len(quick_succession_purchases)} rapid purchase sequences (${total_quick:.2f} total)")
     
-    try:
-        ai_insight = generate_ai_insight(
-            "Analyze spending triggers and suggest impulse control strategies:",
-            {
-                "impulse_indicators": impulse_indicators[-5:],  # Recent ones
-                "peak_times": peak_spending_times[:3],
-                "frequent_vendors": frequent_vendors[:3]
-            }
-        )
-        insights.append(ai_insight)
-    except:
-        pass
+    if include_ai:
+        try:
+            ai_insight = generate_ai_insight(
+                "Analyze spending triggers and suggest impulse control strategies:",
+                {
+                    "impulse_indicators": impulse_indicators[-5:],  # Recent ones
+                    "peak_times": peak_spending_times[:3],
+                    "frequent_vendors": frequent_vendors[:3]
+                }
+            )
+            insights.append(ai_insight)
+        except:
+            pass
     
     return {
         "type": "micro_moment_analysis",
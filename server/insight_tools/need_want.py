@@ -1,8 +1,9 @@
 
 from utils import get_db, get_ai_model, fetch_user_receipts, parse_timestamp, safe_float, generate_ai_insight
 from collections import defaultdict
+from receipt_enrichment import receipt_enricher
 
-def analyze_spending_classification(user_id, months_back=6):
+def analyze_spending_classification(user_id, months_back=6, include_ai=True):
     """Analyze essential vs non-essential spending patterns"""
     receipts = list(fetch_user_receipts(user_id, months_back * 30))
     
@@ -24,9 +25,9 @@ def analyze_spending_classification(user_id, months_back=6):
             if total_amount <= 0:
                 continue
             
-            # Get classification from Gemini inference
-            gemini_data = receipt.get("gemini_inference", {})
-            split = gemini_data.get("need_vs_want_split", {})
+            # Get classification from ingest-time enrichment (computed locally for older receipts)
+            gemini_data = receipt_enricher.inference(receipt)
+            split = gemini_data.get("need_vs_want_split") or {}
             
             essential_pct = safe_float(split.get("essential", 50))
             non_essential_pct = safe_float(split.get("non_essential", 50))
@@ -81,14 +82,15 @@ def analyze_spending_classification(user_id, months_back=6):
             insights.append("🚨 High non-essential spending detected")
         
         # AI-generated insights
-        try:
-            ai_insight = generate_ai_insight(
-                "Analyze spending patterns and provide actionable advice:",
-                f"Essential: ${total_essential:.2f} ({essential_ratio:.1f}%), Non-essential: ${total_non_essential:.2f} ({100-essential_ratio:.1f}%)"
-            )
-            insights.append(ai_insight)
-        except:
-            pass
+        if include_ai:
+            try:
+                ai_insight = generate_ai_insight(
+                    "Analyze spending patterns and provide actionable advice:",
+                    f"Essential: ${total_essential:.2f} ({essential_ratio:.1f}%), Non-essential: ${total_non_essential:.2f} ({100-essential_ratio:.1f}%)"
+                )
+                insights.append(ai_insight)
+            except:
+                pass
     
     return {
         "type": "need_vs_want_analysis",
@@ -5,7 +5,7 @@ from utils import get_db, fetch_user_receipts, parse_timestamp, safe_float, gene
 from collections import defaultdict
 from datetime import datetime, timedelta
 
-def analyze_purchase_patterns(user_id):
+def analyze_purchase_patterns(user_id, include_ai=True):
     """Analyze recurring purchase patterns and subscription detection"""
     receipts = list(fetch_user_receipts(user_id, 180))  # 6 months
     
@@ -134,18 +134,19 @@ def analyze_purchase_patterns(user_id):
         elif recent_avg < older_avg * 0.9:
             insights.append(f"📉 Spending decreased: ${recent_avg:.2f}/month (down {((1-recent_avg/older_avg)*100):.1f}%)")
     
-    try:
-        ai_insight = generate_ai_insight(
-            "Analyze recurring purchase patterns and suggest optimizations:",
-            {
-                "subscriptions": subscription_candidates,
-                "top_vendors": recurring_vendors[:3],
-                "frequent_items": recurring_items[:5]
-            }
-        )
-        insights.append(ai_insight)
-    except:
-        pass
+    if include_ai:
+        try:
+            ai_insight = generate_ai_insight(
+                "Analyze recurring purchase patterns and suggest optimizations:",
+                {
+                    "subscriptions": subscription_candidates,
+                    "top_vendors": recurring_vendors[:3],
+                    "frequent_items": recurring_items[:5]
+                }
+            )
+            insights.append(ai_insight)
+        except:
+            pass
     
     return {
         "type": "recurring_patterns",
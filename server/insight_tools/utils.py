@@ -1,11 +1,13 @@
 """
 Shared utilities for insight tools - enhanced with proper Firestore integration
 """
+import hashlib
 import os
 import sys
+import threading
+import time
 from datetime import datetime, timedelta
 from collections import defaultdict
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,9 +16,16 @@ load_dotenv()
 # Add parent directory to path to import firestore_service
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from firestore_service import firestore_service
+from llm_provider import get_llm_provider
+from llm_hedging import LLMDeadlineExceeded, hedged_call
 
 _model = None
 
+# AI insights that arrived after the deadline, served to the next identical request
+LATE_INSIGHT_TTL_SECONDS = 3600
+_late_insights = {}
+_late_insights_lock = threading.Lock()
+
 def get_db():
     """Get Firestore service instance"""
     return firestore_service
@@ -25,13 +34,8 @@ def get_ai_model():
     """Get configured AI model"""
     global _model
     if _model is None:
-        # Use environment variable for API key
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable not set")
-        
-        genai.configure(api_key=api_key)
-        _model = genai.GenerativeModel("models/gemini-2.0-flash")
+        # Live Gemini (GEMINI_API_KEY) or the offline stub, per RASEED_LLM_PROVIDER
+        _model = get_llm_provider().get_model("models/gemini-2.0-flash")
     return _model
 
 def fetch_user_receipts(user_id, days_back=180):
@@ -67,8 +71,27 @@ def safe_float(value, default=0.0):
     except (ValueError, TypeError):
         return default
 
+def _store_late_insight(key, text):
+    with _late_insights_lock:
+        now = time.time()
+        for stale in [k for k, (_, at) in _late_insights.items() if now - at > LATE_INSIGHT_TTL_SECONDS]:
+            del _late_insights[stale]
+        _late_insights[key] = (text, now)
+
+def _pop_late_insight(key):
+    with _late_insights_lock:
+        text, at = _late_insights.pop(key, (None, 0))
+    return text if text and time.time() - at <= LATE_INSIGHT_TTL_SECONDS else None
+
 def generate_ai_insight(prompt, context_data):
-    """Generate AI insight with error handling"""
+    """
+    Generate AI insight with error handling
+
+    The model call is hedged and bounded by the LLM deadline (see llm_hedging).
+    On the deadline LLMDeadlineExceeded is raised so the analyzer returns its
+    rule-based insights; the late answer is kept and returned to the next
+    request with the same data.
+    """
     try:
         model = get_ai_model()
         
@@ -77,8 +100,20 @@ def generate_ai_insight(prompt, context_data):
             context_data = context_data[:10]
         
         full_prompt = f"{prompt}\n\nData: {context_data}"
-        response = model.generate_content(full_prompt)
-        return response.text if response.text else "No insight generated"
+        key = hashlib.sha256(full_prompt.encode("utf-8")).hexdigest()
+        late = _pop_late_insight(key)
+        if late:
+            return late
+
+        def on_late_result(text):
+            if text:
+                _store_late_insight(key, text)
+
+        text = hedged_call(lambda: model.generate_content(full_prompt).text, on_late_result=on_late_result)
+        return text if text else "No insight generated"
+    except LLMDeadlineExceeded:
+        print("⏱️ AI insight missed the deadline, returning rule-based insights")
+        raise
     except Exception as e:
         return f"AI analysis unavailable: {str(e)}"
 
@@ -0,0 +1,292 @@
+# server/llm_hedging.py
+# Latency SLOs for model calls: hedged duplicate requests and hard deadlines
+#
+# A model call that has not answered after RASEED_LLM_HEDGE_AFTER_MS gets a duplicate
+# ("hedged") request, and whichever attempt answers first wins. If neither has answered
+# by RASEED_LLM_DEADLINE_MS the caller falls back to deterministic content; the model's
+# answer is still collected in the background and handed to an upgrade callback.
+#
+#   RASEED_LLM_HEDGE_AFTER_MS    delay before the hedged request (default 4000, 0 disables hedging)
+#   RASEED_LLM_DEADLINE_MS       hard deadline for the first output (default 12000, 0 disables)
+#   RASEED_LLM_UPGRADE_WAIT_MS   how long a stream keeps waiting to upgrade a fallback (default 30000)
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, List, Optional
+
+HEDGE_AFTER_SECONDS = int(os.getenv("RASEED_LLM_HEDGE_AFTER_MS", "4000")) / 1000
+DEADLINE_SECONDS = int(os.getenv("RASEED_LLM_DEADLINE_MS", "12000")) / 1000
+UPGRADE_WAIT_SECONDS = int(os.getenv("RASEED_LLM_UPGRADE_WAIT_MS", "30000")) / 1000
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RASEED_LLM_HEDGE_WORKERS", "32")),
+    thread_name_prefix="llm-hedge"
+)
+
+
+class LLMDeadlineExceeded(Exception):
+    """No model attempt answered before the deadline"""
+
+
+class _DeadlineReached:
+    def __repr__(self):
+        return "DEADLINE_REACHED"
+
+
+# Yielded once by hedged_stream when the deadline passes without any output
+DEADLINE_REACHED = _DeadlineReached()
+
+
+def _submit(fn: Callable[[], Any]) -> Future:
+    # Carry the caller's context (e.g. llm_usage attribution) into the worker thread
+    return _executor.submit(contextvars.copy_context().run, fn)
+
+
+def hedged_call(fn: Callable[[], Any],
+                hedge_after: Optional[float] = None,
+                deadline: Optional[float] = None,
+                on_late_result: Optional[Callable[[Any], None]] = None) -> Any:
+    """
+    Run a blocking model call with a hedged duplicate and a hard deadline
+
+    Args:
+        fn: The call to make; must be safe to run twice
+        hedge_after: Seconds before issuing the duplicate (default HEDGE_AFTER_SECONDS, 0 disables)
+        deadline: Seconds before giving up (default DEADLINE_SECONDS, 0 waits indefinitely)
+        on_late_result: Called with the first successful result if it arrives after the deadline
+
+    Returns:
+        The first successful result
+
+    Raises:
+        LLMDeadlineExceeded: No attempt succeeded before the deadline
+        Exception: The error of the last attempt, if every attempt failed
+    """
+    hedge_after = HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+    deadline = DEADLINE_SECONDS if deadline is None else deadline
+
+    started = time.monotonic()
+    pending = {_submit(fn)}
+    hedged = not hedge_after
+    last_error: Optional[BaseException] = None
+
+    while True:
+        elapsed = time.monotonic() - started
+        timers = [t for t in ((None if hedged else hedge_after), (deadline or None)) if t is not None]
+        timeout = max(0.0, min(timers) - elapsed) if timers else None
+
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            last_error = future.exception()
+
+        elapsed = time.monotonic() - started
+        if not hedged and (elapsed >= hedge_after or not pending):
+            # Hedge a slow attempt, or retry a failed one once
+            print(f"⏱️ Model call slow or failed after {elapsed:.1f}s, issuing hedged request")
+            pending.add(_submit(fn))
+            hedged = True
+        elif not pending:
+            raise last_error
+
+        if deadline and time.monotonic() - started >= deadline:
+            if on_late_result:
+                _deliver_late(pending, on_late_result)
+            raise LLMDeadlineExceeded(f"No model response within {deadline:.1f}s")
+
+
+def _deliver_late(futures, on_late_result: Callable[[Any], None]) -> None:
+    """Hand the first successful late result to the callback"""
+    delivered = threading.Event()
+    lock = threading.Lock()
+
+    def on_done(future: Future):
+        if future.exception() is not None:
+            return
+        with lock:
+            if delivered.is_set():
+                return
+            delivered.set()
+        try:
+            on_late_result(future.result())
+        except Exception as e:
+            print(f"Warning: Late model result callback failed: {e}")
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+class _StreamRace:
+    """Shared state of the attempts racing to stream one answer"""
+
+    def __init__(self, on_late_result: Optional[Callable[[List[Any]], None]]):
+        self.events: "queue.Queue" = queue.Queue()
+        self.lock = threading.Lock()
+        self.winner: Optional[int] = None
+        self.cancelled: set = set()
+        self.detached = False
+        self.late_delivered = False
+        self.on_late_result = on_late_result
+
+    def run_attempt(self, attempt: int, start_stream: Callable[[], Iterator]) -> None:
+        items = []
+        try:
+            stream = start_stream()
+            try:
+                for item in stream:
+                    if attempt in self.cancelled:
+                        return
+                    items.append(item)
+                    self.events.put((attempt, "item", item))
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+        except Exception as e:
+            self.events.put((attempt, "error", e))
+            return
+
+        self.events.put((attempt, "end", None))
+        with self.lock:
+            deliver = self.detached and not self.late_delivered and self.winner in (None, attempt)
+            if deliver:
+                self.late_delivered = True
+        if deliver and self.on_late_result:
+            try:
+                self.on_late_result(items)
+            except Exception as e:
+                print(f"Warning: Late model result callback failed: {e}")
+
+
+def hedged_stream(start_stream: Callable[[], Iterator],
+                  hedge_after: Optional[float] = None,
+                  deadline: Optional[float] = None,
+                  upgrade_wait: Optional[float] = None,
+                  on_late_result: Optional[Callable[[List[Any]], None]] = None) -> Iterator:
+    """
+    Stream a model answer with a hedged duplicate and a deadline for the first output
+
+    Items from the first attempt to produce output are passed through. If nothing
+    has been produced by the deadline, DEADLINE_REACHED is yielded once so the
+    caller can send fallback content; items that arrive afterwards (within
+    upgrade_wait) are still yielded as the upgraded answer. If the answer takes
+    even longer, iteration ends and on_late_result receives all of its items once
+    the model finishes.
+
+    Args:
+        start_stream: Starts one attempt and returns its iterator; must be safe to run twice
+        hedge_after: Seconds without output before the duplicate (default HEDGE_AFTER_SECONDS, 0 disables)
+        deadline: Seconds without output before DEADLINE_REACHED (default DEADLINE_SECONDS, 0 disables)
+        upgrade_wait: Seconds after the deadline to keep streaming (default UPGRADE_WAIT_SECONDS)
+        on_late_result: Called with the complete item list of an answer that outlives the stream
+    """
+    hedge_after = HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+    deadline = DEADLINE_SECONDS if deadline is None else deadline
+    upgrade_wait = UPGRADE_WAIT_SECONDS if upgrade_wait is None else upgrade_wait
+
+    race = _StreamRace(on_late_result)
+    started = time.monotonic()
+    attempts = [0]
+    failed = set()
+    _submit(lambda: race.run_attempt(0, start_stream))
+    hedged = not hedge_after
+    deadline_passed = False
+
+    def start_hedge():
+        attempts.append(len(attempts))
+        attempt = attempts[-1]
+        _submit(lambda: race.run_attempt(attempt, start_stream))
+
+    try:
+        while True:
+            elapsed = time.monotonic() - started
+            if race.winner is None:
+                timers = []
+                if not hedged:
+                    timers.append(hedge_after)
+                if deadline and not deadline_passed:
+                    timers.append(deadline)
+                if deadline_passed:
+                    timers.append(deadline + upgrade_wait)
+                timeout = max(0.0, min(timers) - elapsed) if timers else None
+            else:
+                timeout = None
+
+            try:
+                attempt, kind, value = race.events.get(timeout=timeout)
+            except queue.Empty:
+                elapsed = time.monotonic() - started
+                if not hedged and elapsed >= hedge_after:
+                    print(f"⏱️ No model output after {elapsed:.1f}s, issuing hedged request")
+                    start_hedge()
+                    hedged = True
+                if deadline and not deadline_passed and elapsed >= deadline:
+                    deadline_passed = True
+                    yield DEADLINE_REACHED
+                elif deadline_passed and elapsed >= deadline + upgrade_wait:
+                    # Stop waiting; the answer is delivered to on_late_result when it completes
+                    with race.lock:
+                        race.detached = True
+                    return
+                continue
+
+            if race.winner is None:
+                if kind == "error":
+                    failed.add(attempt)
+                    if len(failed) == len(attempts):
+                        if hedged:
+                            raise value
+                        # Retry a failed attempt once
+                        start_hedge()
+                        hedged = True
+                    continue
+                with race.lock:
+                    race.winner = attempt
+                race.cancelled.update(a for a in attempts if a != attempt)
+
+            if attempt != race.winner:
+                continue
+            if kind == "item":
+                yield value
+            elif kind == "end":
+                return
+            else:
+                raise value
+    finally:
+        with race.lock:
+            if race.winner is not None or not race.detached:
+                # Consumer finished or went away; stop attempts that are not being delivered
+                race.cancelled.update(a for a in attempts if a != race.winner or not race.detached)
+
+
+if __name__ == "__main__":
+    # Demo: tail latency of a simulated model with occasional slow responses
+    #   cd server && python llm_hedging.py
+    import random
+
+    def _simulated_model_call():
+        # 90% answer in ~50 ms, 10% stall for 1 s
+        time.sleep(1.0 if random.random() < 0.1 else random.uniform(0.03, 0.07))
+        return "ok"
+
+    def _percentiles(label: str, hedge_after: float, calls: int = 200) -> None:
+        latencies = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            try:
+                hedged_call(_simulated_model_call, hedge_after=hedge_after, deadline=0.5)
+            except LLMDeadlineExceeded:
+                pass
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+        print(f"   {label:<22} p50 {p50:7.1f} ms   p99 {p99:7.1f} ms")
+
+    print("📊 Simulated model calls (deadline 500 ms)")
+    _percentiles("no hedging", hedge_after=0)
+    _percentiles("hedge after 100 ms", hedge_after=0.1)
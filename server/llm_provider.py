@@ -0,0 +1,416 @@
+# server/llm_provider.py
+# Pluggable LLM provider: live Gemini, or a deterministic offline stub for load testing
+#
+#   RASEED_LLM_PROVIDER=gemini   (default) live Gemini models, needs GEMINI_API_KEY
+#   RASEED_LLM_PROVIDER=stub     replay recorded responses with simulated latency, no network
+#
+# Stub settings:
+#   RASEED_LLM_STUB_REPLAY        JSONL file of recorded responses (see StubProvider)
+#   RASEED_LLM_STUB_LATENCY_MS    time to first token (default 400)
+#   RASEED_LLM_STUB_TOKEN_MS      delay per generated token (default 8)
+#   RASEED_LLM_STUB_OUTPUT_TOKENS length of synthesized responses (default 120)
+#
+# Set RASEED_LLM_RECORD to a JSONL path to record live Gemini responses for replay.
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from llm_usage import response_usage, usage_tracker
+
+load_dotenv()
+
+LLM_PROVIDER = os.getenv("RASEED_LLM_PROVIDER", "gemini").lower()
+
+CHARS_PER_TOKEN = 4
+
+
+def prompt_text(contents: Any) -> str:
+    """Flatten generate_content/send_message contents into plain text"""
+    if contents is None:
+        return ""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(prompt_text(part) for part in contents)
+    if isinstance(contents, dict) and isinstance(contents.get("data"), bytes):
+        # Inline blob (e.g. a receipt image): identify it without inflating token estimates
+        return f"[{contents.get('mime_type')} {hashlib.sha256(contents['data']).hexdigest()}]"
+    text = getattr(contents, "text", None)
+    if isinstance(text, str):
+        return text
+    parts = getattr(contents, "parts", None)
+    if parts is not None:
+        return prompt_text(list(parts))
+    return str(contents)
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+class LLMProvider:
+    """Interface: returns models exposing the google.generativeai GenerativeModel API we use"""
+
+    name = "base"
+
+    def get_model(self, model_name: str, tools: Optional[List] = None):
+        """
+        Get a model
+
+        Args:
+            model_name: Gemini model name, e.g. "models/gemini-1.5-flash"
+            tools: Optional Python functions for function calling
+
+        Returns:
+            Object with generate_content(contents, stream=False) and start_chat()
+        """
+        raise NotImplementedError
+
+
+def _safe_text(response: Any) -> str:
+    try:
+        return response.text or ""
+    except (ValueError, AttributeError):
+        # Responses without text parts (function calls, safety blocks)
+        return ""
+
+
+class _AccountedModel:
+    """Wraps a model so every call is quota-checked and recorded in llm_usage"""
+
+    def __init__(self, model, model_name: str):
+        self._model = model
+        self.model_name = model_name
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        return _accounted_call(self.model_name, contents, stream,
+                               lambda: self._model.generate_content(contents, stream=stream, **kwargs))
+
+    def start_chat(self, *args, **kwargs):
+        return _AccountedChat(self._model.start_chat(*args, **kwargs), self.model_name)
+
+
+class _AccountedChat:
+    def __init__(self, chat, model_name: str):
+        self._chat = chat
+        self.model_name = model_name
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+    def send_message(self, content, stream: bool = False, **kwargs):
+        return _accounted_call(self.model_name, content, stream,
+                               lambda: self._chat.send_message(content, stream=stream, **kwargs))
+
+
+def _accounted_call(model_name: str, contents, stream: bool, call):
+    usage_tracker.check_quota()
+    started = time.perf_counter()
+    try:
+        response = call()
+    except Exception:
+        usage_tracker.record(model_name, latency_ms=(time.perf_counter() - started) * 1000, error=True)
+        raise
+
+    if not stream:
+        prompt_tokens, output_tokens = response_usage(response, prompt_text(contents), _safe_text(response))
+        usage_tracker.record(model_name, prompt_tokens, output_tokens, (time.perf_counter() - started) * 1000)
+        return response
+    return _accounted_stream(model_name, contents, response, started)
+
+
+def _accounted_stream(model_name: str, contents, chunks, started: float) -> Iterator:
+    last_chunk, texts = None, []
+    try:
+        for chunk in chunks:
+            last_chunk = chunk
+            texts.append(_safe_text(chunk))
+            yield chunk
+    except Exception:
+        usage_tracker.record(model_name, latency_ms=(time.perf_counter() - started) * 1000, error=True)
+        raise
+    # Streamed chunks carry cumulative usage; the last one has the totals
+    prompt_tokens, output_tokens = response_usage(last_chunk, prompt_text(contents), "".join(texts))
+    usage_tracker.record(model_name, prompt_tokens, output_tokens, (time.perf_counter() - started) * 1000)
+
+
+class _RecordingModel:
+    """Wraps a Gemini model and appends each prompt/response pair to a JSONL file"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, model, record_path: str):
+        self._model = model
+        self._record_path = record_path
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def _record(self, contents, response_text: str) -> None:
+        text = prompt_text(contents)
+        record = {"prompt_hash": prompt_hash(text), "prompt_preview": text[:200], "response": response_text}
+        try:
+            with self._lock, open(self._record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            print(f"Warning: Could not record LLM response: {e}")
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        response = self._model.generate_content(contents, stream=stream, **kwargs)
+        if not stream:
+            try:
+                self._record(contents, response.text)
+            except ValueError:
+                pass
+            return response
+        return self._record_stream(contents, response)
+
+    def _record_stream(self, contents, chunks) -> Iterator:
+        texts = []
+        for chunk in chunks:
+            try:
+                texts.append(chunk.text or "")
+            except ValueError:
+                pass
+            yield chunk
+        self._record(contents, "".join(texts))
+
+
+class GeminiProvider(LLMProvider):
+    """Live Gemini models through google.generativeai"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = None, record_path: Optional[str] = None):
+        import google.generativeai as genai
+
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set")
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.record_path = record_path or os.getenv("RASEED_LLM_RECORD")
+
+    def get_model(self, model_name: str, tools: Optional[List] = None):
+        model = self._genai.GenerativeModel(model_name, tools=tools) if tools else self._genai.GenerativeModel(model_name)
+        if self.record_path:
+            model = _RecordingModel(model, self.record_path)
+        return _AccountedModel(model, model_name)
+
+
+class _StubResponse:
+    """Mimics the parts of a GenerateContentResponse (or a streamed chunk) that we read"""
+
+    def __init__(self, text: str, prompt_tokens: int, output_tokens: int):
+        self.text = text
+        self.parts = [SimpleNamespace(text=text, function_call=None)]
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+
+    def resolve(self):
+        return self
+
+
+class _StubModel:
+    def __init__(self, provider: "StubProvider", model_name: str):
+        self.provider = provider
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        text = prompt_text(contents)
+        response = self.provider.complete(text)
+        if stream:
+            return self.provider.stream_chunks(text, response)
+        self.provider.sleep_for(response)
+        return _StubResponse(response, estimate_tokens(text), estimate_tokens(response))
+
+    def start_chat(self, history: Optional[List] = None, **kwargs):
+        return _StubChat(self, history)
+
+
+class _StubChat:
+    def __init__(self, model: _StubModel, history: Optional[List] = None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream: bool = False, **kwargs):
+        self.history.append(content)
+        # Replay lookups see the whole conversation, like the live model does
+        return self.model.generate_content(self.history, stream=stream)
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic offline provider for load testing
+
+    Responses come from a JSONL replay file, one object per line:
+
+        {"prompt_hash": "<sha256 of prompt>", "response": "..."}   exact replay (as recorded)
+        {"match": "substring of prompt", "response": "..."}        first matching entry wins
+        {"response": "..."}                                        default pool
+
+    Prompts without a hash or substring match get a default-pool response chosen
+    by prompt hash, or a synthesized response of RASEED_LLM_STUB_OUTPUT_TOKENS
+    tokens. The same prompt always gets the same response. Latency is simulated
+    as a time-to-first-token plus a per-token delay, streamed in small chunks.
+    """
+
+    name = "stub"
+    CHUNK_TOKENS = 8
+
+    def __init__(self, replay_path: Optional[str] = None, latency_ms: Optional[float] = None,
+                 token_ms: Optional[float] = None, output_tokens: Optional[int] = None):
+        self.replay_path = replay_path or os.getenv("RASEED_LLM_STUB_REPLAY")
+        self.latency_ms = float(latency_ms if latency_ms is not None else os.getenv("RASEED_LLM_STUB_LATENCY_MS", "400"))
+        self.token_ms = float(token_ms if token_ms is not None else os.getenv("RASEED_LLM_STUB_TOKEN_MS", "8"))
+        self.output_tokens = int(output_tokens if output_tokens is not None else os.getenv("RASEED_LLM_STUB_OUTPUT_TOKENS", "120"))
+
+        self.by_hash: Dict[str, str] = {}
+        self.by_match: List[Dict[str, str]] = []
+        self.default_pool: List[str] = []
+        if self.replay_path:
+            self._load_replay(self.replay_path)
+        print(f"🧪 Using stub LLM provider ({len(self.by_hash)} recorded, {len(self.by_match)} matched, "
+              f"{len(self.default_pool)} default responses; {self.latency_ms:g} ms + {self.token_ms:g} ms/token)")
+
+    def _load_replay(self, path: str) -> None:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response", "")
+                if entry.get("prompt_hash"):
+                    self.by_hash[entry["prompt_hash"]] = response
+                elif entry.get("match"):
+                    self.by_match.append({"match": entry["match"], "response": response})
+                else:
+                    self.default_pool.append(response)
+
+    def get_model(self, model_name: str, tools: Optional[List] = None):
+        return _AccountedModel(_StubModel(self, model_name), model_name)
+
+    def complete(self, text: str) -> str:
+        """The deterministic response for a prompt"""
+        digest = prompt_hash(text)
+        if digest in self.by_hash:
+            return self.by_hash[digest]
+        for entry in self.by_match:
+            if entry["match"] in text:
+                return entry["response"]
+        if self.default_pool:
+            return self.default_pool[int(digest[:8], 16) % len(self.default_pool)]
+        return self._synthesize(digest)
+
+    def _synthesize(self, digest: str) -> str:
+        words = ["Here", "is", "a", "stubbed", "answer", "based", "on", "your", "spending", "data."]
+        body = " ".join(words[i % len(words)] for i in range(max(0, self.output_tokens - 2)))
+        return f"[stub {digest[:8]}] {body}"
+
+    def sleep_for(self, response: str) -> None:
+        time.sleep((self.latency_ms + self.token_ms * estimate_tokens(response)) / 1000)
+
+    def stream_chunks(self, prompt: str, response: str) -> Iterator[_StubResponse]:
+        prompt_tokens = estimate_tokens(prompt)
+        chunk_chars = self.CHUNK_TOKENS * CHARS_PER_TOKEN
+        time.sleep(self.latency_ms / 1000)
+        for start in range(0, len(response), chunk_chars):
+            chunk = response[start:start + chunk_chars]
+            time.sleep(self.token_ms * estimate_tokens(chunk) / 1000)
+            # Usage is cumulative across streamed chunks, as with Gemini
+            yield _StubResponse(chunk, prompt_tokens, estimate_tokens(response[:start + chunk_chars]))
+
+    async def complete_async(self, text: str) -> str:
+        response = self.complete(text)
+        await asyncio.sleep((self.latency_ms + self.token_ms * estimate_tokens(response)) / 1000)
+        return response
+
+
+_provider: Optional[LLMProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_llm_provider() -> LLMProvider:
+    """The process-wide provider selected by RASEED_LLM_PROVIDER"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if LLM_PROVIDER == "stub":
+                    _provider = StubProvider()
+                elif LLM_PROVIDER == "gemini":
+                    _provider = GeminiProvider()
+                else:
+                    raise ValueError(f"Unknown RASEED_LLM_PROVIDER: {LLM_PROVIDER}")
+    return _provider
+
+
+def adk_model(model_name: str):
+    """
+    Model for a Google ADK LlmAgent
+
+    Returns a live Gemini model, or an ADK BaseLlm that answers from the stub
+    provider when RASEED_LLM_PROVIDER=stub. Both record usage in llm_usage.
+    """
+    from google.adk.models.base_llm import BaseLlm
+    from google.adk.models.google_llm import Gemini
+    from google.adk.models.llm_response import LlmResponse
+    from google.genai import types
+
+    def request_text(llm_request) -> str:
+        return prompt_text([
+            part.text for content in (llm_request.contents or [])
+            for part in (content.parts or []) if part.text
+        ])
+
+    def record(model: str, llm_request, response, started: float, error: bool = False) -> None:
+        output_text = ""
+        if response is not None and response.content and response.content.parts:
+            output_text = "".join(part.text or "" for part in response.content.parts)
+        prompt_tokens, output_tokens = response_usage(response, request_text(llm_request), output_text)
+        usage_tracker.record(model, prompt_tokens, output_tokens, (time.perf_counter() - started) * 1000, error=error)
+
+    class AccountedGemini(Gemini):
+        async def generate_content_async(self, llm_request, stream: bool = False):
+            usage_tracker.check_quota()
+            started, last_response = time.perf_counter(), None
+            try:
+                async for response in super().generate_content_async(llm_request, stream):
+                    last_response = response
+                    yield response
+            except Exception:
+                record(self.model, llm_request, None, started, error=True)
+                raise
+            record(self.model, llm_request, last_response, started)
+
+    class StubAdkLlm(BaseLlm):
+        async def generate_content_async(self, llm_request, stream: bool = False):
+            usage_tracker.check_quota()
+            started = time.perf_counter()
+            text = await get_llm_provider().complete_async(request_text(llm_request))
+            response = LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+            record(self.model, llm_request, response, started)
+            yield response
+
+    if LLM_PROVIDER == "stub":
+        return StubAdkLlm(model=model_name)
+    return AccountedGemini(model=model_name)
@@ -0,0 +1,255 @@
+# server/llm_usage.py
+# Per-request LLM token, latency and cost accounting with per-user daily token quotas
+#
+# Every model call made through llm_provider is recorded against the current usage
+# scope: the calling route (set by the HTTP middleware in main.py) and the user
+# (taken from the request's user_id, or set explicitly with set_usage_user()).
+#
+#   RASEED_DAILY_TOKEN_QUOTA   tokens per user per day, 0 for unlimited (default 200000)
+
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Dict, Optional
+
+DAILY_TOKEN_QUOTA = int(os.getenv("RASEED_DAILY_TOKEN_QUOTA", "200000"))
+
+# USD per million tokens (input, output); unknown models are costed as gemini-2.0-flash
+MODEL_PRICING = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+DEFAULT_PRICING = MODEL_PRICING["gemini-2.0-flash"]
+
+# Days of per-user usage kept in memory
+USER_HISTORY_DAYS = 7
+
+
+class QuotaExceededError(Exception):
+    """Raised when a user has used up their daily token quota"""
+
+    def __init__(self, uid: str, used: int, quota: int):
+        super().__init__(f"Daily token quota exceeded ({used}/{quota} tokens used today)")
+        self.uid = uid
+        self.used = used
+        self.quota = quota
+
+
+class UsageScope:
+    """Who a model call is made for: the HTTP route and the user"""
+
+    def __init__(self, endpoint: Optional[str] = None, uid: Optional[str] = None, asgi_scope: Optional[Dict] = None):
+        self._endpoint = endpoint
+        self.uid = uid
+        self.asgi_scope = asgi_scope
+
+    @property
+    def endpoint(self) -> str:
+        if self._endpoint:
+            return self._endpoint
+        if self.asgi_scope is not None:
+            # The matched route template (e.g. /api/insights/all) once routing has happened
+            route = self.asgi_scope.get("route")
+            return getattr(route, "path", None) or self.asgi_scope.get("path", "unknown")
+        return "background"
+
+
+_current_scope: contextvars.ContextVar[Optional[UsageScope]] = contextvars.ContextVar("llm_usage_scope", default=None)
+
+
+@contextmanager
+def usage_scope(endpoint: Optional[str] = None, uid: Optional[str] = None, asgi_scope: Optional[Dict] = None):
+    """Attribute model calls made inside the block to an endpoint and user"""
+    token = _current_scope.set(UsageScope(endpoint, uid, asgi_scope))
+    try:
+        yield _current_scope.get()
+    finally:
+        _current_scope.reset(token)
+
+
+def current_scope() -> UsageScope:
+    return _current_scope.get() or UsageScope()
+
+
+def set_usage_user(uid: Optional[str]) -> None:
+    """Attribute the current request's model calls to a user"""
+    scope = _current_scope.get()
+    if scope is None:
+        _current_scope.set(UsageScope(uid=uid))
+    elif uid:
+        scope.uid = uid
+
+
+def _new_totals() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "cache_hits": 0,
+        "errors": 0,
+        "prompt_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "latency_ms_total": 0.0,
+        "cost_usd": 0.0,
+    }
+
+
+class UsageTracker:
+    """Thread-safe in-memory aggregates of LLM usage per route, user and model"""
+
+    def __init__(self, daily_token_quota: int = DAILY_TOKEN_QUOTA):
+        self.daily_token_quota = daily_token_quota
+        self._lock = threading.Lock()
+        self._by_route: Dict[str, Dict[str, Any]] = defaultdict(_new_totals)
+        self._by_model: Dict[str, Dict[str, Any]] = defaultdict(_new_totals)
+        self._by_user_day: Dict[tuple, Dict[str, Any]] = defaultdict(_new_totals)
+        self._totals = _new_totals()
+        self.started_at = time.time()
+
+    @staticmethod
+    def estimate_cost(model: str, prompt_tokens: int, output_tokens: int) -> float:
+        model_key = (model or "").split("/")[-1]
+        input_price, output_price = next(
+            (price for name, price in MODEL_PRICING.items() if model_key.startswith(name)), DEFAULT_PRICING
+        )
+        return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def record(self, model: str, prompt_tokens: int = 0, output_tokens: int = 0, latency_ms: float = 0.0,
+               cache_hit: bool = False, error: bool = False,
+               endpoint: Optional[str] = None, uid: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Record one model call (or answer-cache hit) against the current usage scope
+
+        Args:
+            model: Model name
+            prompt_tokens: Input tokens
+            output_tokens: Output tokens
+            latency_ms: Wall-clock latency of the call
+            cache_hit: The answer came from a cache and no model was called
+            error: The call failed
+            endpoint: Override the scope's endpoint
+            uid: Override the scope's user
+
+        Returns:
+            The recorded call
+        """
+        scope = current_scope()
+        call = {
+            "model": model,
+            "endpoint": endpoint or scope.endpoint,
+            "uid": uid or scope.uid or "anonymous",
+            "prompt_tokens": int(prompt_tokens or 0),
+            "output_tokens": int(output_tokens or 0),
+            "latency_ms": round(latency_ms, 1),
+            "cache_hit": cache_hit,
+            "error": error,
+            "cost_usd": self.estimate_cost(model, prompt_tokens or 0, output_tokens or 0),
+        }
+
+        today = date.today().isoformat()
+        with self._lock:
+            for totals in (
+                self._totals,
+                self._by_route[call["endpoint"]],
+                self._by_model[model or "unknown"],
+                self._by_user_day[(call["uid"], today)],
+            ):
+                totals["calls"] += 1
+                totals["cache_hits"] += int(cache_hit)
+                totals["errors"] += int(error)
+                totals["prompt_tokens"] += call["prompt_tokens"]
+                totals["output_tokens"] += call["output_tokens"]
+                totals["total_tokens"] += call["prompt_tokens"] + call["output_tokens"]
+                totals["latency_ms_total"] += latency_ms
+                totals["cost_usd"] += call["cost_usd"]
+            self._prune_days(today)
+        return call
+
+    def _prune_days(self, today: str) -> None:
+        if len(self._by_user_day) < 10000:
+            return
+        cutoff = date.fromordinal(date.fromisoformat(today).toordinal() - USER_HISTORY_DAYS).isoformat()
+        for key in [key for key in self._by_user_day if key[1] < cutoff]:
+            del self._by_user_day[key]
+
+    def tokens_used_today(self, uid: str) -> int:
+        with self._lock:
+            totals = self._by_user_day.get((uid, date.today().isoformat()))
+            return totals["total_tokens"] if totals else 0
+
+    def check_quota(self, uid: Optional[str] = None) -> None:
+        """Raise QuotaExceededError if the user (default: the current scope's) is over today's quota"""
+        uid = uid or current_scope().uid
+        if not uid or self.daily_token_quota <= 0:
+            return
+        used = self.tokens_used_today(uid)
+        if used >= self.daily_token_quota:
+            raise QuotaExceededError(uid, used, self.daily_token_quota)
+
+    @staticmethod
+    def _summarize(totals: Dict[str, Any]) -> Dict[str, Any]:
+        model_calls = totals["calls"] - totals["cache_hits"]
+        return {
+            **{key: value for key, value in totals.items() if key != "latency_ms_total"},
+            "cost_usd": round(totals["cost_usd"], 6),
+            "avg_latency_ms": round(totals["latency_ms_total"] / model_calls, 1) if model_calls else 0.0,
+            "cache_hit_rate": round(totals["cache_hits"] / totals["calls"], 3) if totals["calls"] else 0.0,
+        }
+
+    def user_usage(self, uid: str) -> Dict[str, Any]:
+        """A user's usage per day and remaining quota for today"""
+        today = date.today().isoformat()
+        with self._lock:
+            days = {
+                day: self._summarize(totals)
+                for (user, day), totals in sorted(self._by_user_day.items(), key=lambda x: x[0][1])
+                if user == uid
+            }
+        used = days.get(today, {}).get("total_tokens", 0)
+        return {
+            "uid": uid,
+            "days": days,
+            "daily_token_quota": self.daily_token_quota or None,
+            "tokens_used_today": used,
+            "tokens_remaining_today": max(0, self.daily_token_quota - used) if self.daily_token_quota else None,
+        }
+
+    def snapshot(self, top_users: int = 20) -> Dict[str, Any]:
+        """Aggregates for the metrics endpoint"""
+        today = date.today().isoformat()
+        with self._lock:
+            users_today = sorted(
+                ((uid, totals) for (uid, day), totals in self._by_user_day.items() if day == today),
+                key=lambda x: x[1]["total_tokens"], reverse=True
+            )
+            return {
+                "since": self.started_at,
+                "daily_token_quota": self.daily_token_quota or None,
+                "totals": self._summarize(self._totals),
+                "by_route": {route: self._summarize(t) for route, t in sorted(self._by_route.items())},
+                "by_model": {model: self._summarize(t) for model, t in sorted(self._by_model.items())},
+                "top_users_today": [
+                    {"uid": uid, **self._summarize(totals)} for uid, totals in users_today[:top_users]
+                ],
+                "users_today": len(users_today),
+            }
+
+
+def response_usage(response: Any, prompt_text: str = "", output_text: str = "") -> tuple:
+    """(prompt_tokens, output_tokens) from a response's usage metadata, estimated if absent"""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage is not None else None
+    output_tokens = getattr(usage, "candidates_token_count", None) if usage is not None else None
+    if not prompt_tokens:
+        prompt_tokens = len(prompt_text) // 4
+    if not output_tokens:
+        output_tokens = len(output_text) // 4
+    return prompt_tokens, output_tokens
+
+
+# Global instance
+usage_tracker = UsageTracker()
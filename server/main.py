@@ -1,15 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from routes.insights import router as insights_router
 from routes.agent import router as agent_router
 from routes.wallet import router as wallet_router
+from routes.receipts import router as receipts_router
+from routes.metrics import router as metrics_router
+from routes.brief import router as brief_router
 from auth_middleware import get_current_user, get_current_user_optional
 from firestore_service import firestore_service
+from agent_registry import get_daily_brief_service, registry
+from llm_usage import usage_scope
+from receipt_jobs import RECEIPT_BATCH_MAX, QueueFullError, receipt_job_queue
+from receipt_images import ZIP_MAX_BYTES, ImageDownloadError, receipt_image_downloader, unpack_receipt_zip
+import asyncio
+import json
 import os
-import time
-from datetime import datetime
+import threading
+import uuid
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -30,10 +40,50 @@ app.add_middleware(
 app.include_router(insights_router, prefix="/api/insights")
 app.include_router(agent_router, prefix="/api/agent")
 app.include_router(wallet_router, prefix="/api/wallet")
+app.include_router(receipts_router, prefix="/api/receipts")
+app.include_router(metrics_router, prefix="/api/metrics")
+app.include_router(brief_router, prefix="/api/brief")
+
+
+@app.middleware("http")
+async def llm_usage_middleware(request, call_next):
+    # Attribute model calls made while handling the request to its route and user
+    with usage_scope(uid=request.query_params.get("user_id"), asgi_scope=request.scope):
+        return await call_next(request)
 
 # Get database reference
 db = firestore_service.db
 
+@app.on_event("startup")
+async def warm_up_shared_agents():
+    # Build shared agents in the background so the first request doesn't pay for it
+    threading.Thread(target=registry.warm_up, args=("chatbot_agent", "wallet_tool"), daemon=True).start()
+
+@app.on_event("startup")
+async def start_receipt_workers():
+    await receipt_job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_receipt_workers():
+    await receipt_job_queue.stop()
+    await receipt_image_downloader.aclose()
+
+@app.on_event("startup")
+async def schedule_daily_briefs():
+    # Precompute each active user's daily brief every morning (see daily_brief.py)
+    from daily_brief import BRIEF_ENABLED
+    if not BRIEF_ENABLED:
+        return
+
+    async def run():
+        try:
+            service = await asyncio.to_thread(get_daily_brief_service)
+            await service.run_schedule()
+        except Exception as e:
+            print(f"❌ Daily brief scheduler stopped: {str(e)}")
+
+    app.state.daily_brief_task = asyncio.create_task(run())
+
 @app.get("/")
 async def root():
     return {"message": "Raseed API is running with Google Cloud OAuth"}
@@ -63,6 +113,10 @@ class ReceiptProcessRequest(BaseModel):
     fileType: str
     storagePath: Optional[str] = None
 
+class ReceiptBatchRequest(BaseModel):
+    userId: str
+    receipts: List[ReceiptProcessRequest]
+
 class ProcessingResponse(BaseModel):
     success: bool
     processingId: str
@@ -117,81 +171,120 @@ async def get_receipts(uid: str):
 
 @app.post("/api/process-receipt")
 async def process_receipt(request: ReceiptProcessRequest):
-    """Process a receipt using AI"""
+    """Queue a receipt for background AI processing"""
     try:
         print(f"Processing receipt: {request.receiptId} for user: {request.userId}")
         
-        # Create processing ID
-        processing_id = f"proc_{int(time.time())}_{request.receiptId}"
-        
-        # Store processing request in Firestore for tracking
-        processing_data = {
-            "processingId": processing_id,
-            "receiptId": request.receiptId,
-            "userId": request.userId,
-            "fileName": request.fileName,
-            "downloadURL": request.downloadURL,
-            "status": "processing",
-            "progress": 0,
-            "startedAt": datetime.now().isoformat(),
-            "estimatedCompletionTime": datetime.fromtimestamp(time.time() + 60).isoformat()
-        }
-        
-        # Save to Firestore (you can implement this in firestore_service)
-        # firestore_service.save_processing_status(processing_id, processing_data)
-        
-        # TODO: Implement actual AI processing here
-        # For now, return success response
+        # Download, extraction, enrichment and saving run in the background job queue
+        job = await receipt_job_queue.submit(request.model_dump())
         
         return ProcessingResponse(
             success=True,
-            processingId=processing_id,
-            status="processing",
+            processingId=job.processing_id,
+            status=job.status,
             message="Receipt submitted for processing. Processing will continue in the background.",
             receiptId=request.receiptId,
-            estimatedCompletionTime=processing_data["estimatedCompletionTime"]
+            estimatedCompletionTime=receipt_job_queue.estimated_completion(job).isoformat()
         )
         
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Exception in process_receipt: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/process-receipts/batch")
+async def process_receipt_batch(request: ReceiptBatchRequest):
+    """
+    Queue many uploaded receipts at once (e.g. onboarding a backlog)
+
+    Bulk receipts run at lower priority than single uploads. Returns the batch with
+    each receipt's outcome; follow it with GET /api/process-receipts/batch/{batch_id}
+    or the /api/process-status/stream events.
+    """
+    try:
+        batch = await receipt_job_queue.submit_batch(request.userId, [r.model_dump() for r in request.receipts])
+        return {"success": True, **receipt_job_queue.get_batch(batch.batch_id)}
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Exception in process_receipt_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/process-receipts/batch/zip")
+async def process_receipt_zip(user_id: str = Form(...), file: UploadFile = File(...)):
+    """Queue every receipt image in a zip archive as one batch"""
+    try:
+        if file.size is not None and file.size > ZIP_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Zip archive is too large")
+        archive = await file.read()
+        images, refused = await asyncio.to_thread(unpack_receipt_zip, archive, RECEIPT_BATCH_MAX)
+        del archive
+
+        requests = [{
+            "receiptId": uuid.uuid4().hex,
+            "userId": user_id,
+            "downloadURL": None,
+            "storagePath": None,
+            **image,
+        } for image in images]
+        batch = await receipt_job_queue.submit_batch(user_id, requests, refused)
+        return {"success": True, **receipt_job_queue.get_batch(batch.batch_id)}
+    except HTTPException:
+        raise
+    except ImageDownloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"Exception in process_receipt_zip: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/process-receipts/batch/{batch_id}")
+async def get_receipt_batch(batch_id: str):
+    """Per-receipt outcomes and status counts of a bulk submission"""
+    batch = receipt_job_queue.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No batch found with ID {batch_id}")
+    return batch
+
+@app.get("/api/process-status/stream")
+async def stream_processing_status(user_id: str = Query(..., description="User ID")):
+    """
+    Push processing status for all of a user's receipts over Server-Sent Events
+
+    Sends a ``snapshot`` event with the receipts in flight or finished in the
+    last few minutes, then a
+    ``status`` event (same shape as /api/process-status/{receipt_id}) on every
+    stage transition: queued, downloading, extracting, enriching, saving, saved
+    or failed. ``ping`` events keep idle connections open.
+    """
+    async def event_stream():
+        async for event in receipt_job_queue.subscribe(user_id):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/process-status/{receipt_id}")
 async def get_processing_status(receipt_id: str):
     """Get processing status for a receipt"""
     try:
-        print(f"Getting processing status for receipt: {receipt_id}")
-        
-        # TODO: Get actual status from database
-        # For now, return mock progressive status
-        
-        import random
-        progress = min(100, random.randint(20, 100))
-        
-        if progress >= 100:
-            status = "completed"
-            message = "Processing completed successfully"
-        else:
-            status = "processing"
-            message = "Processing in progress..."
-        
-        return {
-            "receiptId": receipt_id,
-            "status": status,
-            "progress": progress,
-            "message": message,
-            "updatedAt": datetime.now().isoformat()
-        }
+        status = receipt_job_queue.get_status(receipt_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail=f"No processing job found for receipt {receipt_id}")
+        return status
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Exception in get_processing_status: {str(e)}")
-        return {
-            "receiptId": receipt_id,
-            "status": "processing",
-            "progress": 50,
-            "message": "Processing in progress...",
-            "error": str(e)
-        }
+        raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
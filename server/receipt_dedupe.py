@@ -0,0 +1,292 @@
+# server/receipt_dedupe.py
+# Duplicate receipt detection and a shared extraction cache keyed by image content
+#
+# Every uploaded image is fingerprinted with SHA-256 (exact bytes) and a 64-bit
+# perceptual hash (pHash, survives re-encoding, resizing and small crops). A per-user
+# index (receipt_image_hashes) maps fingerprints to the receipt they produced, so a
+# repeat upload is linked to the existing receipt instead of creating a duplicate.
+# Only an exact SHA-256 match is rejected outright: receipts from the same store look
+# alike at pHash resolution, so a pHash match is a duplicate only if the extracted
+# store, total and purchase date also agree.
+# A global cache (ocr_cache/{sha256}) keeps the extracted JSON for each exact image,
+# so retries and re-processing skip model extraction entirely.
+#
+# Only the newest fingerprints of recently active users are kept in memory; exact
+# matches against older ones are found with a point lookup in Firestore.
+#
+#   RASEED_RECEIPT_DEDUPE           set to 0 to process every upload (default 1)
+#   RASEED_RECEIPT_PHASH_DISTANCE   max differing pHash bits for a near-duplicate (default 8)
+#   RASEED_RECEIPT_HASHES_PER_USER  fingerprints kept in memory per user (default 2000)
+#   RASEED_RECEIPT_HASH_USERS       users whose fingerprints are kept in memory (default 1000)
+
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from firestore_service import firestore_service
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it only exact duplicates are detected
+    Image = None
+
+DEDUPE_ENABLED = os.getenv("RASEED_RECEIPT_DEDUPE", "1").lower() not in ("0", "false", "no")
+PHASH_MAX_DISTANCE = int(os.getenv("RASEED_RECEIPT_PHASH_DISTANCE", "8"))
+HASHES_PER_USER = int(os.getenv("RASEED_RECEIPT_HASHES_PER_USER", "2000"))
+HASH_USERS_KEPT = int(os.getenv("RASEED_RECEIPT_HASH_USERS", "1000"))
+
+PHASH_SIZE = 32
+PHASH_LOW_FREQUENCIES = 8
+
+# DCT-II basis for the pHash input size, computed once
+_DCT_BASIS = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * PHASH_SIZE)) for x in range(PHASH_SIZE)]
+    for u in range(PHASH_LOW_FREQUENCIES)
+]
+
+
+class DuplicateReceiptError(Exception):
+    """The uploaded image matches a receipt the user already has"""
+
+    def __init__(self, receipt_id: str):
+        super().__init__(f"Already uploaded as receipt {receipt_id}")
+        self.receipt_id = receipt_id
+
+
+@dataclass
+class ImageFingerprint:
+    sha256: str
+    phash: Optional[str] = None
+
+
+@dataclass
+class ImageMatch:
+    """An earlier receipt whose image matches an upload"""
+    receipt_id: str
+    exact: bool
+    # The earlier receipt is still being processed, so its contents are not known yet
+    pending: bool = False
+
+
+def perceptual_hash(data: bytes) -> Optional[str]:
+    """
+    64-bit DCT perceptual hash of an image as 16 hex digits
+
+    The image is reduced to 32x32 grayscale; each bit says whether one of the
+    8x8 lowest-frequency DCT coefficients is above their median.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Let the JPEG decoder downscale while decoding; full resolution is not needed
+            image.draft("L", (PHASH_SIZE * 8, PHASH_SIZE * 8))
+            image = ImageOps.exif_transpose(image).convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS)
+            pixels = list(image.getdata())
+    except Exception:
+        return None
+
+    rows = [pixels[y * PHASH_SIZE:(y + 1) * PHASH_SIZE] for y in range(PHASH_SIZE)]
+    # Separable 2D DCT restricted to the low frequencies
+    row_dct = [[sum(b * p for b, p in zip(basis, row)) for basis in _DCT_BASIS] for row in rows]
+    coefficients = [
+        sum(_DCT_BASIS[v][y] * row_dct[y][u] for y in range(PHASH_SIZE))
+        for v in range(PHASH_LOW_FREQUENCIES) for u in range(PHASH_LOW_FREQUENCIES)
+    ]
+    median = sorted(coefficients[1:])[len(coefficients) // 2]  # skip the DC term
+    bits = 0
+    for coefficient in coefficients:
+        bits = (bits << 1) | (coefficient > median)
+    return f"{bits:016x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def fingerprint_image(data: bytes) -> ImageFingerprint:
+    return ImageFingerprint(sha256=hashlib.sha256(data).hexdigest(), phash=perceptual_hash(data))
+
+
+class ReceiptImageIndex:
+    """Per-user image fingerprint index plus the global extraction cache"""
+
+    def __init__(self, max_distance: int = PHASH_MAX_DISTANCE, per_user: int = HASHES_PER_USER,
+                 max_users: int = HASH_USERS_KEPT):
+        self.max_distance = max_distance
+        self.per_user = per_user
+        self.max_users = max_users
+        # Least recently used user first; each list is oldest entry first
+        self._users: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        # Users with more saved fingerprints than are kept in memory
+        self._truncated: Set[str] = set()
+        self._lock = threading.Lock()
+        firestore_service.add_receipt_listener(self.on_receipt_write)
+
+    def _get_entries(self, uid: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = self._users.get(uid)
+            if entries is not None:
+                self._users.move_to_end(uid)
+                return entries
+        loaded = firestore_service.get_receipt_image_hashes(uid)
+        loaded.sort(key=lambda entry: str(entry.get("created_at") or ""))
+        with self._lock:
+            entries = self._users.setdefault(uid, loaded)
+            self._users.move_to_end(uid)
+            self._trim(uid, entries)
+            while len(self._users) > self.max_users:
+                evicted_uid, _ = self._users.popitem(last=False)
+                self._truncated.discard(evicted_uid)
+        return entries
+
+    def _trim(self, uid: str, entries: List[Dict[str, Any]]) -> None:
+        """Drop the oldest saved fingerprints over per_user (call with the lock held)"""
+        excess = len(entries) - self.per_user
+        if excess <= 0:
+            return
+        dropped = 0
+        kept = []
+        for entry in entries:
+            if dropped < excess and not entry.get("pending"):
+                dropped += 1
+            else:
+                kept.append(entry)
+        entries[:] = kept
+        self._truncated.add(uid)
+
+    def claim(self, uid: str, receipt_id: str, fingerprint: ImageFingerprint) -> Optional[ImageMatch]:
+        """
+        Find an earlier receipt with the same image, or reserve the fingerprint for this one
+
+        Args:
+            uid: Uploading user
+            receipt_id: Receipt being processed
+            fingerprint: Fingerprint of the uploaded image
+
+        Returns:
+            The matching earlier receipt, or None if the image is new. Only an exact
+            match against a saved receipt is a certain duplicate; a pHash match must be
+            confirmed with is_same_purchase() once the upload has been extracted, and a
+            match against a receipt still processing (pending) can't be confirmed at all,
+            since that upload may yet fail.
+        """
+        entries = self._get_entries(uid)
+        with self._lock:
+            match, exact = self._match(entries, receipt_id, fingerprint)
+            older_fingerprints = uid in self._truncated
+        if not exact and older_fingerprints:
+            # Fingerprints beyond the in-memory window are only checked for exact matches
+            saved = firestore_service.get_receipt_image_hash(uid, fingerprint.sha256)
+            if saved and saved.get("receipt_id") != receipt_id:
+                match, exact = saved, True
+
+        with self._lock:
+            if match is None or not exact or match.get("pending"):
+                # Reserve it so a concurrent upload of the same image is caught too
+                entries.append({"receipt_id": receipt_id, "sha256": fingerprint.sha256,
+                                "phash": fingerprint.phash, "pending": True})
+                self._trim(uid, entries)
+                if match is None:
+                    return None
+                return ImageMatch(match["receipt_id"], exact=exact, pending=bool(match.get("pending")))
+
+        if firestore_service.get_receipt(match["receipt_id"]) is not None:
+            return ImageMatch(match["receipt_id"], exact=True)
+
+        # The earlier receipt was deleted outside the API; forget it and retry
+        self._forget(uid, match["receipt_id"])
+        return self.claim(uid, receipt_id, fingerprint)
+
+    def _match(self, entries: List[Dict[str, Any]], receipt_id: str,
+               fingerprint: ImageFingerprint) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Matching entry (exact SHA-256 matches first) and whether the match is exact"""
+        near_match = None
+        for entry in entries:
+            if entry["receipt_id"] == receipt_id:
+                # Re-processing the same receipt is not a duplicate
+                continue
+            if entry["sha256"] == fingerprint.sha256:
+                return entry, True
+            if (near_match is None and fingerprint.phash and entry.get("phash")
+                    and hamming_distance(fingerprint.phash, entry["phash"]) <= self.max_distance):
+                near_match = entry
+        return near_match, False
+
+    @staticmethod
+    def is_same_purchase(match: ImageMatch, receipt: Dict[str, Any]) -> bool:
+        """
+        Whether an extracted upload is the receipt a pHash match points to
+
+        Store, total and purchase date must all be known and agree; anything less
+        is treated as a different receipt from the same store.
+        """
+        existing = firestore_service.get_receipt(match.receipt_id)
+        if not existing:
+            return False
+        store, existing_store = receipt.get("store"), existing.get("store")
+        total, existing_total = receipt.get("total_amount"), existing.get("total_amount")
+        date, existing_date = str(receipt.get("timestamp") or "")[:10], str(existing.get("timestamp") or "")[:10]
+        try:
+            same_total = abs(float(total) - float(existing_total)) < 0.01
+        except (TypeError, ValueError):
+            return False
+        return (same_total and bool(store) and bool(date)
+                and str(store).strip().lower() == str(existing_store or "").strip().lower()
+                and date == existing_date)
+
+    def record(self, uid: str, receipt_id: str, fingerprint: ImageFingerprint) -> None:
+        """Persist the fingerprint of a saved receipt"""
+        entry = {"receipt_id": receipt_id, "sha256": fingerprint.sha256, "phash": fingerprint.phash,
+                 "uid": uid, "created_at": datetime.now()}
+        firestore_service.save_receipt_image_hash(uid, fingerprint.sha256, entry)
+        entries = self._get_entries(uid)
+        with self._lock:
+            entries[:] = [e for e in entries if e["receipt_id"] != receipt_id] + [entry]
+            self._trim(uid, entries)
+
+    def release(self, uid: str, receipt_id: str) -> None:
+        """Drop a reservation made by claim() for a receipt that was not saved"""
+        with self._lock:
+            entries = self._users.get(uid)
+            if entries is not None:
+                entries[:] = [e for e in entries if not (e["receipt_id"] == receipt_id and e.get("pending"))]
+
+    def on_receipt_write(self, uid: str, receipt_id: str, receipt: Optional[Dict[str, Any]]) -> None:
+        """FirestoreService listener: deleted receipts no longer count as duplicates"""
+        if receipt is None:
+            self._forget(uid, receipt_id)
+
+    def _forget(self, uid: str, receipt_id: str) -> None:
+        firestore_service.delete_receipt_image_hashes(uid, receipt_id)
+        with self._lock:
+            entries = self._users.get(uid)
+            if entries is not None:
+                entries[:] = [e for e in entries if e["receipt_id"] != receipt_id]
+
+    @staticmethod
+    def get_cached_extraction(sha256: str, model_name: str) -> Optional[Dict[str, Any]]:
+        """Receipt JSON previously extracted from this exact image by the same model"""
+        cached = firestore_service.get_ocr_cache(sha256)
+        if cached and cached.get("model") == model_name and isinstance(cached.get("receipt"), dict):
+            return cached["receipt"]
+        return None
+
+    @staticmethod
+    def cache_extraction(fingerprint: ImageFingerprint, model_name: str, receipt: Dict[str, Any]) -> None:
+        firestore_service.store_ocr_cache(fingerprint.sha256, {
+            "receipt": receipt,
+            "phash": fingerprint.phash,
+            "model": model_name,
+            "created_at": datetime.now(),
+        })
+
+
+# Global instance
+receipt_image_index = ReceiptImageIndex()
@@ -0,0 +1,350 @@
+# server/receipt_enrichment.py
+# Local, deterministic enrichment of receipts at ingest time
+#
+# The insight analyzers read gemini_inference.category_spend and
+# gemini_inference.need_vs_want_split from every receipt. Both are computed here when
+# the receipt is saved, without a model call: each item gets a canonical category from
+#   1. the memoized item -> category mapping (in process, backed by item_categories/{name})
+#   2. a keyword classifier over the item name
+#   3. the category the extraction model inferred, mapped onto the canonical set
+#      (new item names learned this way are memoized and persisted)
+#   4. the store name, for items that are still unknown
+# and categories map to essential / non-essential through a fixed, memoized table.
+#
+#   RASEED_ENRICHMENT_MEMO_SIZE   item names kept in the in-process memo (default 20000)
+#   RASEED_ENRICHMENT_LEARN       set to 0 to stop persisting learned item categories (default 1)
+
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from firestore_service import firestore_service
+
+MEMO_SIZE = int(os.getenv("RASEED_ENRICHMENT_MEMO_SIZE", "20000"))
+LEARN_ITEM_CATEGORIES = os.getenv("RASEED_ENRICHMENT_LEARN", "1").lower() not in ("0", "false", "no")
+
+DEFAULT_CATEGORY = "other"
+
+# Values the extraction prompt uses for unreadable fields
+UNREADABLE_VALUES = {"cant_read", "can't_read", "cannot_read", "null", "none", "n/a", ""}
+
+# Canonical category -> keywords found in item names (longest match wins)
+CATEGORY_KEYWORDS = {
+    "groceries": [
+        "milk", "bread", "egg", "eggs", "butter", "cheese", "yogurt", "yoghurt", "curd", "paneer",
+        "rice", "flour", "atta", "sugar", "salt", "oil", "pasta", "noodles", "cereal", "oats",
+        "apple", "apples", "banana", "bananas", "orange", "oranges", "tomato", "tomatoes",
+        "potato", "potatoes", "onion", "onions", "lettuce", "spinach", "carrot", "carrots",
+        "fruit", "vegetable", "vegetables", "produce", "chicken", "beef", "pork", "fish", "meat",
+        "dal", "lentils", "beans", "spices", "sauce", "ketchup", "jam", "honey", "tea",
+        "coffee beans", "ground coffee", "instant coffee", "juice", "water bottle", "snack",
+        "snacks", "chips", "biscuits", "cookies", "chocolate", "frozen", "grocery",
+    ],
+    "dining": [
+        "burger", "pizza", "sandwich", "fries", "combo", "meal", "entree", "appetizer", "dessert",
+        "buffet", "biryani", "thali", "burrito", "taco", "sushi", "dine in", "takeaway", "tip",
+        "service charge",
+    ],
+    "coffee": [
+        "coffee", "latte", "cappuccino", "espresso", "americano", "mocha", "macchiato",
+        "frappuccino", "cold brew", "flat white", "chai latte",
+    ],
+    "fuel": ["fuel", "petrol", "diesel", "gasoline", "unleaded", "gas pump", "cng"],
+    "transport": ["uber", "lyft", "taxi", "cab", "metro", "bus ticket", "train ticket", "parking", "toll"],
+    "utilities": ["electricity", "water bill", "internet", "broadband", "mobile recharge", "gas bill"],
+    "health": [
+        "medicine", "tablet", "tablets", "capsule", "syrup", "pharmacy", "vitamin", "vitamins",
+        "paracetamol", "ibuprofen", "bandage", "antiseptic", "prescription", "clinic", "doctor",
+    ],
+    "household": [
+        "detergent", "soap", "dish soap", "dishwash", "cleaner", "bleach", "tissue", "toilet paper", "paper towel",
+        "trash bags", "garbage bags", "sponge", "light bulb", "batteries", "shampoo", "toothpaste",
+        "toothbrush", "deodorant", "diapers",
+    ],
+    "clothing": ["shirt", "t-shirt", "jeans", "trousers", "dress", "jacket", "shoes", "socks", "kurta", "saree"],
+    "electronics": [
+        "charger", "cable", "headphones", "earbuds", "earphones", "phone case", "usb", "hdmi",
+        "laptop", "mouse", "keyboard", "speaker",
+    ],
+    "entertainment": ["movie", "cinema", "ticket", "tickets", "concert", "game", "popcorn", "bowling"],
+    "subscriptions": ["subscription", "netflix", "spotify", "amazon prime", "membership", "monthly plan"],
+}
+
+# Free-form category labels (as the extraction model writes them) -> canonical category
+CATEGORY_SYNONYMS = {
+    "groceries": ["grocery", "groceries", "supermarket", "produce", "food", "dairy", "bakery",
+                  "beverages", "beverage", "snacks", "meat", "vegetables", "fruits", "pantry"],
+    "dining": ["dining", "restaurant", "restaurants", "fast food", "takeout", "food delivery", "eating out"],
+    "coffee": ["coffee", "cafe", "coffee & dining"],
+    "fuel": ["fuel", "gas", "petrol", "gas & fuel", "gasoline", "automotive"],
+    "transport": ["transport", "transportation", "travel", "taxi", "parking", "transit"],
+    "utilities": ["utilities", "utility", "bills", "telecom"],
+    "health": ["health", "pharmacy", "medicine", "medical", "healthcare", "health & fitness"],
+    "household": ["household", "home", "home goods", "cleaning", "cleaning supplies",
+                  "personal care", "toiletries", "baby"],
+    "clothing": ["clothing", "clothes", "apparel", "fashion", "shoes"],
+    "electronics": ["electronics", "gadgets", "technology"],
+    "entertainment": ["entertainment", "movies", "games", "leisure", "recreation"],
+    "subscriptions": ["subscription", "subscriptions", "streaming"],
+}
+
+# Store name keywords -> category, for items nothing else could classify
+STORE_KEYWORDS = {
+    "coffee": ["starbucks", "costa", "cafe coffee day", "dunkin", "tim hortons", "coffee"],
+    "fuel": ["shell", "chevron", "exxon", "bp", "indian oil", "hp petrol", "bharat petroleum", "fuel"],
+    "health": ["pharmacy", "cvs", "walgreens", "apollo", "medplus", "chemist"],
+    "groceries": ["supermarket", "grocery", "mart", "kroger", "safeway", "trader joe", "whole foods",
+                  "walmart", "costco", "big bazaar", "dmart", "reliance fresh", "aldi", "lidl", "tesco"],
+    "dining": ["restaurant", "mcdonald", "kfc", "burger king", "subway", "domino", "pizza hut", "diner"],
+}
+
+# Categories counted as needs in need_vs_want_split
+ESSENTIAL_CATEGORIES = {"groceries", "fuel", "transport", "utilities", "health", "household"}
+
+_UNIT_PATTERN = re.compile(r"\b\d+(?:[.,]\d+)?\s*(?:kg|g|gm|mg|l|ltr|ml|oz|lb|lbs|pcs|pc|pack|x)?\b")
+_NON_WORD_PATTERN = re.compile(r"[^a-z&\- ]+")
+
+
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern":
+    alternatives = sorted((re.escape(k) for k in keywords), key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+
+_CATEGORY_PATTERNS = {category: _keyword_pattern(words) for category, words in CATEGORY_KEYWORDS.items()}
+_STORE_PATTERNS = {category: _keyword_pattern(words) for category, words in STORE_KEYWORDS.items()}
+_SYNONYM_LOOKUP = {label: category for category, labels in CATEGORY_SYNONYMS.items() for label in labels}
+
+
+def _readable(value: Any) -> Any:
+    if isinstance(value, str) and value.strip().lower() in UNREADABLE_VALUES:
+        return None
+    return value
+
+
+def _to_float(value: Any, default: Optional[float] = None) -> Optional[float]:
+    value = _readable(value)
+    if value is None:
+        return default
+    try:
+        return float(str(value).replace(',', '').replace('$', '').strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def normalize_item_name(name: Any) -> str:
+    """Memo key for an item name: lowercase words without sizes, counts or punctuation"""
+    text = _UNIT_PATTERN.sub(" ", str(name or "").lower())
+    return " ".join(_NON_WORD_PATTERN.sub(" ", text).split())
+
+
+def _best_match(text: str, patterns: Dict[str, "re.Pattern"]) -> Optional[str]:
+    best, best_length = None, 0
+    for category, pattern in patterns.items():
+        for match in pattern.finditer(text):
+            if len(match.group(0)) > best_length:
+                best, best_length = category, len(match.group(0))
+    return best
+
+
+@lru_cache(maxsize=4096)
+def classify_keywords(item_key: str) -> Optional[str]:
+    """Category from keywords in a normalized item name, None if none match"""
+    return _best_match(item_key, _CATEGORY_PATTERNS) if item_key else None
+
+
+@lru_cache(maxsize=1024)
+def canonical_category(label: Any) -> Optional[str]:
+    """Canonical category for a free-form category label, None if it is not recognized"""
+    label = _readable(label)
+    if not isinstance(label, str):
+        return None
+    text = " ".join(label.lower().replace("_", " ").split())
+    if text in CATEGORY_KEYWORDS:
+        return text
+    if text in _SYNONYM_LOOKUP:
+        return _SYNONYM_LOOKUP[text]
+    # Labels like "Dairy Products" or "Fresh Vegetables"
+    for word in text.replace("&", " ").split():
+        if word in _SYNONYM_LOOKUP:
+            return _SYNONYM_LOOKUP[word]
+    return None
+
+
+@lru_cache(maxsize=512)
+def classify_store(store: Any) -> Optional[str]:
+    store = _readable(store)
+    return _best_match(" ".join(str(store).lower().split()), _STORE_PATTERNS) if store else None
+
+
+@lru_cache(maxsize=256)
+def is_essential(category: Any) -> bool:
+    """Whether spending in a category (canonical or free-form label) counts as a need"""
+    return (canonical_category(category) or DEFAULT_CATEGORY) in ESSENTIAL_CATEGORIES
+
+
+class ReceiptEnricher:
+    """Classifies receipt items and derives category spend and the need/want split"""
+
+    def __init__(self, memo_size: int = MEMO_SIZE, learn: bool = LEARN_ITEM_CATEGORIES):
+        self.memo_size = memo_size
+        self.learn = learn
+        # normalized item name -> category; None marks names Firestore has no entry for
+        self._memo: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _memo_get(self, key: str) -> Tuple[bool, Optional[str]]:
+        with self._lock:
+            if key not in self._memo:
+                return False, None
+            self._memo.move_to_end(key)
+            return True, self._memo[key]
+
+    def _memo_put(self, entries: Dict[str, Optional[str]]) -> None:
+        with self._lock:
+            for key, category in entries.items():
+                self._memo[key] = category
+                self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def classify_items(self, items: List[Dict[str, Any]], store: Any = None,
+                       use_firestore: bool = True) -> List[str]:
+        """
+        Canonical category for each item
+
+        Args:
+            items: Receipt items with item_name and the model's category
+            store: Store name, used for items nothing else classifies
+            use_firestore: Also look up and persist learned item categories
+
+        Returns:
+            Categories in item order
+        """
+        keys = [normalize_item_name(item.get('item_name')) for item in items]
+
+        known: Dict[str, Optional[str]] = {}
+        missing = []
+        for key in set(keys):
+            if not key:
+                continue
+            hit, category = self._memo_get(key)
+            if hit:
+                known[key] = category
+            elif classify_keywords(key) is None:
+                missing.append(key)
+        if missing and use_firestore:
+            # One batched read for names not seen by this process yet
+            loaded = firestore_service.get_item_categories(missing)
+            fetched = {key: loaded.get(key) for key in missing}
+            self._memo_put(fetched)
+            known.update(fetched)
+
+        store_category = classify_store(store)
+        categories, learned = [], {}
+        for key, item in zip(keys, items):
+            category = known.get(key) or classify_keywords(key)
+            if category is None:
+                category = canonical_category(item.get('category'))
+                if category is not None and key:
+                    learned[key] = category
+            categories.append(category or store_category or DEFAULT_CATEGORY)
+
+        if learned:
+            self._memo_put(learned)
+            if use_firestore and self.learn:
+                firestore_service.save_item_categories(learned)
+        return categories
+
+    def enrich(self, receipt: Dict[str, Any], use_firestore: bool = True) -> Dict[str, Any]:
+        """
+        Normalize extracted fields, classify items and add category_spend and need_vs_want_split
+
+        Args:
+            receipt: Extracted receipt
+            use_firestore: Also look up and persist learned item categories
+
+        Returns:
+            Enriched copy of the receipt, ready to be saved in one write
+        """
+        raw_items = [item for item in receipt.get('items') or [] if isinstance(item, dict)]
+        categories = self.classify_items(raw_items, receipt.get('store'), use_firestore)
+
+        items = []
+        for item, category in zip(raw_items, categories):
+            quantity = _to_float(item.get('quantity'), 1.0)
+            unit_price = _to_float(item.get('unit_price'), 0.0)
+            items.append({
+                **item,
+                'item_name': _readable(item.get('item_name')) or 'Unknown item',
+                'category': category,
+                'essential': is_essential(category),
+                'brand': _readable(item.get('brand')),
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'tax': _to_float(item.get('tax')),
+            })
+
+        total_amount = _to_float(receipt.get('total_amount'))
+        if total_amount is None:
+            total_amount = round(sum(item['quantity'] * item['unit_price'] for item in items), 2)
+
+        gemini_inference = receipt.get('gemini_inference')
+        gemini_inference = dict(gemini_inference) if isinstance(gemini_inference, dict) else {}
+        gemini_inference['category_spend'] = self.category_spend(items)
+        split = self.split(items, receipt.get('store'))
+        if split is not None:
+            gemini_inference['need_vs_want_split'] = split
+
+        return {
+            **receipt,
+            'store': _readable(receipt.get('store')) or 'Unknown',
+            'location': _readable(receipt.get('location')),
+            'timestamp': _readable(receipt.get('timestamp')) or datetime.now().isoformat(),
+            'total_amount': total_amount,
+            'items': items,
+            'gemini_inference': gemini_inference,
+        }
+
+    @staticmethod
+    def category_spend(items: List[Dict[str, Any]]) -> Dict[str, float]:
+        spend = defaultdict(float)
+        for item in items:
+            spend[item['category']] += item['quantity'] * item['unit_price']
+        return {category: round(amount, 2) for category, amount in spend.items() if amount}
+
+    @staticmethod
+    def split(items: List[Dict[str, Any]], store: Any = None) -> Optional[Dict[str, float]]:
+        """Essential / non-essential percentages of item spend, None if nothing to base it on"""
+        essential = sum(i['quantity'] * i['unit_price'] for i in items if is_essential(i['category']))
+        total = sum(i['quantity'] * i['unit_price'] for i in items)
+        if total <= 0:
+            store_category = classify_store(store)
+            if store_category is None:
+                return None
+            essential_pct = 100.0 if is_essential(store_category) else 0.0
+        else:
+            essential_pct = round(100 * essential / total, 1)
+        return {"essential": essential_pct, "non_essential": round(100 - essential_pct, 1)}
+
+    def inference(self, receipt: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        gemini_inference of a stored receipt, filling in fields it was saved without
+
+        Receipts saved before ingest-time enrichment are classified locally (memo and
+        keywords only, no Firestore access), so analyzers never fall back to a guess.
+        """
+        gemini_inference = receipt.get('gemini_inference')
+        if not isinstance(gemini_inference, dict):
+            gemini_inference = {}
+        if gemini_inference.get('need_vs_want_split') and gemini_inference.get('category_spend'):
+            return gemini_inference
+        local = self.enrich(receipt, use_firestore=False)['gemini_inference']
+        return {**local, **{k: v for k, v in gemini_inference.items() if v}}
+
+
+# Global instance
+receipt_enricher = ReceiptEnricher()
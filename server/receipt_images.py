@@ -0,0 +1,238 @@
+# server/receipt_images.py
+# Pooled receipt image downloads with streaming size limits and content-type checks
+#
+# Images are read straight from Cloud Storage when the upload's storagePath is known
+# (no public download URL round trip) and lies under the uploader's receipts/{uid}/
+# folder, otherwise streamed from the downloadURL over a
+# shared HTTP connection pool. Reads stop as soon as an image exceeds the byte limit.
+#
+#   RASEED_IMAGE_MAX_BYTES          largest accepted image (default 10 MB)
+#   RASEED_IMAGE_DOWNLOAD_TIMEOUT   seconds per download (default 15)
+#   RASEED_IMAGE_MAX_CONNECTIONS    pooled HTTP connections (default 20)
+#   RASEED_RECEIPT_ZIP_MAX_BYTES    largest accepted zip archive of receipts (default 200 MB)
+#   RASEED_RECEIPT_ZIP_MAX_UNPACKED_BYTES  image bytes read out of one zip archive (default 400 MB)
+#   RASEED_STORAGE_BUCKET           Cloud Storage bucket of uploads (default <FIREBASE_PROJECT_ID>.appspot.com)
+
+import asyncio
+import io
+import mimetypes
+import os
+import threading
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+IMAGE_MAX_BYTES = int(os.getenv("RASEED_IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("RASEED_IMAGE_DOWNLOAD_TIMEOUT", "15"))
+IMAGE_MAX_CONNECTIONS = int(os.getenv("RASEED_IMAGE_MAX_CONNECTIONS", "20"))
+ZIP_MAX_BYTES = int(os.getenv("RASEED_RECEIPT_ZIP_MAX_BYTES", str(200 * 1024 * 1024)))
+ZIP_MAX_UNPACKED_BYTES = int(os.getenv("RASEED_RECEIPT_ZIP_MAX_UNPACKED_BYTES", str(400 * 1024 * 1024)))
+STORAGE_BUCKET = os.getenv("RASEED_STORAGE_BUCKET") or (
+    f"{os.getenv('FIREBASE_PROJECT_ID')}.appspot.com" if os.getenv("FIREBASE_PROJECT_ID") else None
+)
+
+# Content types the extraction model accepts
+ALLOWED_CONTENT_TYPES = {
+    "image/jpeg", "image/png", "image/webp", "image/heic", "image/heif", "image/gif",
+}
+
+
+class ImageDownloadError(Exception):
+    """The receipt image could not be downloaded or is not an acceptable image"""
+
+
+def _check_content_type(content_type: Optional[str]) -> str:
+    mime_type = (content_type or "").split(";")[0].strip().lower()
+    if mime_type == "image/jpg":
+        mime_type = "image/jpeg"
+    if mime_type not in ALLOWED_CONTENT_TYPES:
+        raise ImageDownloadError(f"Unsupported receipt file type: {content_type or 'unknown'}")
+    return mime_type
+
+
+class ReceiptImageDownloader:
+    """Downloads receipt images over shared connection pools"""
+
+    def __init__(self, max_bytes: int = IMAGE_MAX_BYTES, timeout: float = IMAGE_DOWNLOAD_TIMEOUT,
+                 max_connections: int = IMAGE_MAX_CONNECTIONS, bucket_name: Optional[str] = STORAGE_BUCKET):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_connections)
+        self.bucket_name = bucket_name
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    async def fetch(self, download_url: Optional[str] = None, storage_path: Optional[str] = None,
+                    uid: Optional[str] = None) -> Tuple[bytes, str]:
+        """
+        Download a receipt image
+
+        Args:
+            download_url: Public download URL of the upload
+            storage_path: Object path in the uploads bucket, preferred when available
+            uid: Uploader, whose receipts/{uid}/ folder storage_path must be in
+
+        Returns:
+            Tuple of (image bytes, MIME type)
+
+        Raises:
+            ImageDownloadError: The image is missing, too large, not an image or
+                storage_path is outside the uploader's folder
+        """
+        if storage_path:
+            # The service account can read every user's uploads; only read this user's
+            if not uid or not storage_path.startswith(f"receipts/{uid}/"):
+                raise ImageDownloadError("Receipt image path does not belong to this user")
+        if storage_path and self._get_bucket() is not None:
+            try:
+                return await asyncio.to_thread(self._read_from_storage, storage_path)
+            except ImageDownloadError:
+                raise
+            except Exception as e:
+                if not download_url:
+                    raise ImageDownloadError(f"Failed to read {storage_path} from storage: {e}")
+                print(f"Warning: Storage read of {storage_path} failed, using download URL: {e}")
+
+        if not download_url:
+            raise ImageDownloadError("No download URL or storage path for receipt image")
+
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits,
+                                                   follow_redirects=True)
+        try:
+            async with self._async_client.stream("GET", download_url) as response:
+                response.raise_for_status()
+                mime_type = self._check_headers(response)
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    self._check_size(len(body))
+                return bytes(body), mime_type
+        except httpx.HTTPError as e:
+            raise ImageDownloadError(f"Failed to download image: {str(e)}")
+
+    def fetch_sync(self, download_url: str) -> Tuple[bytes, str]:
+        """Blocking variant of fetch() for synchronous callers (URL only)"""
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(timeout=self.timeout, limits=self.limits,
+                                                 follow_redirects=True)
+        try:
+            with self._sync_client.stream("GET", download_url) as response:
+                response.raise_for_status()
+                mime_type = self._check_headers(response)
+                body = bytearray()
+                for chunk in response.iter_bytes():
+                    body.extend(chunk)
+                    self._check_size(len(body))
+                return bytes(body), mime_type
+        except httpx.HTTPError as e:
+            raise ImageDownloadError(f"Failed to download image: {str(e)}")
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    def _check_size(self, size: Optional[int]) -> None:
+        if size is not None and size > self.max_bytes:
+            raise ImageDownloadError(
+                f"Receipt image is too large (limit {self.max_bytes / 1024 / 1024:.1f} MB)"
+            )
+
+    def _check_headers(self, response: httpx.Response) -> str:
+        """Reject oversized or non-image responses before reading the body"""
+        length = response.headers.get("content-length")
+        self._check_size(int(length) if length and length.isdigit() else None)
+        return _check_content_type(response.headers.get("content-type"))
+
+    def _get_bucket(self):
+        if self._bucket is None and self.bucket_name:
+            with self._lock:
+                if self._bucket is None:
+                    try:
+                        # Firebase Admin is initialized by firestore_service
+                        from firestore_service import firestore_service  # noqa: F401
+                        from firebase_admin import storage
+                        self._bucket = storage.bucket(self.bucket_name)
+                    except Exception as e:
+                        print(f"Warning: Cloud Storage reads unavailable, using download URLs: {e}")
+                        self.bucket_name = None
+        return self._bucket
+
+    def _read_from_storage(self, storage_path: str) -> Tuple[bytes, str]:
+        blob = self._bucket.get_blob(storage_path)
+        if blob is None:
+            raise LookupError(f"Receipt image {storage_path} not found in storage")
+        self._check_size(blob.size)
+        mime_type = _check_content_type(blob.content_type)
+        return blob.download_as_bytes(), mime_type
+
+
+def unpack_receipt_zip(archive: bytes, max_images: int, max_bytes: int = IMAGE_MAX_BYTES,
+                       max_total_bytes: int = ZIP_MAX_UNPACKED_BYTES) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Read receipt images out of a zip archive
+
+    Args:
+        archive: Zip file contents
+        max_images: Most images to accept
+        max_bytes: Largest accepted image
+        max_total_bytes: Most image bytes to read out of the archive in total
+
+    Returns:
+        Tuple of (images as {"fileName", "fileType", "imageData"}, refused entries as {"fileName", "error"})
+
+    Raises:
+        ImageDownloadError: The archive is not a valid zip file
+    """
+    try:
+        zip_file = zipfile.ZipFile(io.BytesIO(archive))
+    except zipfile.BadZipFile as e:
+        raise ImageDownloadError(f"Invalid zip archive: {e}")
+
+    images, refused = [], []
+    total_bytes = 0
+    with zip_file:
+        for info in zip_file.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            try:
+                mime_type = _check_content_type(mimetypes.guess_type(name)[0])
+            except ImageDownloadError as e:
+                refused.append({"fileName": name, "error": str(e)})
+                continue
+            if len(images) >= max_images:
+                refused.append({"fileName": name, "error": f"More than {max_images} images in archive"})
+                continue
+            # Sizes in the zip directory can lie; cap the bytes actually read too
+            if info.file_size > max_bytes:
+                refused.append({"fileName": name, "error": "Receipt image is too large"})
+                continue
+            total_limit_error = f"Archive holds more than {max_total_bytes / 1024 / 1024:.0f} MB of images"
+            if total_bytes + info.file_size > max_total_bytes:
+                refused.append({"fileName": name, "error": total_limit_error})
+                continue
+            with zip_file.open(info) as entry:
+                data = entry.read(min(max_bytes, max_total_bytes - total_bytes) + 1)
+            if len(data) > max_bytes:
+                refused.append({"fileName": name, "error": "Receipt image is too large"})
+                continue
+            if total_bytes + len(data) > max_total_bytes:
+                refused.append({"fileName": name, "error": total_limit_error})
+                continue
+            total_bytes += len(data)
+            images.append({"fileName": os.path.basename(name), "fileType": mime_type, "imageData": data})
+    return images, refused
+
+
+# Global instance
+receipt_image_downloader = ReceiptImageDownloader()
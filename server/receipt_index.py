@@ -0,0 +1,393 @@
+# server/receipt_index.py
+# Per-user inverted index over receipt stores and items for fast purchase search
+#
+# Indexes are kept for at most RECEIPT_INDEX_MAX_USERS users; the least recently used,
+# and any unused for RECEIPT_INDEX_IDLE_SECONDS, are dropped along with their Firestore
+# watches and rebuilt on next use.
+
+import bisect
+import difflib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from firestore_service import firestore_service
+
+# Receipts loaded when a user's index is first built
+INDEX_BUILD_LIMIT = int(os.getenv("RECEIPT_INDEX_BUILD_LIMIT", "5000"))
+# Also follow receipts written directly to Firestore (e.g. by the web client)
+INDEX_WATCH_FIRESTORE = os.getenv("RECEIPT_INDEX_WATCH", "true").lower() == "true"
+# Users whose index is kept in memory at once
+INDEX_MAX_USERS = int(os.getenv("RECEIPT_INDEX_MAX_USERS", "500"))
+# Seconds an unused index is kept
+INDEX_IDLE_SECONDS = float(os.getenv("RECEIPT_INDEX_IDLE_SECONDS", "1800"))
+# Seconds between sweeps for idle indexes
+INDEX_SWEEP_SECONDS = 60.0
+
+ITEM_FIELDS = ('item_name', 'brand', 'category')
+STORE_POSITION = -1
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Any) -> List[str]:
+    """Lowercase alphanumeric tokens of at least two characters"""
+    if not text:
+        return []
+    return [token for token in _TOKEN_PATTERN.findall(str(text).lower()) if len(token) >= 2]
+
+
+class _UserIndex:
+    """Index for a single user's receipts"""
+
+    def __init__(self, version: int = 0):
+        # token -> {(receipt_id, item_position)}; item_position is STORE_POSITION for store names
+        self.postings: Dict[str, Set[Tuple[str, int]]] = defaultdict(set)
+        self.receipts: Dict[str, Dict[str, Any]] = {}
+        self.receipt_tokens: Dict[str, Set[str]] = {}
+        self.fingerprints: Dict[str, str] = {}
+        self.vocabulary: List[str] = []
+        self.vocabulary_dirty = False
+        self.version = version
+        self.watches = []
+        self.last_used = time.monotonic()
+
+    def add(self, receipt_id: str, receipt: Dict[str, Any]) -> bool:
+        fingerprint = json.dumps(receipt, sort_keys=True, default=str)
+        if self.fingerprints.get(receipt_id) == fingerprint:
+            return False
+
+        self.remove(receipt_id, bump_version=False)
+
+        items = [item for item in receipt.get('items', []) or [] if isinstance(item, dict)]
+        store = receipt.get('store') or receipt.get('store_name') or ''
+        tokens = set()
+
+        for token in tokenize(store):
+            self.postings[token].add((receipt_id, STORE_POSITION))
+            tokens.add(token)
+        for position, item in enumerate(items):
+            for field in ITEM_FIELDS:
+                for token in tokenize(item.get(field)):
+                    self.postings[token].add((receipt_id, position))
+                    tokens.add(token)
+
+        self.receipts[receipt_id] = {
+            "receipt_id": receipt_id,
+            "store": store or 'Unknown',
+            "timestamp": receipt.get('timestamp'),
+            "total_amount": receipt.get('total_amount', 0),
+            "items": [
+                {
+                    "item_name": item.get('item_name'),
+                    "brand": item.get('brand'),
+                    "category": item.get('category'),
+                    "quantity": item.get('quantity'),
+                    "unit_price": item.get('unit_price')
+                }
+                for item in items
+            ]
+        }
+        self.receipt_tokens[receipt_id] = tokens
+        self.fingerprints[receipt_id] = fingerprint
+        self.vocabulary_dirty = True
+        self.version += 1
+        return True
+
+    def remove(self, receipt_id: str, bump_version: bool = True) -> bool:
+        if receipt_id not in self.receipts:
+            return False
+        for token in self.receipt_tokens.pop(receipt_id, set()):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.difference_update({posting for posting in postings if posting[0] == receipt_id})
+            if not postings:
+                del self.postings[token]
+        del self.receipts[receipt_id]
+        self.fingerprints.pop(receipt_id, None)
+        self.vocabulary_dirty = True
+        if bump_version:
+            self.version += 1
+        return True
+
+    def unwatch(self) -> None:
+        for watch in self.watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"Warning: Could not stop receipt watch: {e}")
+        self.watches = []
+
+    def sorted_vocabulary(self) -> List[str]:
+        if self.vocabulary_dirty:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_dirty = False
+        return self.vocabulary
+
+
+class ReceiptIndex:
+    """
+    Per-user inverted index over store names and item names, brands and categories
+
+    A user's index is built from Firestore on first use and then kept current
+    incrementally: receipt writes through FirestoreService update it directly,
+    and (when enabled) a Firestore listener picks up writes made elsewhere.
+    Builds run outside the shared lock, one at a time per user.
+    """
+
+    # Score of a query token matching an indexed term exactly, by prefix, or fuzzily
+    EXACT_SCORE, PREFIX_SCORE, FUZZY_SCORE = 3, 2, 1
+
+    def __init__(self, max_users: int = INDEX_MAX_USERS, idle_seconds: float = INDEX_IDLE_SECONDS):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        # Least recently used first
+        self._users: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # Writes that arrive while a user's index is being built, applied once it is in place
+        self._pending_writes: Dict[str, List[Tuple[str, Optional[Dict[str, Any]]]]] = {}
+        # Last version of evicted indexes, so a rebuilt index never repeats a version
+        self._evicted_versions: Dict[str, int] = {}
+        # Receipt writes seen through FirestoreService per user, whether or not their index is built
+        self._write_counts: Dict[str, int] = defaultdict(int)
+        self._last_sweep = time.monotonic()
+        self._lock = threading.RLock()
+        firestore_service.add_receipt_listener(self.on_receipt_write)
+
+    def _get_user_index(self, uid: str) -> _UserIndex:
+        with self._lock:
+            user_index = self._use(uid)
+            if user_index is not None:
+                return user_index
+            build_lock = self._build_locks.setdefault(uid, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                user_index = self._use(uid)
+                if user_index is not None:
+                    return user_index
+                self._pending_writes[uid] = []
+                user_index = _UserIndex(self._evicted_versions.pop(uid, 0))
+
+            try:
+                for receipt in firestore_service.get_user_receipts(uid, limit=INDEX_BUILD_LIMIT):
+                    receipt_id = receipt.get('id')
+                    if receipt_id:
+                        user_index.add(receipt_id, receipt)
+                if INDEX_WATCH_FIRESTORE:
+                    self._watch_user(uid, user_index)
+            except BaseException:
+                with self._lock:
+                    self._pending_writes.pop(uid, None)
+                    self._build_locks.pop(uid, None)
+                user_index.unwatch()
+                raise
+
+            with self._lock:
+                for receipt_id, receipt in self._pending_writes.pop(uid, []):
+                    if receipt is None:
+                        user_index.remove(receipt_id)
+                    else:
+                        user_index.add(receipt_id, receipt)
+                # Set if built concurrently after an eviction; keep the newer one
+                replaced = self._users.pop(uid, None)
+                self._users[uid] = user_index
+                evicted = self._evict() + ([replaced] if replaced is not None else [])
+            print(f"Built receipt index for {uid}: {len(user_index.receipts)} receipts, {len(user_index.postings)} terms")
+
+        for old_index in evicted:
+            old_index.unwatch()
+        return user_index
+
+    def _use(self, uid: str) -> Optional[_UserIndex]:
+        """The user's built index, marked as most recently used (call with the lock held)"""
+        user_index = self._users.get(uid)
+        if user_index is not None:
+            user_index.last_used = time.monotonic()
+            self._users.move_to_end(uid)
+        return user_index
+
+    def _evict(self) -> List[_UserIndex]:
+        """
+        Drop idle indexes and the least recently used ones over max_users (call with the lock held)
+
+        Returns:
+            The dropped indexes, whose watches the caller stops after releasing the lock
+        """
+        now = time.monotonic()
+        evicted_uids = []
+        if now - self._last_sweep >= INDEX_SWEEP_SECONDS:
+            self._last_sweep = now
+            evicted_uids = [uid for uid, user_index in self._users.items()
+                            if now - user_index.last_used > self.idle_seconds]
+        overflow = len(self._users) - len(evicted_uids) - self.max_users
+        if overflow > 0:
+            evicted_uids += [uid for uid in self._users if uid not in evicted_uids][:overflow]
+
+        evicted = []
+        for uid in evicted_uids:
+            user_index = self._users.pop(uid)
+            self._evicted_versions[uid] = user_index.version + 1
+            self._build_locks.pop(uid, None)
+            evicted.append(user_index)
+        if evicted:
+            print(f"Evicted {len(evicted)} receipt indexes ({len(self._users)} kept)")
+        return evicted
+
+    def _watch_user(self, uid: str, user_index: _UserIndex) -> None:
+        """Follow receipt changes in Firestore for this user"""
+        def on_snapshot(_, changes, __):
+            with self._lock:
+                for change in changes:
+                    if change.type.name == 'REMOVED':
+                        user_index.remove(change.document.id)
+                    else:
+                        user_index.add(change.document.id, change.document.to_dict() or {})
+
+        try:
+            receipts_ref = firestore_service.db.collection('receipts')
+            for owner_field in ('user_id', 'uid'):
+                user_index.watches.append(
+                    receipts_ref.where(owner_field, '==', uid).on_snapshot(on_snapshot)
+                )
+        except Exception as e:
+            print(f"Warning: Could not watch receipts for {uid}: {e}")
+
+    def on_receipt_write(self, uid: str, receipt_id: str, receipt: Optional[Dict[str, Any]]) -> None:
+        """FirestoreService listener: apply a receipt write to an already built index"""
+        with self._lock:
+            self._write_counts[uid] += 1
+            user_index = self._users.get(uid)
+            if user_index is None:
+                if uid in self._pending_writes:
+                    # The index is being built and its Firestore read may predate this write
+                    self._pending_writes[uid].append((receipt_id, receipt))
+                # Otherwise built lazily from Firestore on first search, which will include this write
+                return
+            if receipt is None:
+                user_index.remove(receipt_id)
+            else:
+                user_index.add(receipt_id, receipt)
+
+    def index_receipt(self, uid: str, receipt_id: str, receipt: Dict[str, Any]) -> None:
+        """Add or replace a receipt in the user's index"""
+        user_index = self._get_user_index(uid)
+        with self._lock:
+            user_index.add(receipt_id, receipt)
+
+    def remove_receipt(self, uid: str, receipt_id: str) -> None:
+        """Remove a receipt from the user's index"""
+        user_index = self._get_user_index(uid)
+        with self._lock:
+            user_index.remove(receipt_id)
+
+    def get_version(self, uid: str) -> int:
+        """Counter that changes whenever the user's indexed receipts change"""
+        user_index = self._get_user_index(uid)
+        with self._lock:
+            return user_index.version
+
+    def peek_version(self, uid: str) -> Optional[int]:
+        """The user's version if their index is already built, without building it"""
+        with self._lock:
+            user_index = self._users.get(uid)
+            return user_index.version if user_index is not None else None
+
+    def data_version(self, uid: str) -> Tuple[int, Optional[int]]:
+        """
+        Cheap version of the user's receipt data that never builds the index
+
+        Changes on every receipt write through FirestoreService and, once the index
+        is built, on writes made directly to Firestore as well.
+        """
+        with self._lock:
+            return self._write_counts.get(uid, 0), self.peek_version(uid)
+
+    def _expand_token(self, user_index: _UserIndex, token: str, fuzzy: bool) -> Dict[str, int]:
+        """Indexed terms matching a query token, with their match scores"""
+        vocabulary = user_index.sorted_vocabulary()
+        matches = {}
+        if token in user_index.postings:
+            matches[token] = self.EXACT_SCORE
+
+        position = bisect.bisect_left(vocabulary, token)
+        while position < len(vocabulary) and vocabulary[position].startswith(token):
+            matches.setdefault(vocabulary[position], self.PREFIX_SCORE)
+            position += 1
+
+        if fuzzy and not matches:
+            for term in difflib.get_close_matches(token, vocabulary, n=3, cutoff=0.75):
+                matches[term] = self.FUZZY_SCORE
+        return matches
+
+    def search(self, uid: str, query: str, limit: int = 20, fuzzy: bool = True) -> List[Dict[str, Any]]:
+        """
+        Search a user's purchases by store, item name, brand or category
+
+        Every query token must match (exactly, as a prefix, or fuzzily) somewhere on
+        a receipt. Results are ordered by match score, then most recent first.
+
+        Args:
+            uid: User ID
+            query: Free-text search such as "almond milk" or "walm"
+            limit: Maximum number of receipts to return
+            fuzzy: Allow approximate matches for misspelled tokens
+
+        Returns:
+            List of receipt summaries with the items that matched
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        user_index = self._get_user_index(uid)
+        with self._lock:
+            receipt_scores: Dict[str, int] = {}
+            matched_positions: Dict[str, Set[int]] = defaultdict(set)
+
+            for i, token in enumerate(tokens):
+                token_scores: Dict[str, int] = {}
+                for term, score in self._expand_token(user_index, token, fuzzy).items():
+                    for receipt_id, position in user_index.postings[term]:
+                        token_scores[receipt_id] = max(token_scores.get(receipt_id, 0), score)
+                        matched_positions[receipt_id].add(position)
+
+                if i == 0:
+                    receipt_scores = token_scores
+                else:
+                    receipt_scores = {
+                        receipt_id: score + token_scores[receipt_id]
+                        for receipt_id, score in receipt_scores.items()
+                        if receipt_id in token_scores
+                    }
+                if not receipt_scores:
+                    return []
+
+            results = []
+            for receipt_id, score in receipt_scores.items():
+                receipt = user_index.receipts[receipt_id]
+                positions = matched_positions[receipt_id]
+                results.append({
+                    "receipt_id": receipt_id,
+                    "store": receipt["store"],
+                    "timestamp": receipt["timestamp"],
+                    "total_amount": receipt["total_amount"],
+                    "store_matched": STORE_POSITION in positions,
+                    "matched_items": [
+                        receipt["items"][position] for position in sorted(positions)
+                        if position != STORE_POSITION
+                    ],
+                    "score": score
+                })
+
+        results.sort(key=lambda r: (r["score"], str(r["timestamp"] or '')), reverse=True)
+        return results[:limit]
+
+
+# Global instance
+receipt_index = ReceiptIndex()
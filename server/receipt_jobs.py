@@ -0,0 +1,458 @@
+# server/receipt_jobs.py
+# In-process background job queue for receipt processing with bounded worker concurrency
+#
+# /api/process-receipt enqueues a job and returns immediately; a fixed pool of asyncio
+# workers runs each job through the ReceiptPipeline (download, preprocessing, extraction,
+# validation, enrichment, persist) and records its stage and progress in memory and in Firestore
+# (processing_status/{receipt_id}), which /api/process-status reads. Stage transitions
+# are also pushed to subscribers, so /api/process-status/stream can follow all of a
+# user's uploads over one Server-Sent Events connection instead of polling.
+#
+# Bulk uploads (submit_batch) share the queue at a lower priority than interactive
+# uploads, and reserved workers only ever take interactive jobs, so a user uploading
+# one receipt is never stuck behind someone else's shoebox of 200.
+#
+#   RASEED_RECEIPT_WORKERS            receipts processed concurrently (default 4)
+#   RASEED_RECEIPT_RESERVED_WORKERS   extra workers for interactive uploads only (default 1)
+#   RASEED_RECEIPT_QUEUE_MAX          queued receipts before new submissions are rejected (default 1000)
+#   RASEED_RECEIPT_BATCH_MAX          receipts accepted in one bulk submission (default 500)
+
+import asyncio
+import itertools
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from firestore_service import firestore_service
+from llm_usage import usage_scope
+from receipt_dedupe import DuplicateReceiptError
+
+RECEIPT_WORKERS = int(os.getenv("RASEED_RECEIPT_WORKERS", "4"))
+RESERVED_WORKERS = int(os.getenv("RASEED_RECEIPT_RESERVED_WORKERS", "1"))
+RECEIPT_QUEUE_MAX = int(os.getenv("RASEED_RECEIPT_QUEUE_MAX", "1000"))
+RECEIPT_BATCH_MAX = int(os.getenv("RASEED_RECEIPT_BATCH_MAX", "500"))
+
+# Queue priorities (lower runs first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Finished jobs kept in memory for status lookups (older ones are read from Firestore)
+FINISHED_JOBS_KEPT = 2000
+# Bulk submissions kept in memory for /api/process-receipts/batch lookups
+BATCHES_KEPT = 200
+# Assumed duration of one job until real timings are available
+DEFAULT_JOB_SECONDS = 20.0
+# Seconds between keep-alive events on an idle status stream
+STREAM_KEEPALIVE_SECONDS = 15.0
+# Jobs finished this recently are still in a stream's snapshot, so a client that
+# connects (or reconnects) just after a job ends still sees its terminal status
+SNAPSHOT_FINISHED_SECONDS = 300
+
+# Stage -> (progress %, message), in pipeline order
+STAGES = OrderedDict([
+    ("queued", (0, "Waiting to be processed")),
+    ("downloading", (10, "Downloading receipt image")),
+    ("preprocessing", (20, "Optimizing receipt image")),
+    ("extracting", (30, "Reading your receipt")),
+    ("validating", (60, "Checking totals and dates")),
+    ("enriching", (75, "Categorizing items")),
+    ("saving", (90, "Saving receipt")),
+    ("saved", (100, "Receipt processed")),
+    ("duplicate", (100, "Receipt was already uploaded")),
+    ("failed", (100, "Processing failed")),
+])
+TERMINAL_STAGES = {"saved", "duplicate", "failed"}
+
+
+class QueueFullError(Exception):
+    """Raised when the receipt queue is at capacity"""
+
+
+class ReceiptJob:
+    """One uploaded receipt moving through the pipeline"""
+
+    def __init__(self, request: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE):
+        self.request = request
+        self.receipt_id: str = request["receiptId"]
+        self.uid: str = request["userId"]
+        self.batch_id: Optional[str] = request.get("batchId")
+        self.priority = priority
+        self.claimed = False
+        self.processing_id = f"proc_{int(time.time())}_{self.receipt_id}"
+        self.status = "queued"
+        self.progress, self.message = STAGES["queued"]
+        self.error: Optional[str] = None
+        self.duplicate_of: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.stage_seconds: Dict[str, float] = {}
+        self._stage_started = time.perf_counter()
+        # Write of the "queued" status, which must land before the worker's stage updates
+        self.queued_write: Optional[asyncio.Future] = None
+
+    def enter_stage(self, stage: str, message: Optional[str] = None) -> None:
+        now = time.perf_counter()
+        self.stage_seconds[self.status] = round(now - self._stage_started, 3)
+        self._stage_started = now
+        self.status = stage
+        self.progress, default_message = STAGES[stage]
+        self.message = message or default_message
+        if stage in TERMINAL_STAGES:
+            self.finished_at = datetime.now()
+
+    def to_status(self) -> Dict[str, Any]:
+        """Status document in the /api/process-status response format"""
+        return {
+            "processingId": self.processing_id,
+            "receiptId": self.receipt_id,
+            "userId": self.uid,
+            "fileName": self.request.get("fileName"),
+            "batchId": self.batch_id,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "duplicateOf": self.duplicate_of,
+            "createdAt": self.created_at.isoformat(),
+            "startedAt": self.started_at.isoformat() if self.started_at else None,
+            "finishedAt": self.finished_at.isoformat() if self.finished_at else None,
+            "stageSeconds": self.stage_seconds,
+        }
+
+
+class ReceiptBatch:
+    """A bulk submission of receipts and the outcome of each one"""
+
+    def __init__(self, uid: str):
+        self.batch_id = f"batch_{uuid.uuid4().hex[:16]}"
+        self.uid = uid
+        self.receipt_ids: List[str] = []
+        # Items refused at submission: {"receiptId", "fileName", "status": "rejected", "error"}
+        self.rejected: List[Dict[str, Any]] = []
+        self.created_at = datetime.now()
+
+
+class ReceiptJobQueue:
+    """
+    Bounded asyncio priority queue of receipt jobs drained by a fixed pool of workers
+
+    start() must be awaited on the server's event loop before jobs are submitted.
+    """
+
+    def __init__(self, pipeline_factory: Callable[[], Any], workers: int = RECEIPT_WORKERS,
+                 max_queued: int = RECEIPT_QUEUE_MAX, reserved_workers: int = RESERVED_WORKERS):
+        self.pipeline_factory = pipeline_factory
+        self.workers = workers
+        self.reserved_workers = reserved_workers
+        self.max_queued = max_queued
+        self.jobs: "OrderedDict[str, ReceiptJob]" = OrderedDict()
+        self.batches: "OrderedDict[str, ReceiptBatch]" = OrderedDict()
+        # (priority, sequence, job); interactive jobs are also put on _interactive
+        # for the reserved workers, and whichever worker claims a job first runs it.
+        # The copy left behind is skipped, so capacity is checked against _waiting
+        # (jobs not claimed yet) rather than the queue sizes.
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._interactive: Optional[asyncio.Queue] = None
+        self._waiting = 0
+        self._sequence = itertools.count()
+        self._pipeline = None
+        self._tasks = []
+        self._job_seconds_total = 0.0
+        self._jobs_finished = 0
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._interactive = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(self._queue)) for _ in range(self.workers)]
+        self._tasks += [asyncio.create_task(self._worker(self._interactive)) for _ in range(self.reserved_workers)]
+        print(f"🧾 Receipt job queue started with {self.workers} workers "
+              f"(+{self.reserved_workers} reserved for interactive uploads)")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._interactive = None
+
+    async def submit(self, request: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE) -> ReceiptJob:
+        """
+        Queue an uploaded receipt for processing
+
+        Args:
+            request: ReceiptProcessRequest fields
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BULK
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: The queue is at capacity
+        """
+        if self._queue is None:
+            raise RuntimeError("Receipt job queue is not started")
+
+        job, queued = self._enqueue(request, priority)
+        if queued:
+            job.queued_write = asyncio.ensure_future(asyncio.to_thread(
+                firestore_service.save_processing_status, job.receipt_id, job.to_status()
+            ))
+            await asyncio.shield(job.queued_write)
+        return job
+
+    def _enqueue(self, request: Dict[str, Any], priority: int) -> Tuple[ReceiptJob, bool]:
+        """
+        Put a receipt on the queue and publish its queued status, without saving it
+
+        Returns:
+            Tuple of (job, whether it was newly queued rather than already in flight)
+
+        Raises:
+            QueueFullError: The queue is at capacity
+        """
+        existing = self.jobs.get(request["receiptId"])
+        if existing and existing.status not in TERMINAL_STAGES:
+            # Already queued or running (e.g. a client retry)
+            return existing, False
+
+        if self._waiting >= self.max_queued:
+            raise QueueFullError(f"Receipt queue is full ({self.max_queued} jobs waiting)")
+        job = ReceiptJob(request, priority)
+        self._queue.put_nowait((priority, next(self._sequence), job))
+        self._waiting += 1
+        if priority == PRIORITY_INTERACTIVE:
+            self._interactive.put_nowait(job)
+
+        self.jobs[job.receipt_id] = job
+        self.jobs.move_to_end(job.receipt_id)
+        self._prune()
+        self._publish(job.uid, job.to_status())
+        return job, True
+
+    async def submit_batch(self, uid: str, requests: List[Dict[str, Any]],
+                           refused: Optional[List[Dict[str, Any]]] = None) -> ReceiptBatch:
+        """
+        Queue many receipts of one user at bulk priority
+
+        Args:
+            uid: Owner of the receipts
+            requests: ReceiptProcessRequest fields for each receipt
+            refused: Items already refused by the caller ({"fileName", "error"}), reported with the batch
+
+        Returns:
+            The batch, with the receipts that were queued and those refused
+
+        Raises:
+            QueueFullError: The queue has no room for the whole batch
+        """
+        if self._queue is None:
+            raise RuntimeError("Receipt job queue is not started")
+        if len(requests) > RECEIPT_BATCH_MAX:
+            raise ValueError(f"At most {RECEIPT_BATCH_MAX} receipts can be submitted at once")
+        if self._waiting + len(requests) > self.max_queued:
+            raise QueueFullError(f"Receipt queue cannot take {len(requests)} more jobs right now")
+
+        batch = ReceiptBatch(uid)
+        for item in refused or []:
+            batch.rejected.append({"receiptId": None, "status": "rejected", **item})
+        queued: List[ReceiptJob] = []
+        for request in requests:
+            if request.get("userId") != uid:
+                batch.rejected.append({"receiptId": request.get("receiptId"), "fileName": request.get("fileName"),
+                                       "status": "rejected", "error": "Receipt belongs to a different user"})
+                continue
+            job, is_new = self._enqueue({**request, "batchId": batch.batch_id}, PRIORITY_BULK)
+            if is_new:
+                queued.append(job)
+            if job.receipt_id not in batch.receipt_ids:
+                batch.receipt_ids.append(job.receipt_id)
+
+        # One batched write for the whole submission, off the event loop
+        write = asyncio.ensure_future(asyncio.to_thread(
+            firestore_service.save_processing_statuses, {job.receipt_id: job.to_status() for job in queued}
+        ))
+        for job in queued:
+            job.queued_write = write
+
+        self.batches[batch.batch_id] = batch
+        while len(self.batches) > BATCHES_KEPT:
+            self.batches.popitem(last=False)
+        print(f"🧾 Batch {batch.batch_id}: {len(batch.receipt_ids)} receipts queued for {uid}")
+        await asyncio.shield(write)
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Per-receipt outcomes and status counts of a bulk submission"""
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+
+        items = []
+        for receipt_id in batch.receipt_ids:
+            items.append(self.get_status(receipt_id) or {"receiptId": receipt_id, "status": "unknown"})
+        items += batch.rejected
+
+        counts: Dict[str, int] = {}
+        for item in items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return {
+            "batchId": batch.batch_id,
+            "userId": batch.uid,
+            "createdAt": batch.created_at.isoformat(),
+            "total": len(items),
+            "done": all(item["status"] in TERMINAL_STAGES | {"rejected"} for item in items),
+            "counts": counts,
+            "items": items,
+        }
+
+    def estimated_completion(self, job: ReceiptJob) -> datetime:
+        """When a newly queued job should finish, from the queue depth and average job time"""
+        average = self._job_seconds_total / self._jobs_finished if self._jobs_finished else DEFAULT_JOB_SECONDS
+        waiting = self._waiting
+        rounds = waiting // max(1, self.workers) + 1
+        return job.created_at + timedelta(seconds=average * rounds)
+
+    def get_status(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        """Current status of a receipt's processing, from memory or Firestore"""
+        job = self.jobs.get(receipt_id)
+        if job is not None:
+            return job.to_status()
+        return firestore_service.get_processing_status(receipt_id)
+
+    def active_statuses(self, uid: str) -> list:
+        """Statuses of the user's receipts that are still processing or finished in the last few minutes"""
+        finished_since = datetime.now() - timedelta(seconds=SNAPSHOT_FINISHED_SECONDS)
+        return [job.to_status() for job in self.jobs.values()
+                if job.uid == uid and (job.finished_at is None or job.finished_at >= finished_since)]
+
+    async def subscribe(self, uid: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Follow the processing of all of a user's receipts
+
+        Yields a ``snapshot`` event with the user's in-flight and recently finished
+        jobs, then a ``status`` event for every stage transition of any of their
+        receipts, and a ``ping`` event when nothing has happened for
+        STREAM_KEEPALIVE_SECONDS.
+
+        Args:
+            uid: User whose receipts to follow
+
+        Yields:
+            Dicts with ``event`` and ``data`` keys
+        """
+        updates: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(uid, set()).add(updates)
+        try:
+            yield {"event": "snapshot", "data": {"jobs": self.active_statuses(uid)}}
+            while True:
+                try:
+                    status = await asyncio.wait_for(updates.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield {"event": "ping", "data": {"timestamp": datetime.now().isoformat()}}
+                    continue
+                yield {"event": "status", "data": status}
+        finally:
+            subscribers = self._subscribers.get(uid)
+            if subscribers is not None:
+                subscribers.discard(updates)
+                if not subscribers:
+                    del self._subscribers[uid]
+
+    def stats(self) -> Dict[str, Any]:
+        active = [job for job in self.jobs.values() if job.status not in TERMINAL_STAGES]
+        return {
+            "workers": self.workers,
+            "reserved_workers": self.reserved_workers,
+            "queued": sum(1 for job in active if job.status == "queued"),
+            "running": sum(1 for job in active if job.status != "queued"),
+            "bulk_active": sum(1 for job in active if job.priority == PRIORITY_BULK),
+            "batches": len(self.batches),
+            "finished": self._jobs_finished,
+            "avg_job_seconds": round(self._job_seconds_total / self._jobs_finished, 2) if self._jobs_finished else None,
+            "status_streams": sum(len(subscribers) for subscribers in self._subscribers.values()),
+        }
+
+    def _publish(self, uid: str, status: Dict[str, Any]) -> None:
+        # Subscriber queues are unbounded and live on the same event loop as the workers
+        for updates in self._subscribers.get(uid, ()):
+            updates.put_nowait(status)
+
+    async def _set_stage(self, job: ReceiptJob, stage: str, message: Optional[str] = None) -> None:
+        job.enter_stage(stage, message)
+        print(f"🧾 {job.receipt_id}: {stage} ({job.progress}%)")
+        status = job.to_status()
+        self._publish(job.uid, status)
+        await asyncio.to_thread(firestore_service.save_processing_status, job.receipt_id, status)
+
+    async def _worker(self, source: asyncio.Queue) -> None:
+        while True:
+            entry = await source.get()
+            job = entry[-1] if isinstance(entry, tuple) else entry
+            try:
+                if not job.claimed:
+                    job.claimed = True
+                    self._waiting -= 1
+                    await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # _run reports pipeline errors itself; this catches failures in that reporting
+                print(f"❌ Receipt {job.receipt_id} worker error: {str(e)}")
+                if job.status not in TERMINAL_STAGES:
+                    job.error = job.error or str(e)
+                    job.enter_stage("failed", f"Processing failed: {str(e)}")
+                    self._publish(job.uid, job.to_status())
+                    await asyncio.to_thread(firestore_service.save_processing_status, job.receipt_id, job.to_status())
+            finally:
+                source.task_done()
+
+    async def _run(self, job: ReceiptJob) -> None:
+        started = time.perf_counter()
+        try:
+            if job.queued_write is not None:
+                await asyncio.shield(job.queued_write)
+                job.queued_write = None
+            if self._pipeline is None:
+                self._pipeline = await asyncio.to_thread(self.pipeline_factory)
+            pipeline = self._pipeline
+            job.started_at = datetime.now()
+            endpoint = "receipt_pipeline_bulk" if job.priority == PRIORITY_BULK else "receipt_pipeline"
+            with usage_scope(endpoint=endpoint, uid=job.uid):
+                await pipeline.run(job.request, lambda stage: self._set_stage(job, stage))
+            await self._set_stage(job, "saved")
+        except asyncio.CancelledError:
+            raise
+        except DuplicateReceiptError as e:
+            job.duplicate_of = e.receipt_id
+            await self._set_stage(job, "duplicate", str(e))
+        except Exception as e:
+            print(f"❌ Receipt {job.receipt_id} failed in {job.status}: {str(e)}")
+            job.error = str(e)
+            await self._set_stage(job, "failed", f"Processing failed while {job.status}: {str(e)}")
+        finally:
+            # Zip uploads carry their image in the request; don't keep it around
+            job.request.pop("imageData", None)
+            self._job_seconds_total += time.perf_counter() - started
+            self._jobs_finished += 1
+
+    def _prune(self) -> None:
+        finished = [rid for rid, job in self.jobs.items() if job.status in TERMINAL_STAGES]
+        for receipt_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self.jobs[receipt_id]
+
+
+def _create_pipeline():
+    from agent_registry import registry
+    return registry.get("receipt_pipeline")
+
+
+# Global instance
+receipt_job_queue = ReceiptJobQueue(_create_pipeline)
@@ -0,0 +1,173 @@
+# server/receipt_preprocessing.py
+# Shrinks receipt photos before model extraction
+#
+# Phone photos are several MB at full resolution, most of it background and colour the
+# model does not need. Before extraction each image is rotated upright from its EXIF
+# orientation, cropped to the bright paper region, converted to grayscale, downscaled
+# to a target long edge and re-encoded as JPEG. The result is kept only if it is smaller.
+# Requires Pillow; without it images are passed through unchanged.
+#
+#   RASEED_RECEIPT_PREPROCESS     set to 0 to send original images (default 1)
+#   RASEED_RECEIPT_LONG_EDGE      target long edge in pixels (default 1600)
+#   RASEED_RECEIPT_JPEG_QUALITY   JPEG quality of the re-encoded image (default 80)
+#
+# Benchmark: cd server && python receipt_preprocessing.py <image files> [--extract]
+
+import io
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional
+    Image = None
+
+PREPROCESS_ENABLED = os.getenv("RASEED_RECEIPT_PREPROCESS", "1").lower() not in ("0", "false", "no")
+TARGET_LONG_EDGE = int(os.getenv("RASEED_RECEIPT_LONG_EDGE", "1600"))
+JPEG_QUALITY = int(os.getenv("RASEED_RECEIPT_JPEG_QUALITY", "80"))
+
+# Document crop: analysed on a thumbnail, kept only if it covers enough of the photo
+CROP_ANALYSIS_EDGE = 256
+CROP_MIN_AREA = 0.2
+CROP_PADDING = 0.02
+
+
+@dataclass
+class PreparedImage:
+    """An image ready to send to the extraction model"""
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    size: Optional[Tuple[int, int]] = None
+    seconds: float = 0.0
+    preprocessed: bool = False
+
+    def as_part(self) -> dict:
+        """Inline image part for generate_content"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def _document_box(gray) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box of the bright paper region, in the coordinates of gray"""
+    thumb = gray.copy()
+    thumb.thumbnail((CROP_ANALYSIS_EDGE, CROP_ANALYSIS_EDGE))
+    histogram = thumb.histogram()
+    pixels = sum(histogram)
+    mean = sum(level * count for level, count in enumerate(histogram)) / pixels
+
+    # Receipt paper is lighter than the table or hand it is photographed on
+    mask = thumb.point(lambda level: 255 if level > mean else 0)
+    box = mask.getbbox()
+    if not box:
+        return None
+
+    left, top, right, bottom = box
+    if (right - left) * (bottom - top) < CROP_MIN_AREA * thumb.width * thumb.height:
+        return None
+
+    scale_x, scale_y = gray.width / thumb.width, gray.height / thumb.height
+    pad_x, pad_y = gray.width * CROP_PADDING, gray.height * CROP_PADDING
+    return (
+        max(0, int(left * scale_x - pad_x)),
+        max(0, int(top * scale_y - pad_y)),
+        min(gray.width, int(right * scale_x + pad_x)),
+        min(gray.height, int(bottom * scale_y + pad_y)),
+    )
+
+
+def preprocess_receipt_image(data: bytes, mime_type: str,
+                             long_edge: int = TARGET_LONG_EDGE,
+                             quality: int = JPEG_QUALITY) -> PreparedImage:
+    """
+    Rotate, crop, grayscale, downscale and re-encode a receipt photo
+
+    Args:
+        data: Original image bytes
+        mime_type: Original MIME type
+        long_edge: Maximum length of the longer side in pixels
+        quality: JPEG quality of the re-encoded image
+
+    Returns:
+        PreparedImage with the smaller of the processed and original encodings
+    """
+    started = time.perf_counter()
+    original = PreparedImage(data=data, mime_type=mime_type, original_bytes=len(data))
+    if Image is None or not PREPROCESS_ENABLED:
+        return original
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            gray = image.convert("L")
+
+        box = _document_box(gray)
+        if box:
+            gray = gray.crop(box)
+        if max(gray.size) > long_edge:
+            gray.thumbnail((long_edge, long_edge), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        gray.save(buffer, format="JPEG", quality=quality, optimize=True)
+        processed = buffer.getvalue()
+    except Exception as e:
+        # Formats Pillow cannot read (e.g. HEIC without a plugin) go to the model as-is
+        print(f"Warning: Receipt preprocessing skipped: {e}")
+        return original
+
+    original.seconds = time.perf_counter() - started
+    if len(processed) >= len(data):
+        return original
+    return PreparedImage(data=processed, mime_type="image/jpeg", original_bytes=len(data),
+                         size=gray.size, seconds=original.seconds, preprocessed=True)
+
+
+if __name__ == "__main__":
+    # Size, time and (with --extract) extraction agreement of preprocessed vs original images
+    import mimetypes
+    import sys
+
+    if Image is None:
+        sys.exit("Pillow is required for the benchmark: pip install Pillow")
+
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    compare_extraction = "--extract" in sys.argv
+    if not paths:
+        sys.exit("usage: python receipt_preprocessing.py <image files> [--extract]")
+
+    pipeline = None
+    if compare_extraction:
+        from agents.ReceiptOrchestrator.pipeline import ReceiptPipeline
+        pipeline = ReceiptPipeline()
+
+    def _summary(receipt: dict) -> tuple:
+        receipt = ReceiptPipeline.enrich(receipt)
+        return (str(receipt["store"]).lower(), receipt["total_amount"], len(receipt["items"]))
+
+    total_original = total_processed = 0
+    agreed = 0
+    print(f"📊 Receipt preprocessing (long edge {TARGET_LONG_EDGE}px, JPEG q{JPEG_QUALITY})")
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        mime_type = mimetypes.guess_type(path)[0] or "image/jpeg"
+        prepared = preprocess_receipt_image(data, mime_type)
+        total_original += len(data)
+        total_processed += len(prepared.data)
+        line = (f"   {os.path.basename(path):<28} {len(data) / 1024:8.0f} KB -> {len(prepared.data) / 1024:6.0f} KB"
+                f"   {prepared.seconds * 1000:6.0f} ms")
+
+        if pipeline is not None:
+            before = _summary(pipeline.extract(data, mime_type))
+            after = _summary(pipeline.extract(prepared.data, prepared.mime_type))
+            agreed += before == after
+            line += f"   {'same' if before == after else f'differs: {before} vs {after}'}"
+        print(line)
+
+    # Base64 text parts would have added a third on top of the original bytes
+    print(f"   total {total_original / 1024:.0f} KB -> {total_processed / 1024:.0f} KB "
+          f"({100 * (1 - total_processed / max(1, total_original)):.0f}% smaller, "
+          f"{total_original * 4 / 3 / 1024:.0f} KB as base64 before)")
+    if pipeline is not None:
+        print(f"   extraction agreement (store, total, item count): {agreed}/{len(paths)}")
@@ -7,24 +7,30 @@ The agent intelligently handles all user queries through a single chat interface
 """
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, Optional
 from auth_middleware import get_current_user_optional
 import traceback
+import json
 from datetime import datetime
 
-# Import the new modular chatbot agent
+# Shared chatbot agent, built once on first use
+from agent_registry import get_chatbot_agent
 from agents.chatbot import RaseedChatbotAgent
+from llm_usage import QuotaExceededError, usage_tracker
 
 router = APIRouter()
 
-# Initialize the agent (single instance for efficiency)
-try:
-    chatbot_agent = RaseedChatbotAgent()
-    print("✅ Raseed Chatbot Agent successfully initialized for routes")
-except Exception as e:
-    print(f"❌ Failed to initialize Raseed Chatbot Agent: {str(e)}")
-    chatbot_agent = None
+
+def _get_chatbot_agent() -> Optional[RaseedChatbotAgent]:
+    """The shared chatbot agent, or None if it could not be initialized"""
+    try:
+        return get_chatbot_agent()
+    except Exception as e:
+        print(f"❌ Failed to initialize Raseed Chatbot Agent: {str(e)}")
+        return None
 
 
 class ChatMessage(BaseModel):
@@ -47,18 +53,40 @@ class AgentStatusResponse(BaseModel):
     version: str
 
 
+def _resolve_uid(current_user: Optional[dict], requested_uid: Optional[str]) -> str:
+    """Prefer the authenticated user, then the uid in the request, then the dev default"""
+    if current_user:
+        return current_user.get('uid') or requested_uid or "user1"
+    return requested_uid or "user1"
+
+
+def _check_quota(uid: str) -> None:
+    """Reject the request with 429 if the user has used up today's token quota"""
+    try:
+        usage_tracker.check_quota(uid)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+def _format_sse(event: str, data: Dict) -> str:
+    """Serialize an event in Server-Sent Events wire format"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_agent(
     chat_request: ChatMessage,
-    current_user: Optional[str] = Depends(get_current_user_optional)
+    current_user: Optional[dict] = Depends(get_current_user_optional)
 ):
+    _check_quota(_resolve_uid(current_user, chat_request.uid))
    
     try:
         # Use authenticated user ID or fallback to provided/default
-        uid = current_user or chat_request.uid or "user1"
+        uid = _resolve_uid(current_user, chat_request.uid)
         
         print(f"🤖 Agent chat request from {uid}: '{chat_request.message}'")
         
+        chatbot_agent = await run_in_threadpool(_get_chatbot_agent)
         if not chatbot_agent:
             return ChatResponse(
                 success=False,
@@ -69,8 +97,9 @@ async def chat_with_agent(
             )
         
         # Process the query using our modular agent
-        # The agent will intelligently determine what tools to use
-        response_text = chatbot_agent.process_query(chat_request.message, uid)
+        # The agent will intelligently determine what tools to use; it blocks on
+        # Firestore and the model (up to the LLM deadline), so keep it off the event loop
+        response_text = await run_in_threadpool(chatbot_agent.process_query, chat_request.message, uid)
         
         return ChatResponse(
             success=True,
@@ -87,12 +116,48 @@ async def chat_with_agent(
         return ChatResponse(
             success=False,
             response="❌ I encountered an error processing your request. Please try again.",
-            uid=chat_request.uid or current_user or "user1",
+            uid=_resolve_uid(current_user, chat_request.uid),
             timestamp=str(datetime.now()),
             error=error_msg
         )
 
 
+@router.post("/chat/stream")
+async def chat_with_agent_stream(
+    chat_request: ChatMessage,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
+    """
+    Streaming variant of /chat using Server-Sent Events
+
+    Emits ``progress`` events while data is fetched, ``token`` events as Gemini
+    generates the answer, and a final ``done`` event with response metadata.
+    If Gemini misses the LLM deadline a fallback answer is sent as tokens,
+    followed by an ``upgrade`` event if the model's answer arrives in time.
+    """
+    uid = _resolve_uid(current_user, chat_request.uid)
+    _check_quota(uid)
+    print(f"🤖 Agent stream request from {uid}: '{chat_request.message}'")
+
+    def event_stream():
+        chatbot_agent = _get_chatbot_agent()
+        if not chatbot_agent:
+            yield _format_sse("error", {
+                "message": "❌ Agent is currently unavailable. Please try again later.",
+                "error": "Agent initialization failed"
+            })
+            return
+
+        for event in chatbot_agent.stream_query(chat_request.message, uid):
+            yield _format_sse(event["event"], event["data"])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/status", response_model=AgentStatusResponse)
 async def get_agent_status():
     """
@@ -104,6 +169,7 @@ async def get_agent_status():
     try:
         from agents.chatbot import __version__
         
+        chatbot_agent = _get_chatbot_agent()
         return AgentStatusResponse(
             status="healthy" if chatbot_agent else "unavailable",
             agent_available=chatbot_agent is not None,
@@ -13,18 +13,20 @@ from auth_middleware import get_current_user_optional
 import traceback
 from datetime import datetime
 
-# Import the new modular chatbot agent
+# Shared chatbot agent, built once on first use
+from agent_registry import get_chatbot_agent
 from agents.chatbot import RaseedChatbotAgent
 
 router = APIRouter()
 
-# Initialize the agent (single instance for efficiency)
-try:
-    chatbot_agent = RaseedChatbotAgent()
-    print("✅ Raseed Chatbot Agent successfully initialized for routes")
-except Exception as e:
-    print(f"❌ Failed to initialize Raseed Chatbot Agent: {str(e)}")
-    chatbot_agent = None
+
+def _get_chatbot_agent() -> Optional[RaseedChatbotAgent]:
+    """The shared chatbot agent, or None if it could not be initialized"""
+    try:
+        return get_chatbot_agent()
+    except Exception as e:
+        print(f"❌ Failed to initialize Raseed Chatbot Agent: {str(e)}")
+        return None
 
 
 class ChatMessage(BaseModel):
@@ -78,6 +80,7 @@ async def chat_with_agent(
         
         print(f"🤖 Agent chat request from {uid}: '{chat_request.message}'")
         
+        chatbot_agent = _get_chatbot_agent()
         if not chatbot_agent:
             return ChatResponse(
                 success=False,
@@ -123,6 +126,7 @@ async def get_agent_status():
     try:
         from agents.chatbot import __version__
         
+        chatbot_agent = _get_chatbot_agent()
         return AgentStatusResponse(
             status="healthy" if chatbot_agent else "unavailable",
             agent_available=chatbot_agent is not None,
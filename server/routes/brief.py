@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from agent_registry import get_daily_brief_service
+
+# Remove prefix since it's added in main.py
+router = APIRouter(tags=["brief"])
+
+@router.get("")
+async def get_daily_brief(
+    user_id: str = Query(..., description="User ID")
+):
+    """Today's precomputed brief: key metrics, recommendations and a short narrative"""
+    try:
+        service = get_daily_brief_service()
+        brief = service.get_brief(user_id)
+        return {"success": True, "brief": brief, "text": service.format_brief(brief)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading daily brief: {str(e)}")
+
+@router.post("/refresh")
+async def refresh_daily_brief(
+    user_id: str = Query(..., description="User ID")
+):
+    """Rebuild the user's brief now"""
+    try:
+        service = get_daily_brief_service()
+        brief = service.build_brief(user_id, force=True)
+        return {"success": True, "brief": brief, "text": service.format_brief(brief)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error refreshing daily brief: {str(e)}")
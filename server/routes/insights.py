@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
+import asyncio
 import sys
 import os
 
@@ -24,7 +25,7 @@ async def get_financial_health_score(
 ):
     """Get Financial Health Score analysis"""
     try:
-        result = compute_and_update_fhs(user_id)
+        result = await asyncio.to_thread(compute_and_update_fhs, user_id)
         return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error computing FHS: {str(e)}")
@@ -36,7 +37,7 @@ async def get_recurring_patterns(
 ):
     """Get recurring purchase patterns analysis"""
     try:
-        result = analyze_purchase_patterns(user_id)
+        result = await asyncio.to_thread(analyze_purchase_patterns, user_id)
         return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing recurring patterns: {str(e)}")
@@ -48,7 +49,7 @@ async def get_need_want_analysis(
 ):
     """Get need vs want spending analysis"""
     try:
-        result = analyze_spending_classification(user_id)
+        result = await asyncio.to_thread(analyze_spending_classification, user_id)
         return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing need vs want: {str(e)}")
@@ -60,7 +61,7 @@ async def get_spending_overlaps(
 ):
     """Get spending overlaps and duplicate subscriptions"""
     try:
-        result = detect_spending_overlaps(user_id)
+        result = await asyncio.to_thread(detect_spending_overlaps, user_id)
         return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error detecting overlaps: {str(e)}")
@@ -72,7 +73,7 @@ async def get_pantry_analysis(
 ):
     """Get pantry management and food waste analysis"""
     try:
-        result = analyze_pantry_patterns(user_id)
+        result = await asyncio.to_thread(analyze_pantry_patterns, user_id)
         return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing pantry: {str(e)}")
@@ -84,7 +85,7 @@ async def get_micro_moment_analysis(
 ):
     """Get micro-moment and impulse spending analysis"""
     try:
-        result = analyze_micro_moments(user_id)
+        result = await asyncio.to_thread(analyze_micro_moments, user_id)
         return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing micro moments: {str(e)}")
@@ -95,36 +96,22 @@ async def get_all_insights(
     timeRange: str = Query("month", description="Time range for analysis")
 ):
     """Get all available insights for a user"""
+    analyzers = {
+        "fhs": compute_and_update_fhs,
+        "recurring": analyze_purchase_patterns,
+        "need_want": analyze_spending_classification,
+        "overlap": detect_spending_overlaps,
+        "pantry": analyze_pantry_patterns,
+        "micro_moment": analyze_micro_moments,
+    }
+    # Run side by side, so the request waits for the slowest model call rather than all six in turn
+    outcomes = await asyncio.gather(
+        *(asyncio.to_thread(analyzer, user_id) for analyzer in analyzers.values()),
+        return_exceptions=True
+    )
+
     results = {}
+    for name, outcome in zip(analyzers, outcomes):
+        results[name] = {"error": str(outcome)} if isinstance(outcome, Exception) else outcome
     
-    try:
-        results["fhs"] = compute_and_update_fhs(user_id)
-    except Exception as e:
-        results["fhs"] = {"error": str(e)}
-    
-    try:
-        results["recurring"] = analyze_purchase_patterns(user_id)
-    except Exception as e:
-        results["recurring"] = {"error": str(e)}
-    
-    try:
-        results["need_want"] = analyze_spending_classification(user_id)
-    except Exception as e:
-        results["need_want"] = {"error": str(e)}
-    
-    try:
-        results["overlap"] = detect_spending_overlaps(user_id)
-    except Exception as e:
-        results["overlap"] = {"error": str(e)}
-    
-    try:
-        results["pantry"] = analyze_pantry_patterns(user_id)
-    except Exception as e:
-        results["pantry"] = {"error": str(e)}
-    
-    try:
-        results["micro_moment"] = analyze_micro_moments(user_id)
-    except Exception as e:
-        results["micro_moment"] = {"error": str(e)}
-    
-    return JSONResponse(content=results)
\ No newline at end of file
+    return JSONResponse(content=results)
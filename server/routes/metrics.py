@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from auth_middleware import get_admin_user, get_current_user
+from llm_usage import usage_tracker
+from receipt_jobs import receipt_job_queue
+
+# Remove prefix since it's added in main.py
+router = APIRouter(tags=["metrics"])
+
+@router.get("/llm")
+async def get_llm_metrics(
+    top_users: int = Query(20, ge=1, le=200, description="Number of heaviest users today to include"),
+    admin: dict = Depends(get_admin_user)
+):
+    """LLM calls, tokens, latency, cost and cache hits aggregated per route, model and user (admins only)"""
+    try:
+        return {"success": True, "metrics": usage_tracker.snapshot(top_users=top_users)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading LLM metrics: {str(e)}")
+
+@router.get("/llm/user")
+async def get_user_llm_usage(
+    user: dict = Depends(get_current_user)
+):
+    """The signed-in user's LLM usage per day and remaining daily token quota"""
+    try:
+        return {"success": True, "usage": usage_tracker.user_usage(user['uid'])}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading LLM usage: {str(e)}")
+
+@router.get("/receipts")
+async def get_receipt_queue_metrics():
+    """Receipt processing queue depth, running jobs and average job time"""
+    return {"success": True, "metrics": receipt_job_queue.stats()}
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Query
+import time
+
+from receipt_index import receipt_index
+
+# Remove prefix since it's added in main.py
+router = APIRouter(tags=["receipts"])
+
+@router.get("/search")
+async def search_receipts(
+    user_id: str = Query(..., description="User ID"),
+    q: str = Query(..., min_length=1, description="Store, item, brand or category to search for"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of receipts to return"),
+    fuzzy: bool = Query(True, description="Allow approximate matches for misspelled terms")
+):
+    """Search a user's purchase history by store, item name, brand or category"""
+    try:
+        started = time.perf_counter()
+        results = receipt_index.search(user_id, q, limit=limit, fuzzy=fuzzy)
+        return {
+            "success": True,
+            "query": q,
+            "count": len(results),
+            "results": results,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching receipts: {str(e)}")
@@ -4,7 +4,7 @@ from typing import Dict, Any, Optional
 import logging
 
 from auth_middleware import get_current_user
-from wallet_tool import WalletTool
+from agent_registry import get_wallet_tool
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -12,8 +12,7 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize wallet tool globally
-wallet_tool = WalletTool()
+# The wallet tool is shared through the agent registry and built on first use
 
 class ReceiptPassRequest(BaseModel):
     merchant_name: str
@@ -44,7 +43,7 @@ class WalletPassResponse(BaseModel):
 async def get_wallet_status():
     """Get the status of the Google Wallet integration."""
     try:
-        is_ready = wallet_tool.is_ready()
+        is_ready = get_wallet_tool().is_ready()
         return {
             "status": "ready" if is_ready else "not_configured",
             "message": "Google Wallet API is ready" if is_ready else "Google Wallet API not configured"
@@ -72,7 +71,7 @@ async def create_receipt_pass(
         }
         
         # Create the pass
-        result = wallet_tool.create_receipt_pass(receipt_data)
+        result = get_wallet_tool().create_receipt_pass(receipt_data)
         
         logger.info(f"Receipt pass creation result: {result}")
         
@@ -92,7 +91,7 @@ async def create_custom_pass(
         logger.info(f"Creating custom pass for user {user['uid']}")
         
         # Create the pass
-        result = wallet_tool.create_custom_pass(
+        result = get_wallet_tool().create_custom_pass(
             title=request.title,
             header=request.header,
             description=request.description,
@@ -125,7 +124,7 @@ async def create_test_pass(user: dict = Depends(get_current_user)):
             "hero_image_url": "https://via.placeholder.com/800x400/4285f4/ffffff?text=Test+Receipt"
         }
         
-        result = wallet_tool.create_receipt_pass(test_receipt)
+        result = get_wallet_tool().create_receipt_pass(test_receipt)
         
         if result['success']:
             return {